@@ -1,54 +1,281 @@
 ## mf4_analyzer.py
 import os
-import numpy as np
-from mf4_analyzer_modular.mdf_loader import load_latest_mdf
-from mf4_analyzer_modular.signal_extractor import extract_signals, detect_mode
-from mf4_analyzer_modular.compute_metrics import compute_discharge_metrics, compute_charging_metrics, compute_rms_power
-from mf4_analyzer_modular.summary_generator import generate_summary
-from mf4_analyzer_modular.plotter_exporter import export_group_plots
-from mf4_analyzer_modular.pdf_exporter import export_pdf, export_csv
+import time
+import argparse
+from mf4_analyzer_modular.input_sources import list_sources, source_name, is_remote
+from mf4_analyzer_modular.file_pipeline import analyze_file, export_results, instrumented
+from mf4_analyzer_modular.instrumentation import PROFILERS
+from mf4_analyzer_modular.batch_runner import run_batch, export_manifest
+from mf4_analyzer_modular.staged_pipeline import STAGE_QUEUE_DEPTH, STAGE_EXPORT_WORKERS
+from mf4_analyzer_modular.resampling import TIMEBASE_MODES
+from mf4_analyzer_modular.decimation import DECIMATION_METHODS
+from mf4_analyzer_modular.plotter_exporter import PLOT_MAX_POINTS
+from mf4_analyzer_modular.kpi_store import query_kpi, list_kpis, KPI_FIELDS
+from mf4_analyzer_modular.log_watcher import watch, SETTLE_SECONDS, POLL_SECONDS
+from mf4_analyzer_modular.comparison import compare_logs, COMPARE_AXES
+from mf4_analyzer_modular.block_index import EVENT_RULES, query_events, list_indexed, export_fleet_events
+from mf4_analyzer_modular.threshold_sweep import (
+    sweep_logs, fleet_table, print_fleet_table, export_sweep_csv, render_heatmaps, parse_grid
+)
+from mf4_analyzer_modular.benchmark import (
+    run_benchmark, load_results, compare_results, print_results,
+    BENCH_DIR, BENCH_SIZES_MB, BENCH_RATES_HZ, BENCH_LAYOUTS, BENCH_TOLERANCE
+)
 
 # === Paths ===
 INPUT_DIR = "./mf4_logfiles"
 EXPORT_DIR = "./mf4_exports"
 os.makedirs(EXPORT_DIR, exist_ok=True)
 
-def main():
-    # Load latest MDF file
-    mdf, fname = load_latest_mdf("./mf4_logfiles")
-    base_name = os.path.splitext(fname)[0]
+# === CLI ===
+def build_parser():
+    parser = argparse.ArgumentParser(description="MF4 log analyzer")
+    parser.add_argument("--input-dir", default=INPUT_DIR,
+                        help="directory, .zip bundle or s3://bucket/prefix with .mf4/.dat logs (also .gz/.zst)")
+    parser.add_argument("--no-cache", action="store_true", help="always decode the MF4, bypass the signal cache")
+    parser.add_argument("--timebase", choices=TIMEBASE_MODES, default="native",
+                        help="resample raw signals onto one shared grid before deriving signals")
+    parser.add_argument("--rate", type=float, default=None, help="grid rate in Hz for --timebase fixed")
+    parser.add_argument("--master", default=None, help="master signal for --timebase master (default: most samples)")
+    parser.add_argument("--streaming", action="store_true",
+                        help="chunked bounded-memory KPIs for logs larger than RAM (no plots)")
+    parser.add_argument("--float32", action="store_true",
+                        help="decode float samples to float32 (about half the peak RAM for large logs)")
+    parser.add_argument("--plot-points", type=int, default=PLOT_MAX_POINTS,
+                        help="decimate each plot trace to about N points (0 = plot every sample)")
+    parser.add_argument("--decimation", choices=DECIMATION_METHODS, default="minmax",
+                        help="plot decimation method")
+    parser.add_argument("--plot-workers", type=int, default=1,
+                        help="render metric groups in parallel on N processes")
+    parser.add_argument("--save-png", action="store_true",
+                        help="also write plot PNGs (the PDF embeds plots from memory)")
+    parser.add_argument("--no-store", action="store_true", help="do not append KPIs to the fleet KPI store")
+    parser.add_argument("--no-index", action="store_true",
+                        help="do not store per-window signal stats in the block index")
+    parser.add_argument("--no-plots", action="store_true", help="skip plot rendering (PDF without plots)")
+    parser.add_argument("--no-pdf", action="store_true", help="skip the PDF report")
+    parser.add_argument("--csv-only", action="store_true",
+                        help="KPI CSV (and KPI store) only: no plots, no PDF, matplotlib/fpdf never imported")
+    parser.add_argument("--instrument", action="store_true",
+                        help="record per-stage/per-signal timings, counters and memory to mf4_exports/instrumentation.jsonl")
+    parser.add_argument("--profile", choices=PROFILERS, default=None,
+                        help="also run cProfile or tracemalloc per file (implies --instrument)")
+    parser.add_argument("--pdf-appendix", action="store_true",
+                        help="add the instrumentation page to the PDF report (implies --instrument)")
+    sub = parser.add_subparsers(dest="command")
 
-    # Extract signal data
-    data, metric_map, derived = extract_signals(mdf)
+    sub.add_parser("latest", help="process the newest log only (default)")
 
-    # Detect mode and normalize labels
-    mode_raw = detect_mode(derived.get("StateOfCharge", {}).get("samples", np.array([])))
-    mode = {"Charge": "Charging", "Discharge": "Discharging"}.get(mode_raw, mode_raw)
-    derived["Mode"] = mode
-    print(f"[i] Mode: {mode}")
+    p_batch = sub.add_parser("batch", help="process every log in the input directory")
+    p_batch.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    p_batch.add_argument("--staged", action="store_true",
+                         help="overlap each file's CSV/plot/PDF export with extracting the next file")
+    p_batch.add_argument("--queue-depth", type=int, default=STAGE_QUEUE_DEPTH,
+                         help="analyzed files waiting for export per worker (--staged)")
+    p_batch.add_argument("--export-workers", type=int, default=STAGE_EXPORT_WORKERS,
+                         help="export (CSV/plot/PDF) processes per worker (--staged)")
 
+    p_watch = sub.add_parser("watch", help="process new logs as they arrive in the input directory")
+    p_watch.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    p_watch.add_argument("--max-pending", type=int, default=None, help="max files queued/in flight (default: 2x workers)")
+    p_watch.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                         help="seconds without modification before a file counts as complete")
+    p_watch.add_argument("--poll", type=float, default=POLL_SECONDS, help="poll interval without inotify")
+    p_watch.add_argument("--once", action="store_true", help="catch up with the backlog, then exit")
 
-    # Compute metrics and append
-    # Always-safe metrics
-    data.extend(compute_rms_power(derived))
+    p_query = sub.add_parser("query", help="fleet-wide KPI distribution from the KPI store")
+    p_query.add_argument("name", nargs="?", help="KPI/signal name, e.g. 'Charging Time' (omit to list)")
+    p_query.add_argument("--mode", default=None, help="only logs in this mode, e.g. Charging")
+    p_query.add_argument("--field", choices=KPI_FIELDS, default="value",
+                         help="value for computed KPIs, min/max/delta for signals")
 
-    # Mode-specific metrics (optional; you can also let functions self-gate)
-    if mode == "Charging":
-        data.extend(compute_charging_metrics(derived))
-    elif mode == "Discharging":
-        data.extend(compute_discharge_metrics(derived))
+    p_events = sub.add_parser("events", help="fleet-wide signal events from the block index (no decoding)")
+    p_events.add_argument("signal", nargs="?",
+                          help="SIGNAL_LIST name, e.g. 'Delta Cell Voltage' (omit: the built-in event rules)")
+    p_events.add_argument("--gt", type=float, default=None, help="windows whose max is above this value")
+    p_events.add_argument("--lt", type=float, default=None, help="windows whose min is below this value")
+    p_events.add_argument("--mode", default=None, help="only logs in this mode, e.g. Charging")
+    p_events.add_argument("--list", action="store_true", help="list the indexed signals")
+    p_events.add_argument("--out", default=None, help="also write the events to this CSV")
 
-    # Summary
-    summary = generate_summary(data, derived)
+    p_compare = sub.add_parser("compare", help="one comparison report (overlays + KPI table) for many logs")
+    p_compare.add_argument("files", nargs="*", help="logs to compare (default: every log in the input directory)")
+    p_compare.add_argument("--axis", choices=COMPARE_AXES, default="time",
+                           help="overlay x axis: time since log start or StateOfCharge")
+    p_compare.add_argument("--workers", type=int, default=None, help="extraction processes (default: CPU count)")
+    p_compare.add_argument("--name", default="comparison", help="output name prefix in mf4_exports/")
 
-    # Export
-    export_csv(data, base_name)
-    export_group_plots(metric_map, base_name)
-    export_pdf(data, summary, fname, metric_map)
+    p_sweep = sub.add_parser("sweep", help="charge/discharge KPIs over a grid of thresholds, fleet-wide")
+    p_sweep.add_argument("files", nargs="*", help="logs to sweep (default: every log in the input directory)")
+    p_sweep.add_argument("--charge-kw", default=None,
+                         help="charge power thresholds, 'start:stop:num' or 'v1,v2,...' (default: -50:0:21)")
+    p_sweep.add_argument("--discharge-kw", default=None,
+                         help="discharge power thresholds (default: 0:50:21)")
+    p_sweep.add_argument("--dsoc", default=None, help="SoC derivative thresholds (default: 1e-5 ... 1e-1)")
+    p_sweep.add_argument("--workers", type=int, default=None, help="extraction processes (default: CPU count)")
+    p_sweep.add_argument("--name", default="sweep", help="output name prefix in mf4_exports/")
 
-    print(f"[✓] Processed: {fname} → Output in: ./mf4_exports")
+    p_bench = sub.add_parser("bench", help="benchmark every pipeline stage on synthetic MF4 logs")
+    p_bench.add_argument("--sizes", default=",".join(f"{s:g}" for s in BENCH_SIZES_MB),
+                         help="comma-separated log sizes in MB (e.g. 1,100,1024,5120)")
+    p_bench.add_argument("--rates", default=",".join(f"{r:g}" for r in BENCH_RATES_HZ),
+                         help="comma-separated sample rates in Hz")
+    p_bench.add_argument("--layouts", default=",".join(BENCH_LAYOUTS),
+                         help="comma-separated channel-group layouts: " + ", ".join(BENCH_LAYOUTS))
+    p_bench.add_argument("--repeat", type=int, default=1, help="runs per case, the fastest is kept")
+    p_bench.add_argument("--work-dir", default=os.path.join(BENCH_DIR, "work"),
+                         help="synthetic logs and benchmark reports go here")
+    p_bench.add_argument("--out", default=None, help="result JSON (default: timestamped in " + BENCH_DIR + ")")
+    p_bench.add_argument("--baseline", default=None, help="result JSON to compare against")
+    p_bench.add_argument("--tolerance", type=float, default=BENCH_TOLERANCE,
+                         help="allowed slowdown vs. the baseline (0.2 = 20 %%)")
+
+    return parser
+
+
+def pipeline_options(args):
+    return {
+        "use_cache": not args.no_cache,
+        "timebase": args.timebase,
+        "rate_hz": args.rate,
+        "master": args.master,
+        "streaming": args.streaming,
+        "plot_points": args.plot_points,
+        "decimation": args.decimation,
+        "plot_workers": args.plot_workers,
+        "save_png": args.save_png,
+        "kpi_store": not args.no_store,
+        "instrument": args.instrument,
+        "profile": args.profile,
+        "pdf_appendix": args.pdf_appendix,
+        "plots": not (args.no_plots or args.csv_only),
+        "pdf": not (args.no_pdf or args.csv_only),
+        "block_index": not args.no_index,
+        "float32": args.float32,
+    }
+
+
+def run_latest(input_dir, options):
+    # Load latest MDF file (falls back to older ones if it cannot be read)
+    for path in list_sources(input_dir):
+        fname = source_name(path)
+        with instrumented(path, options):
+            try:
+                result = analyze_file(path, options)
+            except Exception as e:
+                print(f"[WARN] Failed to load {fname}: {e}")
+                continue
+            export_results(result, options)
+        print(f"[✓] Processed: {fname} → Output in: {EXPORT_DIR}")
+        return
+    raise FileNotFoundError("No valid MDF (.mf4/.dat) file found.")
+
+
+def run_query(args):
+    if not args.name:
+        for name, mode, unit, logs in list_kpis():
+            print(f"{name:<30} {mode or '-':<12} {unit or '':<6} {logs} log(s)")
+        return
+    result = query_kpi(args.name, mode=args.mode, field=args.field)
+    for key, value in result.items():
+        print(f"{key:<6}: {value}")
+
+
+def run_events(args):
+    if args.list:
+        for signal, unit, logs, blocks in list_indexed():
+            print(f"{signal:<30} {unit or '':<6} {logs} log(s), {blocks} window(s)")
+        return
+    if args.signal:
+        if (args.gt is None) == (args.lt is None):
+            raise SystemExit("[ERROR] events SIGNAL needs exactly one of --gt / --lt")
+        rules = [(None, args.signal, ">" if args.gt is not None else "<",
+                  args.gt if args.gt is not None else args.lt)]
+    else:
+        rules = EVENT_RULES
+
+    events = []
+    for rule, signal, op, limit in rules:
+        events += query_events(signal, op, limit, mode=args.mode, rule=rule)
+    for e in events:
+        print(f"{e['file_key']:<24} {e['rule']:<26} {e['start_s']:>10} - {e['end_s']:<10} "
+              f"peak {e['peak']:g} {e['unit']}")
+    logs = len({e["source"] for e in events})
+    print(f"[✓] {len(events)} event(s) in {logs} log(s)" + (f" → {export_fleet_events(events, args.out)}"
+                                                             if args.out else ""))
 
-if __name__ == "__main__":
-    main() 
 
- 
\ No newline at end of file
+def run_compare(args, options):
+    paths = args.files or list_sources(args.input_dir)
+    if not paths:
+        raise FileNotFoundError("No valid MDF (.mf4/.dat) file found.")
+    pdf_path, csv_path = compare_logs(paths, axis=args.axis, workers=args.workers, name=args.name, options=options)
+    print(f"[✓] Comparison of {len(paths)} file(s) → {pdf_path}, {csv_path}")
+
+
+def run_sweep(args, options):
+    paths = args.files or list_sources(args.input_dir)
+    if not paths:
+        raise FileNotFoundError("No valid MDF (.mf4/.dat) file found.")
+    grids = {key: parse_grid(spec) for key, spec in
+             (("charge_kw", args.charge_kw), ("discharge_kw", args.discharge_kw), ("dsoc", args.dsoc)) if spec}
+    logs = sweep_logs(paths, grids, workers=args.workers, options=options)
+    print_fleet_table(fleet_table(logs, grids))
+    outputs = list(export_sweep_csv(logs, grids, args.name))
+    if options["plots"]:
+        outputs += render_heatmaps(logs, grids, args.name)
+    print(f"\n[✓] Threshold sweep of {len(logs)} file(s) → {', '.join(outputs)}")
+
+
+def run_bench(args):
+    out = args.out or os.path.join(BENCH_DIR, time.strftime("bench_%Y%m%d_%H%M%S.json"))
+    results = run_benchmark(sizes_mb=[float(s) for s in args.sizes.split(",")],
+                            rates_hz=[float(r) for r in args.rates.split(",")],
+                            layouts=args.layouts.split(","), work_dir=args.work_dir,
+                            repeat=args.repeat, out_path=out)
+    print_results(results)
+    print(f"[✓] Benchmark results → {out}")
+    if not args.baseline:
+        return True
+
+    regressions = compare_results(results, load_results(args.baseline), args.tolerance)
+    for r in regressions:
+        print(f"[WARN] Regression {r['case']} / {r['stage']}: {r['field']} "
+              f"{r['baseline']} → {r['current']} (x{r['ratio']})")
+    if not regressions:
+        print(f"[✓] No regressions vs. {args.baseline} (tolerance {args.tolerance:.0%})")
+    return not regressions
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    options = pipeline_options(args)
+
+    if args.command == "batch":
+        manifest = run_batch(args.input_dir, workers=args.workers, options=options,
+                             staged=args.staged, queue_depth=args.queue_depth,
+                             export_workers=args.export_workers)
+        failed = sum(row["status"] != "ok" for row in manifest)
+        path = export_manifest(manifest)
+        print(f"[✓] Batch done: {len(manifest) - failed} ok, {failed} failed → Manifest: {path}")
+    elif args.command == "watch":
+        if is_remote(args.input_dir) or not os.path.isdir(args.input_dir):
+            raise SystemExit(f"[ERROR] watch needs a local directory: {args.input_dir}")
+        watch(args.input_dir, workers=args.workers, options=options, max_pending=args.max_pending,
+              settle_seconds=args.settle, poll_seconds=args.poll, once=args.once)
+    elif args.command == "query":
+        run_query(args)
+    elif args.command == "events":
+        run_events(args)
+    elif args.command == "compare":
+        run_compare(args, options)
+    elif args.command == "sweep":
+        run_sweep(args, options)
+    elif args.command == "bench":
+        if not run_bench(args):
+            raise SystemExit(1)
+    else:
+        run_latest(args.input_dir, options)
+
+if __name__ == "__main__":
+    main()
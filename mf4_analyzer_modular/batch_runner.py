@@ -0,0 +1,137 @@
+# # mf4_analyzer_modular/batch_runner.py
+import os
+import csv
+import time
+import queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from mf4_analyzer_modular.input_sources import list_sources, source_name
+from mf4_analyzer_modular.file_pipeline import process_file, _options
+from mf4_analyzer_modular.staged_pipeline import (
+    run_staged, staged_worker, print_row, STAGE_QUEUE_DEPTH, STAGE_EXPORT_WORKERS
+)
+
+MANIFEST_FIELDS = ["file", "status", "mode", "elapsed_s", "error"]
+
+
+# === Worker entry point ===
+# Runs in a child process; returns only a small manifest row so the large
+# signal arrays never have to be pickled back to the parent.
+# fingerprint: see file_pipeline.load_signals (the watcher passes its hash)
+def process_and_report(path: str, options: dict | None = None, fingerprint: dict | None = None) -> dict:
+    start = time.perf_counter()
+    row = {"file": source_name(path), "status": "ok", "mode": "", "error": ""}
+    try:
+        result = process_file(path, options, fingerprint)
+        row["mode"] = result["mode"]
+    except Exception as e:
+        row["status"] = "failed"
+        row["error"] = f"{type(e).__name__}: {e}"
+    row["elapsed_s"] = round(time.perf_counter() - start, 2)
+    return row
+
+
+# === Batch processing ===
+# Processes every log in `directory` (local directory, .zip bundle or
+# s3://bucket/prefix, see input_sources.list_sources) on a pool of worker
+# processes.
+# staged=True: every worker overlaps exporting one log (in `export_workers`
+# export processes of its own) with extracting the next (see
+# staged_pipeline.py), pulling files from a shared queue.
+# Returns: manifest rows (one per file, in directory listing order)
+def run_batch(directory: str, workers: int | None = None, options: dict | None = None,
+              staged: bool = False, queue_depth: int = STAGE_QUEUE_DEPTH,
+              export_workers: int = STAGE_EXPORT_WORKERS) -> list[dict]:
+    paths = list_sources(directory)
+    if not paths:
+        raise FileNotFoundError("No valid MDF (.mf4/.dat) file found.")
+
+    workers = workers or os.cpu_count() or 1
+    opts = _options(options)
+    if staged and opts["profile"]:
+        print(f"[WARN] --profile {opts['profile']} attaches to one thread/process, but --staged splits every "
+              f"file across an extract thread and an export process; running unstaged")
+        staged = False
+    if staged:
+        return _run_staged_batch(paths, min(workers, len(paths)), options, queue_depth, export_workers)
+    print(f"[i] Batch: {len(paths)} file(s) on {workers} worker(s)")
+
+    rows = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_and_report, p, options): p for p in paths}
+        for fut in as_completed(futures):
+            path = futures[fut]
+            try:
+                row = fut.result()
+            except Exception as e:  # worker crashed (e.g. killed by OOM)
+                row = {"file": source_name(path), "status": "failed", "mode": "",
+                       "elapsed_s": "", "error": f"{type(e).__name__}: {e}"}
+            rows[path] = row
+            mark = "✓" if row["status"] == "ok" else "ERROR"
+            print(f"[{mark}] {row['file']} ({row['elapsed_s']} s) {row['error']}".rstrip())
+
+    return [rows[p] for p in paths]
+
+
+# Workers pull files one at a time from a shared queue (a slow file only
+# delays the worker that has it) and run them through their own staged
+# pipeline; the parent prints results in input order as soon as every
+# earlier file is done.
+def _run_staged_batch(paths: list[str], workers: int, options: dict | None, queue_depth: int,
+                      export_workers: int) -> list[dict]:
+    print(f"[i] Batch: {len(paths)} file(s) on {workers} staged worker(s), queue depth {queue_depth}, "
+          f"{export_workers} export process(es) each")
+    if workers == 1:
+        return run_staged(paths, options, queue_depth, export_workers=export_workers)
+
+    rows = {}
+    reported = 0
+
+    def report():
+        nonlocal reported
+        while reported in rows:
+            print_row(rows[reported])
+            reported += 1
+
+    with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=workers) as pool:
+        todo, done = manager.Queue(), manager.Queue()
+        for item in enumerate(paths):
+            todo.put(item)
+        for _ in range(workers):
+            todo.put(None)
+        futures = [pool.submit(staged_worker, todo, done, options, queue_depth, export_workers) for _ in range(workers)]
+
+        while len(rows) < len(paths):
+            try:
+                index, row = done.get(timeout=1.0)
+            except queue.Empty:
+                if all(f.done() for f in futures):
+                    break
+                continue
+            rows[index] = row
+            report()
+        while True:  # rows put just before the last worker returned
+            try:
+                index, row = done.get_nowait()
+            except queue.Empty:
+                break
+            rows[index] = row
+
+        # files of a crashed worker (e.g. killed by OOM) or never started
+        crash = next((f.exception() for f in futures if f.exception() is not None), None)
+        error = f"{type(crash).__name__}: {crash}" if crash else "worker exited"
+        for i, path in enumerate(paths):
+            rows.setdefault(i, {"file": source_name(path), "status": "failed", "mode": "",
+                                "elapsed_s": "", "error": error})
+        report()
+    return [rows[i] for i in range(len(paths))]
+
+
+# === Manifest Export ===
+def export_manifest(manifest: list[dict], path: str = os.path.join("mf4_exports", "batch_manifest.csv")):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+        w.writeheader()
+        w.writerows(manifest)
+    return path
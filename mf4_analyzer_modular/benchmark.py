@@ -0,0 +1,265 @@
+# # mf4_analyzer_modular/benchmark.py
+import os
+import json
+import time
+import platform
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from mf4_analyzer_modular.signal_config import SIGNAL_CONFIG
+from mf4_analyzer_modular.mdf_loader import load_mdf
+from mf4_analyzer_modular.signal_extractor import load_raw_signals, evaluate_signals, detect_mode, required_signals
+from mf4_analyzer_modular.metric_registry import MetricContext
+from mf4_analyzer_modular.summary_generator import summary_from_context
+from mf4_analyzer_modular.plotter_exporter import render_group_plots
+from mf4_analyzer_modular.pdf_exporter import export_pdf, export_csv
+from mf4_analyzer_modular.instrumentation import peak_rss_mb
+
+# === Benchmark Suite ===
+# Generates synthetic MF4 logs with the channels of SIGNAL_CONFIG and times
+# every pipeline stage separately:
+#     load -> extract -> compute_metrics -> plotting -> pdf -> csv
+# Each case runs in a fresh process (peak RSS is per case, no warm caches)
+# with the working directory set to `work_dir`, so reports never land in the
+# real mf4_exports/. Per stage the result holds wall time, the process peak
+# RSS at the end of the stage and throughput in raw samples/s.
+#
+# Cases are the product of sizes x sample rates x channel-group layouts:
+#   "single"      - all channels in one group
+#   "split"       - fast pack signals at the rate, cell temps/voltages at half
+#   "per_channel" - one group per channel (worst case for group seeking)
+# Generated files are kept in <work_dir>/synthetic/ and reused by later runs.
+#
+# Results are stored as JSON; compare_results() flags any stage that got
+# slower (or bigger) than a baseline result file by more than `tolerance`.
+
+BENCH_DIR = os.path.join("mf4_exports", "benchmarks")
+BENCH_SIZES_MB = (1, 10, 100)         # up to 5120 (5 GB) via --sizes
+BENCH_RATES_HZ = (10.0,)
+BENCH_LAYOUTS = ("single", "split", "per_channel")
+BENCH_STAGES = ("load", "extract", "compute_metrics", "plotting", "pdf", "csv")
+BENCH_TOLERANCE = 0.20                # allowed slowdown vs. baseline (20 %)
+BENCH_MIN_DELTA_S = 0.05              # ignore timing noise below this
+GEN_CHUNK_SAMPLES = 1_000_000         # samples per channel written per extend()
+
+# --- Synthetic channel groups (tokens of SIGNAL_CONFIG) ---
+FAST_TOKENS = ("PackCurrent", "PackVoltage", "StateOfCharge", "CellSocMin", "CellSocMax",
+               "ChargeCurrentLimit", "ChargePowerLimit", "DischargePowerLimit", "SystemFaultIndicator")
+SLOW_TOKENS = ("CellTempMax", "CellTempMin", "CoolantInletTemp", "CellVoltageMax", "CellVoltageMin")
+UNITS = {"PackCurrent": "A", "PackVoltage": "V", "StateOfCharge": "%", "CellSocMin": "%",
+         "CellSocMax": "%", "ChargeCurrentLimit": "A", "ChargePowerLimit": "kW",
+         "DischargePowerLimit": "kW", "SystemFaultIndicator": "", "CellTempMax": "degC",
+         "CellTempMin": "degC", "CoolantInletTemp": "degC", "CellVoltageMax": "V", "CellVoltageMin": "V"}
+
+
+# === Synthetic signal profile ===
+# Continuous across chunks: SoC ramps over the whole log duration.
+def _profile(token: str, t: np.ndarray, duration: float, charging: bool, rng) -> np.ndarray:
+    n = t.size
+    frac = t / duration
+    soc = 20 + 60 * frac if charging else 80 - 60 * frac
+    if token == "StateOfCharge":
+        return soc + rng.normal(0, 0.01, n)
+    if token == "CellSocMin":
+        return soc - 1
+    if token == "CellSocMax":
+        return soc + 1
+    if token == "PackCurrent":
+        return (-150.0 if charging else 100.0) + rng.normal(0, 5, n)
+    if token == "PackVoltage":
+        return 400 + rng.normal(0, 1, n)
+    if token == "SystemFaultIndicator":
+        return (rng.random(n) > 0.999).astype(np.uint8)
+    constant = {"ChargeCurrentLimit": 200.0, "ChargePowerLimit": 100.0, "DischargePowerLimit": 150.0}
+    if token in constant:
+        return np.full(n, constant[token])
+    base = {"CellTempMax": (30, 0.5), "CellTempMin": (25, 0.5), "CoolantInletTemp": (20, 0.5),
+            "CellVoltageMax": (3.9, 0.002), "CellVoltageMin": (3.85, 0.002)}[token]
+    return base[0] + rng.normal(0, base[1], n)
+
+
+# Returns: [(tokens, rate factor, time offset)] per channel group
+def _layout_groups(layout: str) -> list[tuple]:
+    if layout == "single":
+        return [(FAST_TOKENS + SLOW_TOKENS, 1.0, 0.0)]
+    if layout == "split":
+        return [(FAST_TOKENS, 1.0, 0.0), (SLOW_TOKENS, 0.5, 0.05)]
+    if layout == "per_channel":
+        return [((token,), 1.0, 0.0) for token in FAST_TOKENS + SLOW_TOKENS]
+    raise ValueError(f"Unsupported layout: {layout} (use one of {', '.join(BENCH_LAYOUTS)})")
+
+
+# === Synthetic MF4 generator ===
+# The sample count is chosen so the data blocks add up to about `size_mb`.
+# Samples are written in chunks of GEN_CHUNK_SAMPLES, so multi-GB logs do not
+# have to fit in memory.
+def generate_synthetic_mf4(path: str, size_mb: float, rate_hz: float = 10.0,
+                           layout: str = "split", charging: bool = True, seed: int = 0) -> str:
+    from asammdf import MDF, Signal
+    groups = _layout_groups(layout)
+    bytes_per_fast_sample = sum(
+        factor * (8 + sum(1 if t == "SystemFaultIndicator" else 8 for t in tokens))
+        for tokens, factor, _ in groups
+    )
+    n = max(100, int(size_mb * 1024 * 1024 / bytes_per_fast_sample))
+    duration = n / rate_hz
+    rng = np.random.default_rng(seed)
+
+    mdf = MDF(version="4.10")
+    for index, (tokens, factor, offset) in enumerate(groups):
+        n_group = max(2, int(n * factor))
+        dt = 1.0 / (rate_hz * factor)
+        for start in range(0, n_group, GEN_CHUNK_SAMPLES):
+            t = (np.arange(start, min(start + GEN_CHUNK_SAMPLES, n_group)) * dt + offset)
+            samples = [_profile(token, t, duration, charging, rng) for token in tokens]
+            if start == 0:
+                mdf.append([Signal(s, t, name=SIGNAL_CONFIG[token], unit=UNITS[token])
+                            for token, s in zip(tokens, samples)])
+            else:
+                mdf.extend(index, [(t, None)] + [(s, None) for s in samples])
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    mdf.save(path, overwrite=True)
+    mdf.close()
+    return path
+
+
+# === Measurement helpers ===
+class _StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, stage: str, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.stages[stage] = {"wall_s": round(time.perf_counter() - start, 4), "peak_rss_mb": peak_rss_mb()}
+        return result
+
+
+# === One benchmark case (runs in a fresh worker process) ===
+def _run_case(path: str, work_dir: str) -> dict:
+    os.chdir(work_dir)
+    os.makedirs("mf4_exports", exist_ok=True)
+    fname = os.path.basename(path)
+    base_name = os.path.splitext(fname)[0]
+    tokens = required_signals()
+    timer = _StageTimer()
+
+    def compute(data, derived):
+        mode_raw = detect_mode(derived.get("StateOfCharge", {}).get("samples", np.array([])))
+        mode = {"Charge": "Charging", "Discharge": "Discharging"}.get(mode_raw, mode_raw)
+        derived["Mode"] = mode
+        ctx = MetricContext(data, derived, mode)
+        data.extend(ctx.kpis())
+        return summary_from_context(ctx)
+
+    def extract(mdf):
+        signal_data = load_raw_signals(mdf, tokens)
+        return signal_data, evaluate_signals(signal_data)
+
+    mdf = timer.run("load", load_mdf, path, [SIGNAL_CONFIG[t] for t in tokens])
+    signal_data, (data, metric_map, derived) = timer.run("extract", extract, mdf)
+    summary = timer.run("compute_metrics", compute, data, derived)
+    images = timer.run("plotting", render_group_plots, metric_map, base_name)
+    timer.run("pdf", export_pdf, data, summary, fname, metric_map, images)
+    timer.run("csv", export_csv, data, base_name)
+    mdf.close()
+
+    samples = int(sum(len(sig["samples"]) for sig in signal_data.values()))
+    for stats in timer.stages.values():
+        stats["samples_per_s"] = round(samples / stats["wall_s"]) if stats["wall_s"] > 0 else None
+    return {
+        "samples": samples,
+        "mode": derived["Mode"],
+        "stages": timer.stages,
+        "total_s": round(sum(s["wall_s"] for s in timer.stages.values()), 4),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# === Benchmark run ===
+# Returns: result dict (also written as JSON to `out_path` if given)
+def run_benchmark(sizes_mb=BENCH_SIZES_MB, rates_hz=BENCH_RATES_HZ, layouts=BENCH_LAYOUTS,
+                  work_dir: str = os.path.join(BENCH_DIR, "work"), repeat: int = 1,
+                  out_path: str | None = None) -> dict:
+    import asammdf
+    work_dir = os.path.abspath(work_dir)
+    results = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "asammdf": asammdf.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "cases": [],
+    }
+
+    ctx = multiprocessing.get_context("spawn")
+    for size_mb in sizes_mb:
+        for rate_hz in rates_hz:
+            for layout in layouts:
+                case = f"{size_mb:g}mb_{rate_hz:g}hz_{layout}"
+                path = os.path.join(work_dir, "synthetic", f"{case}.mf4")
+                if not os.path.exists(path):
+                    print(f"[i] Generating {case}.mf4")
+                    generate_synthetic_mf4(path, size_mb, rate_hz, layout)
+
+                # best of `repeat` fresh-process runs (lowest total time)
+                runs = []
+                for _ in range(max(1, repeat)):
+                    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+                        runs.append(pool.submit(_run_case, path, work_dir).result())
+                best = min(runs, key=lambda r: r["total_s"])
+                best.update({"case": case, "size_mb": size_mb, "rate_hz": rate_hz,
+                             "layout": layout, "file_bytes": os.path.getsize(path)})
+                results["cases"].append(best)
+                print(f"[✓] {case}: {best['total_s']:.2f} s, {best['samples']} samples, "
+                      f"peak {best['peak_rss_mb']} MB")
+
+    if out_path:
+        os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+def load_results(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+# === Regression check ===
+# Returns: [{case, stage, field, baseline, current, ratio}] for every stage
+#          whose wall time (or case whose peak RSS) exceeds the baseline by
+#          more than `tolerance`.
+#          Cases missing from either side are ignored.
+def compare_results(current: dict, baseline: dict, tolerance: float = BENCH_TOLERANCE) -> list[dict]:
+    base_cases = {c["case"]: c for c in baseline.get("cases", [])}
+    regressions = []
+    for case in current.get("cases", []):
+        base = base_cases.get(case["case"])
+        if base is None:
+            continue
+        checks = [(stage, "wall_s", base["stages"].get(stage, {}).get("wall_s"), stats["wall_s"], BENCH_MIN_DELTA_S)
+                  for stage, stats in case["stages"].items()]
+        checks.append(("total", "peak_rss_mb", base.get("peak_rss_mb"), case.get("peak_rss_mb"), 0.0))
+        for stage, field, old, new, floor in checks:
+            if not old or new is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > floor:
+                regressions.append({"case": case["case"], "stage": stage, "field": field,
+                                    "baseline": old, "current": new, "ratio": round(new / old, 2)})
+    return regressions
+
+
+# === Console table ===
+def print_results(results: dict):
+    print(f"{'case':<28} {'stage':<16} {'wall_s':>9} {'peak_MB':>9} {'samples/s':>13}")
+    for case in results["cases"]:
+        for stage in BENCH_STAGES:
+            stats = case["stages"].get(stage)
+            if stats:
+                print(f"{case['case']:<28} {stage:<16} {stats['wall_s']:>9.3f} "
+                      f"{stats['peak_rss_mb'] or 0:>9.1f} {stats['samples_per_s'] or 0:>13,}")
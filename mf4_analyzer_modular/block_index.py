@@ -0,0 +1,246 @@
+# # mf4_analyzer_modular/block_index.py
+import os
+import csv
+import time
+import sqlite3
+from itertools import groupby
+import numpy as np
+from mf4_analyzer_modular.signal_cache import CACHE_DIR
+
+# === Block Statistics Index ===
+# Per log, every SIGNAL_LIST signal is cut into fixed BLOCK_WINDOW_S time
+# windows (aligned to the log start, shared by all signals) and each window
+# keeps min / max / mean / sample count. Built from the signals already in
+# memory during the normal run (one np.*.reduceat pass per signal) and
+# stored in one SQLite file next to the signal cache:
+#
+#     blocks(source, file_key, mode, signal, unit, block, t_start, t_end, min, max, mean, samples)
+#
+# file_key is the log's base name (display), source its identity
+# (input_sources.source_key), so same-named logs from different folders or
+# archives keep separate blocks.
+#
+# Fleet-wide questions such as "every log and window where Delta Cell
+# Voltage > 50 mV" are then one indexed range query on (signal, max) /
+# (signal, min); nothing is decoded again. Consecutive matching windows
+# are merged into events. Re-processing a log replaces its blocks (WAL mode,
+# like the KPI store, so batch workers can write while queries run).
+#
+# EVENT_RULES are checked for every processed log; the hits go to
+# <base>_events.csv and the events section of the PDF report.
+
+BLOCK_INDEX_PATH = os.path.join(CACHE_DIR, "block_index.sqlite")
+BLOCK_WINDOW_S = 10.0
+
+# (rule, signal, op, limit): an event is a run of windows whose max (">")
+# or min ("<") crosses the limit
+EVENT_RULES = [
+    ("Fault flag", "SystemFaultIndicator", ">", 0.0),
+    ("Cell temperature high", "CellTempMax", ">", 45.0),
+    ("Cell temperature low", "CellTempMin", "<", 0.0),
+    ("Cell temperature spread", "Delta Cell Temperature", ">", 8.0),
+    ("Cell voltage imbalance", "Delta Cell Voltage", ">", 50.0),
+]
+EVENT_FIELDS = ["event", "rule", "signal", "unit", "start_s", "end_s", "duration_s", "blocks", "peak"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blocks (
+    source   TEXT NOT NULL,
+    file_key TEXT NOT NULL,
+    mode     TEXT,
+    signal   TEXT NOT NULL,
+    unit     TEXT,
+    block    INTEGER,
+    t_start  REAL,
+    t_end    REAL,
+    min      REAL,
+    max      REAL,
+    mean     REAL,
+    samples  INTEGER
+);
+CREATE TABLE IF NOT EXISTS block_sources (
+    source     TEXT PRIMARY KEY,
+    file_key   TEXT,
+    window_s   REAL,
+    t0         REAL,
+    indexed_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_blocks_signal_max ON blocks(signal, max);
+CREATE INDEX IF NOT EXISTS idx_blocks_signal_min ON blocks(signal, min);
+CREATE INDEX IF NOT EXISTS idx_blocks_source ON blocks(source);
+"""
+
+
+def connect(db_path: str = BLOCK_INDEX_PATH) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    con = sqlite3.connect(db_path, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(_SCHEMA)
+    return con
+
+
+# === Per-window statistics of one signal ===
+# Returns: (block ids, min, max, mean, samples), one entry per non-empty window
+def window_stats(t, x, t0: float, window_s: float = BLOCK_WINDOW_S):
+    t = np.asarray(t, float)
+    x = np.asarray(x)
+    ok = np.isfinite(t) & np.isfinite(x) if x.dtype.kind == "f" else np.isfinite(t)
+    if not ok.all():
+        t, x = t[ok], x[ok]
+    if not t.size:
+        return (np.array([], np.int64),) + (np.array([]),) * 3 + (np.array([], np.int64),)
+
+    ids = np.floor((t - t0) / window_s).astype(np.int64)
+    if np.any(ids[1:] < ids[:-1]):
+        order = np.argsort(ids, kind="stable")
+        ids, x = ids[order], x[order]
+    starts = np.r_[0, np.flatnonzero(ids[1:] != ids[:-1]) + 1]
+    n = np.diff(np.r_[starts, ids.size])
+    lo = np.minimum.reduceat(x, starts).astype(float)
+    hi = np.maximum.reduceat(x, starts).astype(float)
+    mean = np.add.reduceat(x, starts, dtype=float) / n
+    return ids[starts], lo, hi, mean, n
+
+
+# === Block stats of every signal row of one log ===
+# rows: metric_map rows (streaming rows without a "signal" are skipped)
+# Returns: {"t0", "window_s", "signals": {name: {"unit", "block", "min", "max", "mean", "samples"}}}
+def build_blocks(metric_map: dict, window_s: float = BLOCK_WINDOW_S) -> dict:
+    signals = [row for rows in metric_map.values() for row in rows
+               if row.get("signal") is not None and len(row["signal"])]
+    if not signals:
+        return {"t0": 0.0, "window_s": window_s, "signals": {}}
+
+    t0 = min(float(np.min(row["signal"].timestamps)) for row in signals)
+    blocks = {}
+    for row in signals:
+        sig = row["signal"]
+        if row["name"] in blocks:
+            continue
+        ids, lo, hi, mean, n = window_stats(sig.timestamps, sig.raw, t0, window_s)
+        if sig.scale != 1.0:  # scale the stats instead of materializing the samples
+            lo, hi, mean = lo * sig.scale, hi * sig.scale, mean * sig.scale
+            if sig.scale < 0:
+                lo, hi = hi, lo
+        blocks[row["name"]] = {"unit": row["unit"], "block": ids, "min": lo, "max": hi,
+                               "mean": mean, "samples": n}
+    return {"t0": t0, "window_s": window_s, "signals": blocks}
+
+
+# === Events ===
+# Merges consecutive matching block ids into events.
+# Returns: event dicts (EVENT_FIELDS without "event"), in time order
+def _merge_blocks(rule, signal, unit, op, ids, values, t0, window_s):
+    if not ids.size:
+        return []
+    breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+    starts, ends = np.r_[0, breaks], np.r_[breaks, ids.size]
+    reduce = np.maximum if op == ">" else np.minimum
+    peaks = reduce.reduceat(values, starts)
+    return [
+        {"rule": rule, "signal": signal, "unit": unit,
+         "start_s": round(float(t0 + ids[a] * window_s), 2),
+         "end_s": round(float(t0 + (ids[b - 1] + 1) * window_s), 2),
+         "duration_s": round(float(ids[b - 1] + 1 - ids[a]) * window_s, 2),
+         "blocks": int(b - a), "peak": round(float(p), 3)}
+        for a, b, p in zip(starts, ends, peaks)
+    ]
+
+
+def _crossing(op: str, limit: float, lo, hi):
+    if op == ">":
+        return hi > limit, hi
+    if op == "<":
+        return lo < limit, lo
+    raise ValueError(f"Unsupported operator: {op} (use > or <)")
+
+
+# Returns: events of one log (in-memory blocks), numbered in time order
+def find_events(blocks: dict, rules=EVENT_RULES) -> list[dict]:
+    events = []
+    for rule, signal, op, limit in rules:
+        b = blocks["signals"].get(signal)
+        if b is None:
+            continue
+        mask, values = _crossing(op, limit, b["min"], b["max"])
+        events += _merge_blocks(rule, signal, b["unit"], op, b["block"][mask], values[mask],
+                                blocks["t0"], blocks["window_s"])
+    events.sort(key=lambda e: (e["start_s"], e["rule"]))
+    return [{"event": i + 1, **e} for i, e in enumerate(events)]
+
+
+# === Store one log's blocks ===
+# source: identity of the log (default: file_key)
+def store_blocks(blocks: dict, file_key: str, mode: str, source: str | None = None,
+                 db_path: str = BLOCK_INDEX_PATH):
+    t0, window_s = blocks["t0"], blocks["window_s"]
+    source = source or file_key
+    rows = []
+    for name, b in blocks["signals"].items():
+        t_start = t0 + b["block"] * window_s
+        rows += [(source, file_key, mode, name, b["unit"], k, ts, ts + window_s, lo, hi, mean, n)
+                 for k, ts, lo, hi, mean, n in zip(b["block"].tolist(), t_start.tolist(), b["min"].tolist(),
+                                                   b["max"].tolist(), b["mean"].tolist(), b["samples"].tolist())]
+    con = connect(db_path)
+    try:
+        with con:
+            con.execute("DELETE FROM blocks WHERE source = ?", (source,))
+            con.executemany("INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            con.execute("INSERT OR REPLACE INTO block_sources VALUES (?, ?, ?, ?, ?)",
+                        (source, file_key, window_s, t0, time.time()))
+    finally:
+        con.close()
+
+
+# === Fleet-wide query ===
+# Every log/window where `signal` crosses `limit`, merged into events.
+# Returns: event dicts with "file_key", "source" and "mode", ordered by log and time
+def query_events(signal: str, op: str, limit: float, mode: str | None = None,
+                 rule: str | None = None, db_path: str = BLOCK_INDEX_PATH) -> list[dict]:
+    field = {">": "max", "<": "min"}.get(op)
+    if field is None:
+        raise ValueError(f"Unsupported operator: {op} (use > or <)")
+    sql = (f"SELECT b.source, b.file_key, b.mode, b.unit, b.block, b.{field}, f.t0, f.window_s "
+           f"FROM blocks b JOIN block_sources f USING (source) "
+           f"WHERE b.signal = ? AND b.{field} {op} ?")
+    args = [signal, limit]
+    if mode:
+        sql += " AND b.mode = ?"
+        args.append(mode)
+    con = connect(db_path)
+    try:
+        rows = con.execute(sql + " ORDER BY b.source, b.block", args).fetchall()
+    finally:
+        con.close()
+
+    events = []
+    for source, group in groupby(rows, key=lambda r: r[0]):
+        group = list(group)
+        _, file_key, file_mode, unit, _, _, t0, window_s = group[0]
+        ids = np.array([r[4] for r in group])
+        values = np.array([r[5] for r in group], float)
+        for e in _merge_blocks(rule or f"{signal} {op} {limit:g}", signal, unit, op, ids, values, t0, window_s):
+            events.append({"file_key": file_key, "source": source, "mode": file_mode, **e})
+    return events
+
+
+# Returns: [(signal, unit, logs, blocks)] of everything indexed
+def list_indexed(db_path: str = BLOCK_INDEX_PATH) -> list[tuple]:
+    con = connect(db_path)
+    try:
+        return con.execute(
+            "SELECT signal, MAX(unit), COUNT(DISTINCT source), COUNT(*) FROM blocks "
+            "GROUP BY signal ORDER BY signal"
+        ).fetchall()
+    finally:
+        con.close()
+
+
+# === Fleet events CSV ===
+def export_fleet_events(events: list[dict], path: str = os.path.join("mf4_exports", "fleet_events.csv")) -> str:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=["file_key", "source", "mode"] + EVENT_FIELDS[1:])
+        w.writeheader()
+        w.writerows(events)
+    return path
@@ -0,0 +1,179 @@
+# # mf4_analyzer_modular/comparison.py
+import os
+import csv
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from mf4_analyzer_modular.file_pipeline import analyze_file, PIPELINE_DEFAULTS
+from mf4_analyzer_modular.compute_metrics import sanitize_series
+from mf4_analyzer_modular.input_sources import source_name
+from mf4_analyzer_modular.plotter_exporter import render_jobs
+
+# === Multi-file Comparison ===
+# One PDF that compares N logs:
+#   - every log is analyzed with the normal pipeline (same signals,
+#     metric_map and KPIs as the single-file report, signal cache included),
+#     in parallel on a process pool
+#   - workers send back decimated traces only (COMPARE_POINTS per trace), so
+#     50+ files stay cheap to pickle and to plot
+#   - each SIGNAL_LIST signal becomes one overlay plot with a line per log, on
+#     a relative time axis (seconds since log start) or on the SoC axis
+#   - computed KPIs go into a file x KPI table (PDF + CSV)
+
+COMPARE_AXES = ("time", "soc")
+COMPARE_POINTS = 1000          # per trace; N logs share one plot
+COMPARE_LEGEND_MAX = 12        # more logs: no legend, see the file table
+COMPARE_TABLE_KPIS = 4         # KPI columns per PDF table block
+AXIS_LABELS = {"time": "Time since log start (s)", "soc": "StateOfCharge (%)"}
+
+
+# === Worker: analyze one log, keep decimated traces + KPIs ===
+def _compare_one(path: str, axis: str, max_points: int, options: dict) -> dict:
+    result = analyze_file(path, {**options, "streaming": False})
+    signals = [s for rows in result["metric_map"].values() for s in rows]
+
+    if axis == "soc":
+        soc = next((s["signal"] for s in signals if s["name"] == "StateOfCharge"), None)
+        soc_t, soc_v = sanitize_series(soc.timestamps, soc.samples) if soc else (None, None)
+    else:
+        t0 = min((float(s["signal"].timestamps[0]) for s in signals if len(s["signal"])), default=0.0)
+
+    traces = {}
+    for metric, rows in result["metric_map"].items():
+        for s in rows:
+            ts, y = s["signal"].decimated(max_points, "minmax")
+            ts = np.asarray(ts, float)
+            if axis == "soc":
+                if soc_t is None or not soc_t.size:
+                    continue
+                x = np.interp(ts, soc_t, soc_v)
+            else:
+                x = ts - t0
+            traces[(metric, s["name"])] = (s["unit"], x, y)
+
+    return {
+        "fname": result["fname"],
+        "base_name": result["base_name"],
+        "mode": result["mode"],
+        "kpis": {k["name"]: (k["value"], k["unit"]) for k in result["kpis"]},
+        "traces": traces,
+    }
+
+
+# === Compare N logs ===
+# Returns: per-log entries (in `paths` order; failed logs are skipped)
+def collect_logs(paths: list[str], axis: str = "time", workers: int | None = None,
+                 max_points: int = COMPARE_POINTS, options: dict | None = None) -> list[dict]:
+    if axis not in COMPARE_AXES:
+        raise ValueError(f"Unsupported axis: {axis} (use one of {', '.join(COMPARE_AXES)})")
+    options = {**PIPELINE_DEFAULTS, **(options or {})}
+    workers = workers or os.cpu_count() or 1
+    print(f"[i] Comparing {len(paths)} file(s) on {workers} worker(s), axis: {axis}")
+
+    logs = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_compare_one, p, axis, max_points, options) for p in paths]
+        for path, fut in zip(paths, futures):
+            try:
+                logs.append(fut.result())
+            except Exception as e:
+                print(f"[WARN] Skipping {source_name(path)}: {type(e).__name__}: {e}")
+    return logs
+
+
+# Returns: KPI names in first-seen order, with units
+def _kpi_columns(logs: list[dict]) -> dict:
+    columns = {}
+    for log in logs:
+        for name, (_, unit) in log["kpis"].items():
+            columns.setdefault(name, unit)
+    return columns
+
+
+# === Side-by-side KPI CSV (one row per log) ===
+def export_comparison_csv(logs: list[dict], name: str = "comparison") -> str:
+    columns = _kpi_columns(logs)
+    os.makedirs("mf4_exports", exist_ok=True)
+    out_path = os.path.join("mf4_exports", f"{name}_kpis.csv")
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["file_key", "mode"] + [f"{k} ({u})" if u else k for k, u in columns.items()])
+        for log in logs:
+            w.writerow([log["base_name"], log["mode"]] + [log["kpis"].get(k, ("",))[0] for k in columns])
+    return out_path
+
+
+# === Overlay plots (one per signal) ===
+# Returns: {(metric, signal): RGBA array} in SIGNAL_LIST order
+def render_overlays(logs: list[dict], axis: str = "time", workers=None) -> dict:
+    keys = {}
+    for log in logs:
+        for key, (unit, _, _) in log["traces"].items():
+            keys.setdefault(key, unit)
+
+    legend = len(logs) <= COMPARE_LEGEND_MAX
+    jobs = {}
+    for key, unit in keys.items():
+        traces = [(log["base_name"], *log["traces"][key][1:]) for log in logs if key in log["traces"]]
+        jobs[key] = (traces, f"{key[1]} ({unit})" if unit else key[1], None, AXIS_LABELS[axis], legend)
+    return render_jobs(jobs, workers)
+
+
+# === Comparison PDF ===
+def export_comparison_pdf(logs: list[dict], images: dict, axis: str = "time", name: str = "comparison") -> str:
+    from fpdf import FPDF
+    from fpdf.enums import XPos, YPos
+    from PIL import Image
+
+    pdf = FPDF()
+    pdf.set_font("Helvetica", size=11)
+    pdf.set_auto_page_break(auto=True, margin=10)
+    pdf.add_page()
+    pdf.cell(0, 10, "MF4 Comparison Report", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(0, 8, f"{len(logs)} logs, x axis: {AXIS_LABELS[axis]}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.ln(4)
+
+    # fpdf2 table: wraps long KPI names / file names, header repeated per page
+    def table(headers, widths, rows):
+        pdf.set_font("Helvetica", size=8)
+        with pdf.table(col_widths=widths, width=sum(widths), align="LEFT", line_height=4) as t:
+            for row in [headers] + rows:
+                cells = t.row()
+                for val in row:
+                    cells.cell(val)
+        pdf.ln(3)
+
+    # File list (also the legend when there are too many logs for one)
+    table(["#", "Logfile", "Mode"], [10, 120, 40],
+          [[str(i + 1), log["fname"], log["mode"]] for i, log in enumerate(logs)])
+
+    # KPI table in blocks of COMPARE_TABLE_KPIS columns
+    columns = list(_kpi_columns(logs).items())
+    for start in range(0, len(columns), COMPARE_TABLE_KPIS):
+        block = columns[start:start + COMPARE_TABLE_KPIS]
+        headers = ["Log"] + [f"{k} ({u})" if u else k for k, u in block]
+        rows = [[log["base_name"]] + [str(log["kpis"].get(k, ("-",))[0]) for k, _ in block] for log in logs]
+        table(headers, [50] + [35] * len(block), rows)
+
+    # Overlay plots
+    for (metric, signal), image in images.items():
+        pdf.set_font("Helvetica", size=10)
+        pdf.cell(0, 8, f"{metric}: {signal}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        pdf.image(Image.fromarray(image), x=15, w=180)
+
+    os.makedirs("mf4_exports", exist_ok=True)
+    out_path = os.path.join("mf4_exports", f"{name}_report.pdf")
+    pdf.output(out_path)
+    return out_path
+
+
+# === Full comparison run ===
+# Returns: (pdf path, csv path)
+def compare_logs(paths: list[str], axis: str = "time", workers: int | None = None,
+                 name: str = "comparison", options: dict | None = None):
+    options = {**PIPELINE_DEFAULTS, **(options or {})}
+    logs = collect_logs(paths, axis, workers, options=options)
+    if not logs:
+        raise FileNotFoundError("No log could be analyzed for the comparison.")
+    csv_path = export_comparison_csv(logs, name)
+    images = render_overlays(logs, axis, workers=options["plot_workers"])
+    return export_comparison_pdf(logs, images, axis, name), csv_path
@@ -44,25 +44,27 @@ def compute_charging_time(timestamps: np.ndarray, soc: np.ndarray) -> float:
     return float(timestamps[end_idx] - timestamps[start_idx])
 
 
-# === Compute charge metrics ===
-def compute_charging_metrics(derived: dict) -> list[dict]:
-    if derived.get("Mode") != "Charging":
-        return [] # Hard gate by mode to avoid false positives on discharge/idle logs
-
-    # --- inputs ---
-    soc = np.asarray(derived.get("StateOfCharge", {}).get("samples", []), float)
-    ts  = np.asarray(derived.get("StateOfCharge", {}).get("timestamps", []), float)
-    p   = np.asarray(derived.get("Actual Power", {}).get("samples", []), float)
-    tp  = np.asarray(derived.get("Actual Power", {}).get("timestamps", []), float)
-
-    if soc.size < 3 or ts.size < 3:
-        return []
-
-    # --- sanitize & order ---
-    idx = np.argsort(ts)
-    ts, soc = ts[idx], soc[idx]
-    m = np.isfinite(ts) & np.isfinite(soc)
-    ts, soc = ts[m], soc[m]
+# === Sanitize & order ===
+# Returns: (timestamps, samples) sorted by time with non-finite pairs dropped
+# (already sorted, finite input is returned without copies)
+def sanitize_series(ts, samples):
+    ts = np.asarray(ts, float)
+    samples = np.asarray(samples, float)
+    if ts.size != samples.size:
+        return np.array([]), np.array([])
+    if np.any(ts[1:] < ts[:-1]):
+        idx = np.argsort(ts)
+        ts, samples = ts[idx], samples[idx]
+    m = np.isfinite(ts) & np.isfinite(samples)
+    if m.all():
+        return ts, samples
+    return ts[m], samples[m]
+
+
+# === KPI kernels ===
+# Operate on already sanitized arrays so callers can share them between
+# metrics (see metric_registry.MetricContext).
+def charging_kpis(ts: np.ndarray, soc: np.ndarray, tp: np.ndarray, p: np.ndarray) -> list[dict]:
     if ts.size < 3:
         return []
 
@@ -71,26 +73,17 @@ def compute_charging_metrics(derived: dict) -> list[dict]:
     out = [{"name": "Charging Time", "value": round(float(charge_time), 2), "unit": "s"}]
 
     # --- optional: average charging power (time-weighted, negative = charging) ---
-    if p.size >= 2 and tp.size >= 2:
-        ordp = np.argsort(tp); tp, p = tp[ordp], p[ordp]
-        mp = np.isfinite(tp) & np.isfinite(p); tp, p = tp[mp], p[mp]
-        if tp.size >= 2:
-            dtp = np.diff(tp)
-            mask = p[:-1] < CHARGE_ACTIVE_THRESHOLD_KW  # negative power = charging
-            if np.any(mask):
-                avg_pow = float(np.sum(p[:-1][mask] * dtp[mask]) / np.sum(dtp[mask]))
-                out.append({"name": "Charging Power Avg", "value": round(avg_pow, 2), "unit": "kW"})
+    if tp.size >= 2:
+        dtp = np.diff(tp)
+        mask = p[:-1] < CHARGE_ACTIVE_THRESHOLD_KW  # negative power = charging
+        if np.any(mask):
+            avg_pow = float(np.sum(p[:-1][mask] * dtp[mask]) / np.sum(dtp[mask]))
+            out.append({"name": "Charging Power Avg", "value": round(avg_pow, 2), "unit": "kW"})
 
     return out
 
 
-# === Compute discharge metrics ===
-def compute_discharge_metrics(derived: dict) -> list[dict]:
-    if derived.get("Mode") != "Discharging":
-        return []  # hard gate by mode
-
-    p  = np.asarray(derived.get("Actual Power", {}).get("samples", []), float)
-    t  = np.asarray(derived.get("Actual Power", {}).get("timestamps", []), float)
+def discharge_kpis(t: np.ndarray, p: np.ndarray) -> list[dict]:
     if p.size < 2 or t.size < 2:
         return []
 
@@ -107,11 +100,40 @@ def compute_discharge_metrics(derived: dict) -> list[dict]:
         {"name": "DischargeActive Power Avg", "value": round(avg_power, 2), "unit": "kW"},
     ]
 
+
+def rms_power_kpis(power: np.ndarray) -> list[dict]:
+    rms = round(float(np.sqrt(np.mean(np.square(power)))), 2)
+    return [{"name": "Power RMS", "value": rms, "unit": "kW"}]
+
+
+# === Compute charge metrics ===
+def compute_charging_metrics(derived: dict) -> list[dict]:
+    if derived.get("Mode") != "Charging":
+        return [] # Hard gate by mode to avoid false positives on discharge/idle logs
+
+    # --- inputs ---
+    soc = derived.get("StateOfCharge", {})
+    pwr = derived.get("Actual Power", {})
+    if len(soc.get("samples", [])) < 3 or len(soc.get("timestamps", [])) < 3:
+        return []
+
+    ts, soc = sanitize_series(soc["timestamps"], soc["samples"])
+    tp, p = sanitize_series(pwr.get("timestamps", []), pwr.get("samples", []))
+    return charging_kpis(ts, soc, tp, p)
+
+
+# === Compute discharge metrics ===
+def compute_discharge_metrics(derived: dict) -> list[dict]:
+    if derived.get("Mode") != "Discharging":
+        return []  # hard gate by mode
+
+    p  = np.asarray(derived.get("Actual Power", {}).get("samples", []), float)
+    t  = np.asarray(derived.get("Actual Power", {}).get("timestamps", []), float)
+    return discharge_kpis(t, p)
+
 # === Compute RMS Power ===
 def compute_rms_power(derived: dict) -> list[dict]:
     if "Actual Power" not in derived:
         return []
 
-    power = derived["Actual Power"]["samples"]
-    rms = round(float(np.sqrt(np.mean(np.square(power)))), 2)
-    return [{"name": "Power RMS", "value": rms, "unit": "kW"}]
+    return rms_power_kpis(derived["Actual Power"]["samples"])
@@ -0,0 +1,70 @@
+# # mf4_analyzer_modular/decimation.py
+import numpy as np
+
+# === Plot Decimation ===
+# Reduces a trace to about `max_points` points before it is handed to
+# matplotlib. A 10-inch figure cannot show more than a few thousand distinct
+# x positions, so this is visually lossless while cutting render time.
+#
+#   "minmax" - keeps the min and max sample of each bucket (plus first/last
+#              sample), so peaks and single-sample fault spikes survive
+#   "lttb"   - Largest-Triangle-Three-Buckets, keeps the visual shape with
+#              one point per bucket
+# Both return views/copies of the original samples; no values are invented.
+
+DECIMATION_METHODS = ("minmax", "lttb")
+
+
+def decimate(t, y, max_points: int, method: str = "minmax"):
+    n = len(y)
+    if not max_points or n <= max_points:
+        return t, y
+    if method == "minmax":
+        idx = minmax_indices(y, max_points)
+    elif method == "lttb":
+        idx = lttb_indices(t, y, max_points)
+    else:
+        raise ValueError(f"Unsupported decimation method: {method}")
+    return np.asarray(t)[idx], np.asarray(y)[idx]
+
+
+# === Per-bucket min/max ===
+def minmax_indices(y, max_points: int) -> np.ndarray:
+    y = np.asarray(y)
+    n = len(y)
+    n_buckets = max(1, (max_points - 2) // 2)
+    size = -(-n // n_buckets)  # ceil
+    full = (n // size) * size
+
+    blocks = y[:full].reshape(-1, size)
+    offsets = np.arange(0, full, size)
+    parts = [np.array([0, n - 1]),
+             offsets + np.argmin(blocks, axis=1),
+             offsets + np.argmax(blocks, axis=1)]
+    if full < n:
+        tail = y[full:]
+        parts.append(np.array([full + np.argmin(tail), full + np.argmax(tail)]))
+    return np.unique(np.concatenate(parts))
+
+
+# === Largest-Triangle-Three-Buckets ===
+def lttb_indices(t, y, max_points: int) -> np.ndarray:
+    t = np.asarray(t, float)
+    y = np.asarray(y, float)
+    n = len(y)
+    n_out = max(3, max_points)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)  # buckets between first and last
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # average of the next bucket (or the last point for the final bucket)
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_t = t[nlo:nhi].mean() if nhi > nlo else t[-1]
+        avg_y = y[nlo:nhi].mean() if nhi > nlo else y[-1]
+        area = np.abs((t[a] - avg_t) * (y[lo:hi] - y[a]) - (t[a] - t[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area)) if hi > lo else lo
+        idx[i + 1] = a
+    return np.unique(idx)
@@ -0,0 +1,375 @@
+# # mf4_analyzer_modular/expression_engine.py
+import re
+import time
+import numpy as np
+import numexpr as ne
+from mf4_analyzer_modular.signal_types import Signal
+
+# === SIGNAL_LIST Expression Engine ===
+# Formulas are parsed once into a DAG of nodes:
+#   ("signal", token)          raw SIGNAL_CONFIG signal
+#   ("const", value)           numeric literal
+#   ("neg", a)                 unary minus
+#   (op, a, b)                 op in + - * /
+#   ("out", name, a, scale)    SIGNAL_LIST entry (scaling_factor applied)
+# Nodes are hash-consed, so identical sub-expressions share one node and are
+# computed once. Children are always created before their parents, which makes
+# node ids a topological order: entries may reference each other in any order.
+#
+# Evaluation materializes only leaves, entry outputs and nodes shared by
+# several parents; everything in between is fused into one numexpr call, so
+# long signals do not allocate a temporary array per operator. An entry that
+# only scales another signal (and is not referenced itself) is not computed
+# at all: its Signal keeps the operand's samples with a lazy `scale`.
+# float32 operands give float32 results (constants do not upcast).
+#
+# Grammar (usual precedence, parentheses allowed):
+#   expr  := term (("+" | "-") term)*
+#   term  := unary (("*" | "/") unary)*
+#   unary := "-" unary | "+" unary | NUMBER | NAME | "(" expr ")"
+# NAME is the longest known signal/entry name at that position (names may
+# contain spaces or hyphens, e.g. "Cell-Coolant DeltaT"), a plain identifier,
+# or any text in square brackets, e.g. "[Actual Power] / 2".
+
+DIVISION_FLOOR = 1e-6  # denominators are clipped to this (as before)
+
+_NUMBER = re.compile(r"(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?")
+_IDENT = re.compile(r"[A-Za-z_][\w.]*")
+
+
+# === Tokenizer ===
+def tokenize(expr: str, known_names=()) -> list[tuple[str, object]]:
+    names = sorted(known_names, key=len, reverse=True)
+    tokens = []
+    i = 0
+    while i < len(expr):
+        ch = expr[i]
+        if ch.isspace():
+            i += 1
+        elif ch in "+-*/()":
+            tokens.append(("op", ch))
+            i += 1
+        elif ch == "[":
+            end = expr.find("]", i)
+            if end < 0:
+                raise ValueError(f"Unclosed '[' in expression '{expr}'")
+            tokens.append(("name", expr[i + 1:end].strip()))
+            i = end + 1
+        else:
+            name = next((n for n in names if expr.startswith(n, i)
+                         and not (expr[i + len(n):i + len(n) + 1].isalnum()
+                                  or expr[i + len(n):i + len(n) + 1] == "_")), None)
+            if name:
+                tokens.append(("name", name))
+                i += len(name)
+                continue
+            m = _NUMBER.match(expr, i)
+            if m:
+                tokens.append(("number", float(m.group())))
+                i = m.end()
+                continue
+            m = _IDENT.match(expr, i)
+            if not m:
+                raise ValueError(f"Unexpected character '{ch}' in expression '{expr}'")
+            tokens.append(("name", m.group()))
+            i = m.end()
+    return tokens
+
+
+# === Parser ===
+# Returns: AST of nested tuples with ("ref", name) leaves (resolved later)
+def parse(expr: str, known_names=()):
+    tokens = tokenize(expr, known_names)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else (None, None)
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def parse_expr():
+        node = parse_term()
+        while peek() in (("op", "+"), ("op", "-")):
+            node = (take()[1], node, parse_term())
+        return node
+
+    def parse_term():
+        node = parse_unary()
+        while peek() in (("op", "*"), ("op", "/")):
+            node = (take()[1], node, parse_unary())
+        return node
+
+    def parse_unary():
+        kind, value = peek()
+        if (kind, value) == ("op", "-"):
+            take()
+            operand = parse_unary()
+            return ("const", -operand[1]) if operand[0] == "const" else ("neg", operand)
+        if (kind, value) == ("op", "+"):
+            take()
+            return parse_unary()
+        if kind == "number":
+            take()
+            return ("const", value)
+        if kind == "name":
+            take()
+            return ("ref", value)
+        if (kind, value) == ("op", "("):
+            take()
+            node = parse_expr()
+            if take() != ("op", ")"):
+                raise ValueError(f"Missing ')' in expression '{expr}'")
+            return node
+        raise ValueError(f"Unexpected end of expression '{expr}'" if kind is None
+                         else f"Unexpected '{value}' in expression '{expr}'")
+
+    ast = parse_expr()
+    if pos != len(tokens):
+        raise ValueError(f"Unexpected '{tokens[pos][1]}' in expression '{expr}'")
+    return ast
+
+
+# === Default resampling (extrapolating linear interpolation) ===
+def resample_extrapolate(ts, samples, target_ts):
+    from scipy.interpolate import interp1d  # deferred: scipy is slow to import
+    interp = interp1d(ts, samples, bounds_error=False, fill_value="extrapolate")
+    return interp(target_ts)
+
+
+# === Compiled Expression Graph ===
+class ExpressionGraph:
+    def __init__(self, entries: list[dict], raw_names):
+        self.raw_names = set(raw_names)
+        self.entries = {e.get("name", e["signal"]): e for e in entries}
+        self.nodes = []      # node id -> node tuple
+        self._ids = {}       # node tuple -> node id (hash-consing)
+        self.outputs = {}    # entry name -> "out" node id
+        self.errors = {}     # entry name -> compile error message
+
+        known = self.raw_names | set(self.entries)
+        asts = {}
+        for name, entry in self.entries.items():
+            try:
+                asts[name] = parse(entry["signal"], known)
+            except ValueError as e:
+                self.errors[name] = str(e)
+
+        def build(name, stack):
+            if name in self.outputs:
+                return self.outputs[name]
+            if name in self.errors:
+                raise ValueError(self.errors[name])
+            stack = stack + (name,)
+            child = self._intern_ast(asts[name], stack, build)
+            entry = self.entries[name]
+            node_id = self._intern(("out", name, child, float(entry.get("scaling_factor", 1))))
+            self.outputs[name] = node_id
+            return node_id
+
+        for name in self.entries:
+            try:
+                build(name, ())
+            except ValueError as e:
+                self.errors.setdefault(name, str(e))
+
+        # Parent counts decide which nodes are materialized vs fused
+        self._parents = [0] * len(self.nodes)
+        for node in self.nodes:
+            for child in self._children(node):
+                self._parents[child] += 1
+
+        # Signal-free subtrees (literals, "2 * 3") are always inlined: shared
+        # ones would otherwise be materialized without a signal operand
+        self._constant = []
+        for node in self.nodes:
+            kind = node[0]
+            self._constant.append(kind == "const" or (kind not in ("signal", "out") and
+                                  all(self._constant[c] for c in self._children(node))))
+
+    def _intern(self, node):
+        if node not in self._ids:
+            self._ids[node] = len(self.nodes)
+            self.nodes.append(node)
+        return self._ids[node]
+
+    def _intern_ast(self, ast, stack, build):
+        kind = ast[0]
+        if kind == "const":
+            return self._intern(("const", float(ast[1])))
+        if kind == "neg":
+            return self._intern(("neg", self._intern_ast(ast[1], stack, build)))
+        if kind == "ref":
+            name = ast[1]
+            # Another entry's output wins; an entry referencing its own name
+            # (e.g. "PackCurrent") means the raw signal of that name.
+            if name in self.entries and name not in stack:
+                return build(name, stack)
+            if name in self.raw_names:
+                return self._intern(("signal", name))
+            if name in self.entries:
+                raise ValueError(f"Circular reference: {' -> '.join(stack + (name,))}")
+            raise ValueError(f"Unknown signal: {name}")
+        return self._intern((kind,
+                             self._intern_ast(ast[1], stack, build),
+                             self._intern_ast(ast[2], stack, build)))
+
+    @staticmethod
+    def _children(node):
+        kind = node[0]
+        if kind in ("signal", "const"):
+            return ()
+        if kind == "neg":
+            return (node[1],)
+        if kind == "out":
+            return (node[2],)
+        return (node[1], node[2])
+
+    # === Dependencies ===
+    # Raw tokens needed by the given entries (default: all), in first-use order
+    def leaves(self, names=None) -> list[str]:
+        return [self.nodes[i][1] for i in sorted(self._closure(names))
+                if self.nodes[i][0] == "signal"]
+
+    def _closure(self, names=None):
+        names = self.outputs if names is None else [n for n in names if n in self.outputs]
+        seen = set()
+        stack = [self.outputs[n] for n in names]
+        while stack:
+            i = stack.pop()
+            if i not in seen:
+                seen.add(i)
+                stack.extend(self._children(self.nodes[i]))
+        return seen
+
+    def _materialized(self, i):
+        if self._constant[i]:
+            return False
+        return self.nodes[i][0] in ("signal", "out") or self._parents[i] > 1
+
+    # === Units ===
+    # unit_override, else the unit of the leftmost operand that has one
+    def unit(self, i, signal_data):
+        node = self.nodes[i]
+        kind = node[0]
+        if kind == "signal":
+            return signal_data.get(node[1], {}).get("unit", "")
+        if kind == "const":
+            return ""
+        if kind == "out":
+            return self.entries[node[1]].get("unit_override") or self.unit(node[2], signal_data)
+        return next((u for u in (self.unit(c, signal_data) for c in self._children(node)) if u), "")
+
+    # === Fused numexpr source for a materialized node ===
+    def _source(self, i, inputs, top=True):
+        node = self.nodes[i]
+        kind = node[0]
+        if not top and self._materialized(i):
+            if i not in inputs:
+                inputs[i] = f"v{len(inputs)}"
+            return inputs[i]
+        if kind == "const":
+            return repr(node[1])
+        if kind == "neg":
+            return f"(-{self._source(node[1], inputs, False)})"
+        if kind == "out":
+            src = self._source(node[2], inputs, False)
+            return src if node[3] == 1 else f"({src} * {node[3]!r})"
+        a = self._source(node[1], inputs, False)
+        b = self._source(node[2], inputs, False)
+        if kind == "/":
+            return f"({a} / where({b} < {DIVISION_FLOOR!r}, {DIVISION_FLOOR!r}, {b}))"
+        return f"({a} {kind} {b})"
+
+    # Output-only entry over one materialized operand: scaled lazily
+    def _lazy_scaled(self, i):
+        node = self.nodes[i]
+        return node[0] == "out" and self._materialized(node[2]) and not self._parents[i]
+
+    # === Evaluation ===
+    # signal_data: token -> Signal (or {"samples", "timestamps", "unit"})
+    # Returns: name -> Signal for the requested entries (default: all) and
+    #          name -> error message for failures.
+    # timings (optional dict): filled with {entry name: seconds}; shared nodes
+    # are charged to the first entry that needs them.
+    def evaluate(self, signal_data: dict, names=None, resample=resample_extrapolate, timings=None):
+        wanted = list(self.outputs) if names is None else [n for n in names if n in self.outputs]
+        values = {}  # node id -> (samples, timestamps), None if unavailable
+        resampled = {}  # (node id, id(target timestamps)) -> samples
+        errors = {n: self.errors[n] for n in (names or self.entries) if n in self.errors}
+
+        groups = [(None, self._closure(wanted))] if timings is None else \
+                 [(name, self._closure([name])) for name in wanted]
+        done = set()
+        for name, needed in groups:
+            start = time.perf_counter()
+            for i in sorted(needed - done):
+                if not self._materialized(i):
+                    continue
+                node = self.nodes[i]
+                try:
+                    values[i] = self._evaluate_node(i, node, values, signal_data, resample, resampled)
+                except Exception as e:
+                    values[i] = None
+                    if node[0] == "out":
+                        errors[node[1]] = str(e)
+            done |= needed
+            if name is not None:
+                timings[name] = time.perf_counter() - start
+
+        out = {}
+        for name in wanted:
+            i = self.outputs[name]
+            if values.get(i) is None:
+                errors.setdefault(name, "unavailable")
+                continue
+            samples, timestamps = values[i]
+            scale = self.nodes[i][3] if self._lazy_scaled(i) else 1.0
+            out[name] = Signal(samples, timestamps, self.unit(i, signal_data), scale)
+        return out, errors
+
+    def _evaluate_node(self, i, node, values, signal_data, resample, resampled):
+        if node[0] == "signal":
+            src = signal_data.get(node[1])
+            if not src:
+                raise ValueError(f"Missing signal: {node[1]}")
+            return src["samples"], src["timestamps"]
+
+        # Leaf or single-input entry without arithmetic: alias, no copy
+        # (with a scale: applied lazily by the output Signal)
+        if node[0] == "out" and self._materialized(node[2]) and (node[3] == 1 or self._lazy_scaled(i)):
+            if values.get(node[2]) is None:
+                raise ValueError(f"Missing signal: {self._describe(node[2])}")
+            return values[node[2]]
+
+        inputs = {}
+        source = self._source(i, inputs)
+        for j in inputs:
+            if values.get(j) is None:
+                raise ValueError(f"Missing signal: {self._describe(j)}")
+        if not inputs:
+            raise ValueError("Expression has no signal operand")
+
+        # Align all operands on the timebase of the longest one. A signal used
+        # in several expressions is resampled onto a given raster only once.
+        ref = max(inputs, key=lambda j: len(values[j][0]))
+        t_common = values[ref][1]
+        single = all(values[j][0].dtype == np.float32 for j in inputs)
+        dtype = np.float32 if single else np.float64
+        local = {}
+        for j, var in inputs.items():
+            samples, ts = values[j]
+            if ts is not t_common and not (len(ts) == len(t_common) and np.array_equal(ts, t_common)):
+                key = (j, id(t_common))
+                if key not in resampled:
+                    resampled[key] = np.asarray(resample(ts, samples, t_common), dtype=dtype)
+                samples = resampled[key]
+            local[var] = np.asarray(samples, dtype=dtype)
+        out = np.empty(len(t_common), dtype=dtype)
+        return ne.evaluate(source, local_dict=local, out=out, casting="unsafe"), t_common
+
+    def _describe(self, i):
+        node = self.nodes[i]
+        return node[1] if node[0] in ("signal", "out") else f"node {i}"
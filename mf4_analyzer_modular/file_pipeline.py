@@ -0,0 +1,231 @@
+# # mf4_analyzer_modular/file_pipeline.py
+import os
+import numpy as np
+from contextlib import nullcontext
+from mf4_analyzer_modular.mdf_loader import load_mdf
+from mf4_analyzer_modular.signal_extractor import evaluate_signals, load_raw_signals, detect_mode, required_signals
+from mf4_analyzer_modular.streaming_metrics import compute_streaming_kpis
+from mf4_analyzer_modular.signal_cache import cache_key, load_cached_signals, store_cached_signals
+from mf4_analyzer_modular.signal_config import SIGNAL_CONFIG
+from mf4_analyzer_modular.input_sources import open_source, source_fingerprint, source_name, source_key
+from mf4_analyzer_modular.metric_registry import MetricContext
+from mf4_analyzer_modular.summary_generator import summary_from_context
+from mf4_analyzer_modular.plotter_exporter import render_group_plots, PLOT_MAX_POINTS, PLOT_DECIMATION, PLOT_WORKERS
+from mf4_analyzer_modular.pdf_exporter import export_pdf, export_csv, export_segments_csv, export_events_csv
+from mf4_analyzer_modular.kpi_store import append_kpis
+from mf4_analyzer_modular.block_index import build_blocks, find_events, store_blocks
+from mf4_analyzer_modular.instrumentation import recording, stage, count, active
+
+# === Single-file pipeline ===
+# extract -> compute -> export for one log. Kept free of CLI state so it can
+# run unchanged in the main process or in a batch worker process.
+# Per-run settings travel in an `options` dict (see PIPELINE_DEFAULTS) so
+# they reach worker processes as plain picklable arguments.
+# `path` is any input source (local file, .gz/.zst, zip member, s3://...),
+# see input_sources.py.
+
+PIPELINE_DEFAULTS = {
+    "use_cache": True,   # reuse raw signals from the on-disk signal cache
+    "timebase": "native",  # shared time grid, see resampling.TIMEBASE_MODES
+    "rate_hz": None,     # grid rate for timebase="fixed"
+    "master": None,      # master signal token for timebase="master"
+    "streaming": False,  # fragment-wise, bounded-memory KPIs/segments/events (no plots, no cache)
+    "plot_points": PLOT_MAX_POINTS,  # decimate plot traces to this many points
+    "decimation": PLOT_DECIMATION,   # "minmax" or "lttb"
+    "plot_workers": PLOT_WORKERS,    # >1 renders metric groups in parallel
+    "save_png": False,   # also write plot PNGs (the PDF embeds them from memory)
+    "kpi_store": True,   # append KPI rows to the fleet KPI store
+    "instrument": False,  # per-stage timers/counters/memory -> instrumentation.jsonl
+    "profile": None,     # "cprofile" or "tracemalloc" (implies instrument)
+    "pdf_appendix": False,  # add the instrumentation page to the PDF (implies instrument)
+    "plots": True,       # render plots (matplotlib is only imported when needed)
+    "pdf": True,         # write the PDF report (fpdf is only imported when needed)
+    "block_index": True,  # store per-window signal stats in the block index (fleet event queries)
+    "float32": False,    # decode float samples to float32 (half the memory; own signal cache entries)
+}
+
+def _options(options):
+    return {**PIPELINE_DEFAULTS, **(options or {})}
+
+
+# === Raw signal loading (cache-aware) ===
+# fingerprint: source identity if the caller already has it (e.g. the
+# watcher's content hash); default: input_sources.source_fingerprint()
+# float32: cast while decoding (see signal_extractor.load_raw_signals); the
+# cache stores float32 entries under their own key, so hits map them as is
+def load_signals(path: str, options: dict | None = None, fingerprint: dict | None = None) -> dict:
+    options = _options(options)
+    tokens = required_signals()
+    dtype = np.float32 if options["float32"] else None
+    if not options["use_cache"]:
+        return _decode(path, tokens, dtype)
+
+    with stage("cache_lookup"):
+        key = cache_key(path, tokens, fingerprint or source_fingerprint(path), dtype)
+        signal_data = load_cached_signals(key)
+    if signal_data is not None:
+        count("cache_hit")
+        print(f"[i] Cache hit: {source_name(path)}")
+        return signal_data
+
+    count("cache_miss")
+    signal_data = _decode(path, tokens, dtype)
+    with stage("cache_store"):
+        store_cached_signals(key, signal_data)
+    return signal_data
+
+
+def _decode(path: str, tokens: list[str], dtype=None) -> dict:
+    with open_source(path, mapped=dtype is None) as src, stage("decode"):
+        mdf = load_mdf(src, channels=[SIGNAL_CONFIG[t] for t in tokens])
+        signal_data = load_raw_signals(mdf, tokens, dtype)
+    count("raw_samples", sum(len(sig["samples"]) for sig in signal_data.values()))
+    return signal_data
+
+
+# === Analyze raw signals of one log ===
+# Returns: result dict consumed by export_results()
+def analyze_signals(signal_data: dict, fname: str, options: dict | None = None) -> dict:
+    options = _options(options)
+
+    # Evaluate SIGNAL_LIST expressions
+    with stage("evaluate"):
+        data, metric_map, derived = evaluate_signals(signal_data, options["timebase"],
+                                                     rate_hz=options["rate_hz"], master=options["master"])
+
+    # Detect mode and normalize labels
+    mode_raw = detect_mode(derived.get("StateOfCharge", {}).get("samples", np.array([])))
+    mode = {"Charge": "Charging", "Discharge": "Discharging"}.get(mode_raw, mode_raw)
+    derived["Mode"] = mode
+    print(f"[i] Mode: {mode}")
+
+    # Compute registered metrics once; CSV, KPI store, summary and PDF share them
+    with stage("compute_metrics"):
+        ctx = MetricContext(data, derived, mode)
+        kpis = ctx.kpis()
+        data.extend(kpis)
+
+    # Per-window stats + event rules (see block_index.py)
+    with stage("block_stats"):
+        blocks = build_blocks(metric_map)
+        events = find_events(blocks)
+    if events:
+        print(f"[i] Events: {len(events)}")
+
+    # Summary
+    with stage("summary"):
+        summary = summary_from_context(ctx)
+
+    return {
+        "fname": fname,
+        "base_name": os.path.splitext(fname)[0],
+        "mode": mode,
+        "data": data,
+        "summary": summary,
+        "metric_map": metric_map,
+        "kpis": kpis,
+        "segments": ctx.segments(),
+        "blocks": blocks,
+        "events": events,
+    }
+
+
+def analyze_mdf(mdf, fname: str, options: dict | None = None) -> dict:
+    return analyze_signals(load_raw_signals(mdf), fname, options)
+
+
+# === Streaming analysis (logs larger than RAM) ===
+# Same result layout (segments, block stats and events included); signal rows
+# carry min/max/delta but no samples to plot. The log is opened without mmap
+# (see input_sources.open_source) so file pages do not count against the
+# bounded decode.
+def analyze_file_streaming(path: str) -> dict:
+    fname = source_name(path)
+    with open_source(path, mapped=False) as src:
+        with stage("decode"):
+            mdf = load_mdf(src, channels=[SIGNAL_CONFIG[t] for t in required_signals()])
+        with stage("streaming"):
+            stream = compute_streaming_kpis(mdf)
+    with stage("block_stats"):
+        events = find_events(stream["blocks"])
+    if events:
+        print(f"[i] Events: {len(events)}")
+    data = stream["data"]
+    metric_map = {}
+    for row in data:
+        if "metric" in row:
+            metric_map.setdefault(row["metric"], []).append(row)
+    return {
+        "fname": fname,
+        "base_name": os.path.splitext(fname)[0],
+        "mode": stream["mode"],
+        "data": data,
+        "summary": stream["summary"],
+        "metric_map": metric_map,
+        "kpis": [row for row in data if "value" in row],
+        "segments": stream["segments"],
+        "blocks": stream["blocks"],
+        "events": events,
+        "source": source_key(path),
+    }
+
+
+def analyze_file(path: str, options: dict | None = None, fingerprint: dict | None = None) -> dict:
+    if _options(options)["streaming"]:
+        return analyze_file_streaming(path)
+    result = analyze_signals(load_signals(path, options, fingerprint), source_name(path), options)
+    result["source"] = source_key(path)
+    return result
+
+
+# === Write CSV, plots and PDF for an analyzed file ===
+# The fleet stores key on result["source"] (see input_sources.source_key), so
+# same-named logs from different folders/archives do not replace each other.
+def export_results(result: dict, options: dict | None = None):
+    options = _options(options)
+    source = result.get("source") or result["base_name"]
+    with stage("csv"):
+        export_csv(result["data"], result["base_name"])
+        if result.get("segments"):
+            export_segments_csv(result["segments"], result["base_name"])
+        if result.get("events"):
+            export_events_csv(result["events"], result["base_name"])
+    if options["kpi_store"]:
+        with stage("kpi_store"):
+            append_kpis(result["data"], result["base_name"], result["mode"], source)
+    if options["block_index"] and result.get("blocks"):
+        with stage("block_index"):
+            store_blocks(result["blocks"], result["base_name"], result["mode"], source)
+    images = {}
+    if options["plots"] and (options["pdf"] or options["save_png"]):
+        with stage("plotting"):
+            images = render_group_plots(result["metric_map"], result["base_name"],
+                                        max_points=options["plot_points"], method=options["decimation"],
+                                        workers=options["plot_workers"], save_png=options["save_png"])
+        count("plots", len(images))
+    if not options["pdf"]:
+        return
+
+    # The appendix covers everything up to (not including) the PDF itself
+    recorder = active()
+    appendix = recorder.snapshot() if recorder and options["pdf_appendix"] else None
+    with stage("pdf"):
+        export_pdf(result["data"], result["summary"], result["fname"], result["metric_map"], images, appendix,
+                   segments=result.get("segments"), events=result.get("events"))
+
+
+# === Instrumentation scope for one file ===
+# Records timers/counters/memory of everything inside it (see
+# instrumentation.py) when enabled in `options`; otherwise a no-op.
+def instrumented(path: str, options: dict | None = None):
+    options = _options(options)
+    if options["instrument"] or options["profile"] or options["pdf_appendix"]:
+        return recording(source_name(path), options["profile"])
+    return nullcontext()
+
+
+def process_file(path: str, options: dict | None = None, fingerprint: dict | None = None) -> dict:
+    with instrumented(path, options):
+        result = analyze_file(path, options, fingerprint)
+        export_results(result, options)
+    return result
@@ -0,0 +1,366 @@
+# # mf4_analyzer_modular/input_sources.py
+import os
+import io
+import gzip
+import json
+import shutil
+import hashlib
+import zipfile
+import posixpath
+from collections import OrderedDict
+from contextlib import contextmanager
+from mf4_analyzer_modular.mdf_loader import MDF_EXTENSIONS
+from mf4_analyzer_modular.signal_cache import CACHE_DIR, file_fingerprint
+from mf4_analyzer_modular.instrumentation import stage, count
+
+# === Input Sources ===
+# A log is addressed by a source string instead of a plain local path:
+#     /data/run1.mf4                      plain log
+#     /data/run1.mf4.gz, run1.mf4.zst     compressed single log
+#     /data/bundle.zip#run1.mf4           member of a zip bundle
+#     s3://bucket/prefix/run1.mf4[.gz]    object on an S3-compatible store
+#                                         (also .zip#member)
+# list_sources() enumerates a local directory, a .zip bundle or an s3://
+# prefix. open_source() returns something load_mdf() can open:
+#   - local plain logs: the path itself
+#   - remote plain logs: a seekable file object backed by HTTP Range
+#     requests. Small reads (metadata) go through RANGE_BLOCK_BYTES blocks
+#     in an in-memory LRU, data block reads are fetched as one range each.
+#     asammdf only reads the metadata and the data blocks of the selected
+#     channels, so the rest of a large log is never transferred
+#   - compressed logs and zip members (not seekable): stream-decompressed
+#     straight from the store/file into the spill cache (SPILL_DIR), without
+#     downloading the archive first. The spill cache is LRU-bounded by
+#     SPILL_MAX_BYTES and reused by later runs
+# source_fingerprint() identifies a source without reading its data
+# (ETag/size for objects, CRC for zip members), so a signal cache hit
+# costs one HEAD request.
+#
+# S3 access uses boto3 (optional, imported on first use). Point
+# MF4_S3_ENDPOINT_URL at MinIO or another S3-compatible endpoint; the
+# credentials come from the usual AWS environment/config. .zst needs the
+# zstandard package.
+
+COMPRESSED_SUFFIXES = (".gz", ".zst")
+ARCHIVE_EXTENSIONS = (".zip",)
+LOG_SUFFIXES = MDF_EXTENSIONS + tuple(e + c for e in MDF_EXTENSIONS for c in COMPRESSED_SUFFIXES)
+MEMBER_SEP = "#"
+
+S3_ENDPOINT_URL = os.environ.get("MF4_S3_ENDPOINT_URL") or None
+RANGE_BLOCK_BYTES = 256 * 1024  # small: MF4 metadata blocks are scattered over the file
+RANGE_CACHE_BLOCKS = 64
+
+SPILL_DIR = os.path.join(CACHE_DIR, "spill")
+SPILL_MAX_BYTES = 20 * 1024**3
+SPILL_CHUNK_BYTES = 8 * 1024**2
+
+
+# === Source strings ===
+def is_remote(source: str) -> bool:
+    return source.startswith("s3://")
+
+
+def _split(source: str):
+    # Returns: (object or file, zip member or None)
+    i = source.find(".zip" + MEMBER_SEP)
+    if i < 0:
+        return source, None
+    return source[:i + 4], source[i + 5:]
+
+
+def _parse_s3(uri: str):
+    bucket, _, key = uri[len("s3://"):].partition("/")
+    return bucket, key
+
+
+def _compression(name: str):
+    return next((c for c in COMPRESSED_SUFFIXES if name.endswith(c)), None)
+
+
+# Log file name inside the source (compression suffix removed), e.g.
+# "s3://b/2024/run1.mf4.gz" -> "run1.mf4", "bundle.zip#a/run2.dat" -> "run2.dat"
+def source_name(source: str) -> str:
+    base, member = _split(source)
+    name = posixpath.basename(member) if member else os.path.basename(base.rstrip("/"))
+    comp = _compression(name)
+    return name[:-len(comp)] if comp else name
+
+
+# Stable identity of a source across runs and working directories (fleet
+# stores key on it): absolute local path, zip member and s3:// URI kept as is
+def source_key(source: str) -> str:
+    base, member = _split(source)
+    if not is_remote(base):
+        base = os.path.abspath(base)
+    return base if member is None else base + MEMBER_SEP + member
+
+
+# === S3 client (one per process; boto3 clients must not cross a fork) ===
+_S3 = {}
+
+
+def _s3():
+    pid = os.getpid()
+    if pid not in _S3:
+        try:
+            import boto3
+        except ImportError as e:
+            raise ImportError("s3:// sources need boto3 (pip install boto3)") from e
+        _S3.clear()
+        _S3[pid] = boto3.client("s3", endpoint_url=S3_ENDPOINT_URL)
+    return _S3[pid]
+
+
+# === Ranged reads ===
+# Seekable, read-only file object over an S3 object. Reads are served from
+# RANGE_BLOCK_BYTES blocks fetched with Range requests (LRU of
+# RANGE_CACHE_BLOCKS); reads of a block or more go straight to the store
+# without caching.
+class RangedObject(io.RawIOBase):
+    def __init__(self, uri: str, size: int | None = None):
+        self.bucket, self.key = _parse_s3(uri)
+        if size is None:
+            size = _s3().head_object(Bucket=self.bucket, Key=self.key)["ContentLength"]
+        self.size = size
+        self.pos = 0
+        self.fetched = 0  # bytes transferred
+        self._blocks = OrderedDict()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: self.size}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def _get(self, start: int, end: int) -> bytes:
+        body = _s3().get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end - 1}")["Body"]
+        data = body.read()
+        self.fetched += len(data)
+        return data
+
+    def _block(self, index: int) -> bytes:
+        block = self._blocks.pop(index, None)
+        if block is None:
+            start = index * RANGE_BLOCK_BYTES
+            block = self._get(start, min(start + RANGE_BLOCK_BYTES, self.size))
+            while len(self._blocks) >= RANGE_CACHE_BLOCKS:
+                self._blocks.popitem(last=False)
+        self._blocks[index] = block
+        return block
+
+    def readinto(self, b):
+        n = min(len(b), self.size - self.pos)
+        if n <= 0:
+            return 0
+        index, offset = divmod(self.pos, RANGE_BLOCK_BYTES)
+        if n >= RANGE_BLOCK_BYTES and index not in self._blocks:
+            data = self._get(self.pos, self.pos + n)
+        else:
+            data = self._block(index)[offset:offset + n]
+        n = len(data)
+        b[:n] = data
+        self.pos += n
+        return n
+
+
+# Seekable binary file object of a (local or remote) file
+@contextmanager
+def _open_seekable(path: str):
+    if not is_remote(path):
+        with open(path, "rb") as f:
+            yield f
+        return
+    raw = RangedObject(path)
+    try:
+        yield io.BufferedReader(raw, buffer_size=64 * 1024)
+    finally:
+        count("remote_bytes", raw.fetched)
+
+
+# Sequential binary stream of a (local or remote) file (one GET, no ranges)
+@contextmanager
+def _open_stream(path: str):
+    if not is_remote(path):
+        with open(path, "rb") as f:
+            yield f
+        return
+    bucket, key = _parse_s3(path)
+    resp = _s3().get_object(Bucket=bucket, Key=key)
+    count("remote_bytes", resp["ContentLength"])
+    with resp["Body"] as body:
+        yield body
+
+
+def _decompressor(stream, comp: str):
+    if comp == ".gz":
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError(".zst logs need zstandard (pip install zstandard)") from e
+    return zstandard.ZstdDecompressor().stream_reader(stream)
+
+
+# Decompressed byte stream of a compressed log or zip member
+@contextmanager
+def _decompressed(source: str):
+    base, member = _split(source)
+    if member is not None:
+        with _open_seekable(base) as f, zipfile.ZipFile(f) as zf, zf.open(member) as m:
+            yield m
+        return
+    with _open_stream(base) as raw, _decompressor(raw, _compression(base)) as d:
+        yield d
+
+
+# === Source identity (signal cache key part) ===
+# Local plain files keep the signal cache's size/mtime/content-hash
+# fingerprint, so existing cache entries stay valid.
+def source_fingerprint(source: str) -> dict:
+    base, member = _split(source)
+    if is_remote(base):
+        bucket, key = _parse_s3(base)
+        head = _s3().head_object(Bucket=bucket, Key=key)
+        fp = {"etag": head["ETag"], "size": head["ContentLength"],
+              "last_modified": head["LastModified"].isoformat()}
+    elif member is None:
+        fp = file_fingerprint(base)
+    else:
+        st = os.stat(base)
+        fp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if member is not None:
+        with _open_seekable(base) as f, zipfile.ZipFile(f) as zf:
+            info = zf.getinfo(member)
+        fp.update(member=member, crc=info.CRC, member_size=info.file_size)
+    return fp
+
+
+# === Enumerate logs ===
+# location: local directory, local .zip bundle or s3://bucket/prefix
+# Returns: source strings, newest first (zip members in archive order)
+def list_sources(location: str) -> list[str]:
+    found = []  # (mtime, source)
+    if is_remote(location):
+        bucket, prefix = _parse_s3(location)
+        for page in _s3().get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                found.append((obj["LastModified"].timestamp(), f"s3://{bucket}/{obj['Key']}"))
+    elif location.endswith(ARCHIVE_EXTENSIONS) and os.path.isfile(location):
+        found.append((os.path.getmtime(location), location))
+    else:
+        for e in os.scandir(location):
+            if e.is_file():
+                found.append((e.stat().st_mtime, e.path))
+
+    sources = []
+    for _, src in sorted(found, key=lambda x: x[0], reverse=True):
+        if src.endswith(ARCHIVE_EXTENSIONS):
+            try:
+                sources.extend(_zip_members(src))
+            except (OSError, zipfile.BadZipFile) as e:
+                print(f"[WARN] Skipping unreadable archive {os.path.basename(src)}: {e}")
+        elif src.endswith(LOG_SUFFIXES):
+            sources.append(src)
+    return sources
+
+
+def _zip_members(path: str) -> list[str]:
+    with _open_seekable(path) as f, zipfile.ZipFile(f) as zf:
+        return [path + MEMBER_SEP + info.filename for info in zf.infolist()
+                if not info.is_dir() and info.filename.endswith(MDF_EXTENSIONS)]
+
+
+# === Open a source for load_mdf() ===
+# Yields a local path or a seekable file object; valid inside the block only.
+# mapped=False: local logs are opened as a file object as well. asammdf then
+# reads them with read() instead of memory-mapping the whole file, whose
+# touched pages would count as resident memory in chunked (bounded) reads.
+@contextmanager
+def open_source(source: str, mapped: bool = True):
+    base, member = _split(source)
+    if member is None and _compression(base) is None:
+        if not is_remote(base):
+            if mapped:
+                yield base
+            else:
+                with open(base, "rb") as f:
+                    yield f
+            return
+        with _open_seekable(base) as f:
+            yield f
+        return
+    with _spill(source) as f:
+        yield f
+
+
+# === Spill cache ===
+# Decompressed logs, one file per source version. Written to a temp name
+# and renamed, so parallel workers never see a partial file.
+# Returns: the spill file opened for reading. The open handle keeps the data
+# readable even if another worker evicts the file right after (POSIX unlink
+# semantics), so eviction never races with load_mdf().
+def _spill(source: str):
+    key = json.dumps({"source": source, **source_fingerprint(source)}, sort_keys=True)
+    ext = os.path.splitext(source_name(source))[1]
+    path = os.path.join(SPILL_DIR, hashlib.sha1(key.encode()).hexdigest() + ext)
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        pass  # not spilled yet, or evicted: decompress (again)
+    else:
+        try:
+            os.utime(path)  # LRU
+        except FileNotFoundError:
+            pass
+        return f
+
+    os.makedirs(SPILL_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    out = open(tmp, "w+b")
+    try:
+        with stage("spill"), _decompressed(source) as stream:
+            shutil.copyfileobj(stream, out, SPILL_CHUNK_BYTES)
+        out.flush()
+        os.replace(tmp, path)
+    except BaseException:
+        out.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    count("spill_bytes", out.tell())
+    out.seek(0)
+    evict_spill(SPILL_DIR, keep=path)
+    return out
+
+
+# Least recently used spill files go first; `keep` (in use) is never removed.
+# Files other workers still have open stay readable for them (see _spill).
+def evict_spill(spill_dir: str = SPILL_DIR, max_bytes: int = SPILL_MAX_BYTES, keep: str | None = None):
+    entries = []
+    for e in os.scandir(spill_dir):
+        try:  # removed by another worker meanwhile
+            if e.is_file() and not e.name.endswith(".tmp"):
+                st = e.stat()
+                entries.append((st.st_mtime, st.st_size, e.path))
+        except FileNotFoundError:
+            continue
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:  # already gone, or still open on Windows
+            pass
+        total -= size
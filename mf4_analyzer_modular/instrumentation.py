@@ -0,0 +1,205 @@
+# # mf4_analyzer_modular/instrumentation.py
+import io
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+# === Run Instrumentation ===
+# Timers, counters and peak memory per pipeline stage and per SIGNAL_LIST
+# entry, collected for one file at a time:
+#
+#     with recording("log.mf4", profiler="cprofile"):
+#         with stage("decode"):
+#             ...
+#         count("cache_miss")
+#
+# stage()/count()/record_signal() are no-ops while no recording is active, so
+# the pipeline calls them unconditionally. The recorder is per process, which
+# keeps batch/watch workers independent.
+#
+# Optional profilers:
+#   "cprofile"    - top functions by cumulative time (+ .prof file for
+#                   snakeviz/pstats)
+#   "tracemalloc" - per-stage Python heap peak + top allocation sites
+#
+# Each finished recording is appended as one JSON line to INSTRUMENT_LOG_PATH.
+
+INSTRUMENT_LOG_PATH = os.path.join("mf4_exports", "instrumentation.jsonl")
+PROFILERS = ("cprofile", "tracemalloc")
+PROFILE_TOP_N = 25
+
+_ACTIVE = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS
+
+
+# === Recorder ===
+class Recorder:
+    def __init__(self, label: str, profiler: str | None = None):
+        if profiler and profiler not in PROFILERS:
+            raise ValueError(f"Unsupported profiler: {profiler} (use one of {', '.join(PROFILERS)})")
+        self.label = label
+        self.profiler = profiler
+        self.stages = {}    # stage -> {"wall_s", "calls", "peak_rss_mb"[, "peak_traced_mb"]}
+        self.counters = {}
+        self.signals = {}   # SIGNAL_LIST entry -> {"wall_s", "samples"}
+        self.started = time.time()
+        self.report = None  # final report, set when the recording ends
+        self._start = time.perf_counter()
+        self._prior_s = 0.0
+        self._prior_peak = None
+        self._profile = None
+
+    def start(self):
+        if self.profiler == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        elif self.profiler == "tracemalloc" and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def add_stage(self, name: str, wall_s: float, peak_traced=None):
+        entry = self.stages.setdefault(name, {"wall_s": 0.0, "calls": 0})
+        entry["wall_s"] = round(entry["wall_s"] + wall_s, 4)
+        entry["calls"] += 1
+        entry["peak_rss_mb"] = peak_rss_mb()
+        if peak_traced is not None:
+            entry["peak_traced_mb"] = max(entry.get("peak_traced_mb", 0.0), round(peak_traced / 2**20, 1))
+
+    # Continue a report recorded by another process (staged batch: the
+    # export process picks up the extract thread's report)
+    def merge(self, report: dict):
+        for name, entry in report["stages"].items():
+            own = self.stages.setdefault(name, {"wall_s": 0.0, "calls": 0})
+            own["wall_s"] = round(own["wall_s"] + entry["wall_s"], 4)
+            own["calls"] += entry["calls"]
+            for key in ("peak_rss_mb", "peak_traced_mb"):
+                if entry.get(key) is not None:
+                    own[key] = max(own.get(key) or 0.0, entry[key])
+        for name, n in report["counters"].items():
+            self.counters[name] = self.counters.get(name, 0) + n
+        self.signals.update(report["signals"])
+        self.started = min(self.started, time.mktime(time.strptime(report["started"], "%Y-%m-%dT%H:%M:%S")))
+        self._prior_s += report["total_s"]
+        self._prior_peak = max(self._prior_peak or 0.0, report["peak_rss_mb"] or 0.0)
+
+    # Returns: JSON-ready dict of everything recorded so far
+    def snapshot(self) -> dict:
+        peak = peak_rss_mb()
+        if self._prior_peak is not None:
+            peak = max(peak or 0.0, self._prior_peak)
+        return {
+            "file": self.label,
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "total_s": round(self._prior_s + time.perf_counter() - self._start, 4),
+            "peak_rss_mb": peak,
+            "stages": dict(self.stages),
+            "counters": dict(self.counters),
+            "signals": dict(sorted(self.signals.items(), key=lambda kv: -kv[1]["wall_s"])),
+        }
+
+    def stop(self) -> dict:
+        report = self.snapshot()
+        if self.profiler == "cprofile":
+            self._profile.disable()
+            report["profile"] = _cprofile_report(self._profile, self.label)
+        elif self.profiler == "tracemalloc":
+            report["profile"] = _tracemalloc_report()
+            report["profile"]["peak_traced_mb"] = max(
+                (s.get("peak_traced_mb", 0.0) for s in self.stages.values()), default=0.0)
+            tracemalloc.stop()
+        return report
+
+
+def _cprofile_report(profile, label) -> dict:
+    stats_file = os.path.join("mf4_exports", f"{os.path.splitext(label)[0]}_profile.prof")
+    os.makedirs(os.path.dirname(stats_file), exist_ok=True)
+    profile.dump_stats(stats_file)
+    stats = pstats.Stats(profile, stream=io.StringIO())
+    rows = sorted(stats.stats.items(), key=lambda kv: -kv[1][3])[:PROFILE_TOP_N]
+    top = [{"function": f"{os.path.basename(file)}:{line}({func})", "calls": nc,
+            "tottime_s": round(tt, 4), "cumtime_s": round(ct, 4)}
+           for (file, line, func), (cc, nc, tt, ct, _) in rows]
+    return {"tool": "cprofile", "stats_file": stats_file, "top": top}
+
+
+def _tracemalloc_report() -> dict:
+    snapshot = tracemalloc.take_snapshot()
+    top = [{"location": str(s.traceback), "size_mb": round(s.size / 2**20, 2), "count": s.count}
+           for s in snapshot.statistics("lineno")[:PROFILE_TOP_N]]
+    return {"tool": "tracemalloc", "top": top}
+
+
+# === Module-level API ===
+def active() -> Recorder | None:
+    return _ACTIVE
+
+
+@contextmanager
+def recording(label: str, profiler: str | None = None, log_path: str | None = INSTRUMENT_LOG_PATH):
+    global _ACTIVE
+    recorder = Recorder(label, profiler)
+    _ACTIVE = recorder
+    recorder.start()
+    error = None
+    try:
+        yield recorder
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _ACTIVE = None
+        report = recorder.stop()
+        if error:
+            report["error"] = error
+        recorder.report = report
+        if log_path:
+            write_json_log(report, log_path)
+
+
+@contextmanager
+def stage(name: str):
+    recorder = _ACTIVE
+    if recorder is None:
+        yield
+        return
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add_stage(name, time.perf_counter() - start,
+                           tracemalloc.get_traced_memory()[1] if tracing else None)
+
+
+def count(name: str, n: int = 1):
+    if _ACTIVE is not None:
+        _ACTIVE.counters[name] = _ACTIVE.counters.get(name, 0) + n
+
+
+def record_signal(name: str, wall_s: float, samples: int = 0):
+    if _ACTIVE is not None:
+        _ACTIVE.signals[name] = {"wall_s": round(wall_s, 5), "samples": int(samples)}
+
+
+# === Structured JSON log (one line per file) ===
+def write_json_log(report: dict, path: str = INSTRUMENT_LOG_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(report, default=str) + "\n")
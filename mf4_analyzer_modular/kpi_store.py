@@ -0,0 +1,120 @@
+# # mf4_analyzer_modular/kpi_store.py
+import os
+import time
+import sqlite3
+import numpy as np
+
+# === Fleet KPI Store ===
+# Every processed log appends its KPI rows (the same rows export_csv writes)
+# to one local SQLite file, so fleet-wide questions are a single indexed
+# query instead of globbing and parsing thousands of per-log CSVs:
+#
+#     kpis(source, file_key, mode, metric, name, unit, min, max, delta, value, ingested_at)
+#
+# Signal rows fill min/max/delta, computed metrics fill value (as in the CSV).
+# file_key is the log's base name (display); source is its identity
+# (input_sources.source_key), so same-named logs from different folders or
+# archives are kept apart. Re-processing a log replaces its rows. WAL mode
+# lets parallel batch workers append while queries run.
+
+KPI_DB_PATH = os.path.join("mf4_exports", "kpi_store.sqlite")
+KPI_FIELDS = ("value", "min", "max", "delta")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kpis (
+    source      TEXT NOT NULL,
+    file_key    TEXT NOT NULL,
+    mode        TEXT,
+    metric      TEXT,
+    name        TEXT NOT NULL,
+    unit        TEXT,
+    min         REAL,
+    max         REAL,
+    delta       REAL,
+    value       REAL,
+    ingested_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_kpis_name_mode_value ON kpis(name, mode, value);
+CREATE INDEX IF NOT EXISTS idx_kpis_source ON kpis(source);
+"""
+
+
+def connect(db_path: str = KPI_DB_PATH) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    con = sqlite3.connect(db_path, timeout=30)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript(_SCHEMA)
+    return con
+
+
+# === Append one log's KPI rows ===
+# source: identity of the log (default: file_key)
+def append_kpis(data: list[dict], file_key: str, mode: str, source: str | None = None,
+                db_path: str = KPI_DB_PATH):
+    now = time.time()
+    source = source or file_key
+    rows = [(source, file_key, mode, d.get("metric"), d.get("name", ""), d.get("unit", ""),
+             d.get("min"), d.get("max"), d.get("delta"), d.get("value"), now)
+            for d in data]
+    con = connect(db_path)
+    try:
+        with con:
+            con.execute("DELETE FROM kpis WHERE source = ?", (source,))
+            con.executemany("INSERT INTO kpis VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    finally:
+        con.close()
+
+
+# === Query API ===
+def _where(name, mode, field):
+    if field not in KPI_FIELDS:
+        raise ValueError(f"Unsupported field: {field} (use one of {', '.join(KPI_FIELDS)})")
+    sql = f"WHERE name = ? AND {field} IS NOT NULL"
+    args = [name]
+    if mode:
+        sql += " AND mode = ?"
+        args.append(mode)
+    return sql, args
+
+
+# Returns: (sources, values) for one KPI across all stored logs
+def kpi_values(name: str, mode: str | None = None, field: str = "value",
+               db_path: str = KPI_DB_PATH):
+    where, args = _where(name, mode, field)
+    con = connect(db_path)
+    try:
+        rows = con.execute(f"SELECT source, {field} FROM kpis {where} ORDER BY source", args).fetchall()
+    finally:
+        con.close()
+    return [r[0] for r in rows], np.array([r[1] for r in rows], dtype=float)
+
+
+# Returns: distribution summary of one KPI across the fleet
+def query_kpi(name: str, mode: str | None = None, field: str = "value",
+              db_path: str = KPI_DB_PATH) -> dict:
+    _, values = kpi_values(name, mode, field, db_path)
+    result = {"name": name, "mode": mode or "all", "field": field, "count": int(values.size)}
+    if values.size:
+        p05, p50, p95 = np.percentile(values, [5, 50, 95])
+        result.update({
+            "mean": round(float(values.mean()), 2),
+            "std": round(float(values.std()), 2),
+            "min": round(float(values.min()), 2),
+            "p05": round(float(p05), 2),
+            "p50": round(float(p50), 2),
+            "p95": round(float(p95), 2),
+            "max": round(float(values.max()), 2),
+        })
+    return result
+
+
+# Returns: [(name, mode, unit, logs)] of everything stored
+def list_kpis(db_path: str = KPI_DB_PATH) -> list[tuple]:
+    con = connect(db_path)
+    try:
+        return con.execute(
+            "SELECT name, mode, unit, COUNT(DISTINCT source) FROM kpis "
+            "GROUP BY name, mode, unit ORDER BY name, mode"
+        ).fetchall()
+    finally:
+        con.close()
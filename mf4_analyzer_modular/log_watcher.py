@@ -0,0 +1,185 @@
+# # mf4_analyzer_modular/log_watcher.py
+import os
+import sys
+import json
+import time
+import ctypes
+import ctypes.util
+import select
+from concurrent.futures import ProcessPoolExecutor
+from mf4_analyzer_modular.input_sources import LOG_SUFFIXES, source_name
+from mf4_analyzer_modular.signal_cache import file_fingerprint
+from mf4_analyzer_modular.batch_runner import process_and_report
+
+# === Watch Mode ===
+# Long-running loop over the input directory (plain and .gz/.zst logs; zip
+# bundles are batch-only):
+#   - wakes up on inotify events (Linux) or every POLL_SECONDS otherwise
+#   - treats a file as complete once it has not been modified for
+#     SETTLE_SECONDS
+#   - skips anything in the ledger (path + size + content hash), so nothing is
+#     processed twice, including across restarts. Failed files are logged
+#     but not counted as processed: they are retried on the next start or
+#     when they change
+#   - hashes each new file once; the content hash is handed to the worker as
+#     the signal cache fingerprint, so the log is not read twice
+#   - runs new files on a process pool with at most `max_pending` in flight;
+#     the rest wait for the next scan
+#   - `once=True` catches up with the current backlog and returns
+# On start the whole directory is scanned, so the backlog is caught up first.
+
+LEDGER_PATH = os.path.join("mf4_exports", "processed_ledger.jsonl")
+POLL_SECONDS = 5.0
+SETTLE_SECONDS = 5.0
+
+
+# === Processed-file ledger (append-only JSON lines) ===
+class Ledger:
+    def __init__(self, path: str = LEDGER_PATH):
+        self.path = path
+        self._seen = {}  # (path, size) -> set of content hashes
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    if rec.get("status", "ok") == "ok":
+                        self._seen.setdefault((rec["path"], rec["size"]), set()).add(rec["hash"])
+
+    def contains(self, path: str, size: int, digest: str) -> bool:
+        return digest in self._seen.get((path, size), ())
+
+    def add(self, path: str, size: int, digest: str, row: dict):
+        if row["status"] == "ok":
+            self._seen.setdefault((path, size), set()).add(digest)
+        rec = {"path": path, "size": size, "hash": digest, "status": row["status"],
+               "mode": row.get("mode", ""), "error": row.get("error", ""), "processed_at": time.time()}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec) + "\n")
+
+
+# === inotify wake-ups (Linux only, via libc) ===
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+
+class _Inotify:
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    # Returns: True if any event arrived within `timeout` seconds
+    def wait(self, timeout: float) -> bool:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 64 * 1024):  # drain; the scan is authoritative
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)  # also drops the watch
+            self.fd = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _wakeup(directory: str):
+    if sys.platform.startswith("linux"):
+        try:
+            return _Inotify(directory)
+        except (OSError, AttributeError) as e:
+            print(f"[WARN] inotify unavailable, polling instead: {e}")
+    return None
+
+
+# === Watch loop ===
+def watch(directory: str, workers: int | None = None, options: dict | None = None,
+          max_pending: int | None = None, settle_seconds: float = SETTLE_SECONDS,
+          poll_seconds: float = POLL_SECONDS, ledger_path: str = LEDGER_PATH, once: bool = False):
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * workers
+    ledger = Ledger(ledger_path)
+    notifier = _wakeup(directory)
+    print(f"[i] Watching {directory} ({'inotify' if notifier else 'polling'}, {workers} worker(s))")
+
+    known = {}      # path -> (size, mtime_ns) already checked against the ledger
+    in_flight = {}  # future -> (path, size, digest)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        try:
+            while True:
+                # --- collect finished work ---
+                for fut in [f for f in in_flight if f.done()]:
+                    path, size, digest = in_flight.pop(fut)
+                    try:
+                        row = fut.result()
+                    except Exception as e:  # worker crashed
+                        row = {"file": source_name(path), "status": "failed", "mode": "",
+                               "elapsed_s": "", "error": f"{type(e).__name__}: {e}"}
+                    ledger.add(path, size, digest, row)
+                    mark = "✓" if row["status"] == "ok" else "ERROR"
+                    print(f"[{mark}] {row['file']} ({row['elapsed_s']} s) {row['error']}".rstrip())
+
+                # --- scan for new, fully written files (oldest first) ---
+                busy = {p for p, _, _ in in_flight.values()}
+                pending = 0
+                entries = []
+                for e in os.scandir(directory):
+                    try:  # renamed/deleted between listing and stat (e.g. upload temp files)
+                        if e.is_file() and e.name.endswith(LOG_SUFFIXES):
+                            entries.append((e.stat().st_mtime, os.path.abspath(e.path), e.stat()))
+                    except OSError:
+                        continue
+                for _, path, st in sorted(entries):
+                    state = (st.st_size, st.st_mtime_ns)
+                    if path in busy or known.get(path) == state:
+                        continue
+                    if time.time() - st.st_mtime < settle_seconds or len(in_flight) >= max_pending:
+                        pending += 1  # still being written / back-pressure
+                        continue
+
+                    try:
+                        fingerprint = file_fingerprint(path)
+                    except OSError:
+                        continue
+                    if (fingerprint["size"], fingerprint["mtime_ns"]) != state:
+                        continue  # changed while hashing: wait until it settles again
+                    known[path] = state
+                    digest = fingerprint["content"]
+                    if ledger.contains(path, st.st_size, digest):
+                        continue
+                    fut = pool.submit(process_and_report, path, options, fingerprint)
+                    in_flight[fut] = (path, st.st_size, digest)
+
+                if once and not in_flight and not pending:
+                    break
+
+                # --- sleep until something changes ---
+                timeout = 0.5 if in_flight or pending else poll_seconds
+                if notifier:
+                    notifier.wait(timeout)
+                else:
+                    time.sleep(timeout)
+        except KeyboardInterrupt:
+            print("[i] Watch stopped; unfinished files are picked up on the next start")
+        finally:
+            if notifier:
+                notifier.close()
@@ -1,15 +1,33 @@
 import os
-from asammdf import MDF
 
-def load_latest_mdf(directory):
-    files = sorted(
-        [f for f in os.listdir(directory) if f.endswith((".mf4", ".dat"))],
+MDF_EXTENSIONS = (".mf4", ".dat")
+
+# === List MDF files in a directory ===
+# Returns: file names (not paths), newest first by modification time
+def list_mdf_files(directory):
+    return sorted(
+        [f for f in os.listdir(directory) if f.endswith(MDF_EXTENSIONS)],
         key=lambda x: os.path.getmtime(os.path.join(directory, x)),
         reverse=True
     )
+
+# === Open an MDF file ===
+# `path`: file path or seekable binary file object (see input_sources.open_source)
+# `channels` (optional): channel names to load selectively. asammdf then only
+# parses the metadata of the channel groups that hold them, so open time and
+# memory scale with the channels used instead of the file size.
+# asammdf is imported on first use (cache hits and KPI queries never need it).
+def load_mdf(path, channels=None):
+    from asammdf import MDF
+    if channels:
+        return MDF(path, channels=list(channels))
+    return MDF(path)
+
+def load_latest_mdf(directory, channels=None):
+    files = list_mdf_files(directory)
     for file in files:
         try:
-            return MDF(os.path.join(directory, file)), file
+            return load_mdf(os.path.join(directory, file), channels), file
         except Exception as e:
             print(f"[WARN] Failed to load {file}: {e}")
             continue
@@ -0,0 +1,128 @@
+# # mf4_analyzer_modular/metric_registry.py
+import numpy as np
+from mf4_analyzer_modular.compute_metrics import (
+    sanitize_series, charging_kpis, rms_power_kpis
+)
+from mf4_analyzer_modular.segmentation import build_segment_table, segment_rows, segment_kpis, phase_kpis
+
+# === Metric Registry ===
+# Computed KPIs are registered once here and evaluated through a per-file
+# MetricContext, which
+#   - runs every registered metric at most once (results are memoized),
+#   - sanitizes/sorts each input series once and shares it between metrics,
+#   - indexes the signal rows by name (no linear find() per lookup),
+# so the CSV, the KPI store, the summary and the PDF all read the same results.
+#
+# A metric function takes the context and returns a list of
+# {"name", "value", "unit"} dicts (same format as compute_metrics.py).
+
+METRIC_REGISTRY = []  # [(name, modes or None, fn)] in registration order
+
+
+def register_metric(name: str, modes: tuple | None = None):
+    def decorator(fn):
+        METRIC_REGISTRY.append((name, modes, fn))
+        return fn
+    return decorator
+
+
+# === Per-file result context ===
+class MetricContext:
+    def __init__(self, data: list[dict], derived: dict, mode: str):
+        self.derived = derived
+        self.mode = mode
+        self.stats = {}
+        for row in data:
+            self.stats.setdefault(row["name"], row)  # first row wins, as find() did
+        self._raw = {}
+        self._sanitized = {}
+        self._kpis = None
+        self._facts = None
+        self._segment_table = None
+        self._segments = None
+
+    # --- shared inputs ---
+    def raw(self, name: str):
+        if name not in self._raw:
+            sig = self.derived.get(name, {})
+            self._raw[name] = (np.asarray(sig.get("timestamps", []), float),
+                               np.asarray(sig.get("samples", []), float))
+        return self._raw[name]
+
+    def sanitized(self, name: str):
+        if name not in self._sanitized:
+            self._sanitized[name] = sanitize_series(*self.raw(name))
+        return self._sanitized[name]
+
+    def stat(self, name: str):
+        return self.stats.get(name)
+
+    # --- memoized results ---
+    def kpis(self) -> list[dict]:
+        if self._kpis is None:
+            self._kpis = []
+            for _, modes, fn in METRIC_REGISTRY:
+                if modes is None or self.mode in modes:
+                    self._kpis.extend(fn(self))
+        return self._kpis
+
+    # Charge/discharge/idle interval index (see segmentation.py)
+    def segment_table(self):
+        if self._segment_table is None:
+            t, p = self.sanitized("Actual Power")
+            ts, soc = self.sanitized("StateOfCharge")
+            self._segment_table = build_segment_table(t, p, ts, soc)
+        return self._segment_table
+
+    def segments(self) -> list[dict]:
+        if self._segments is None:
+            self._segments = segment_rows(self.segment_table())
+        return self._segments
+
+    # Scalar facts for the summary header (None = not available)
+    def facts(self) -> dict:
+        if self._facts is None:
+            t_soc, soc = self.raw("StateOfCharge")
+            _, power = self.raw("Actual Power")
+            _, current = self.raw("PackCurrent")
+            self._facts = {
+                "log_duration": float(t_soc[-1] - t_soc[0]) if soc.size else None,
+                "soc_first": float(soc[0]) if soc.size else None,
+                "soc_last": float(soc[-1]) if soc.size else None,
+                "peak_power": float(power[np.argmax(np.abs(power))]) if power.size else None,
+                "current_rms": float(np.sqrt(np.mean(np.square(current)))) if current.size else None,
+            }
+        return self._facts
+
+
+# === Registered metrics (order = summary/CSV order) ===
+@register_metric("Power RMS")
+def _power_rms(ctx: MetricContext) -> list[dict]:
+    if "Actual Power" not in ctx.derived:
+        return []
+    return rms_power_kpis(ctx.raw("Actual Power")[1])
+
+
+# Charge/discharge KPIs over the Charge/Discharge segments, so mixed logs do
+# not mix phases. Without power there are no segments: the SoC-only
+# Charging Time of charging logs is still reported.
+@register_metric("Charging")
+def _charging(ctx: MetricContext) -> list[dict]:
+    table = ctx.segment_table()
+    soc_ok = ctx.raw("StateOfCharge")[1].size >= 3
+    if len(table):
+        return phase_kpis(table, "Charge", soc_ok)
+    if ctx.mode != "Charging" or not soc_ok:
+        return []
+    ts, soc = ctx.sanitized("StateOfCharge")
+    return charging_kpis(ts, soc, np.array([]), np.array([]))
+
+
+@register_metric("Discharging")
+def _discharging(ctx: MetricContext) -> list[dict]:
+    return phase_kpis(ctx.segment_table(), "Discharge")
+
+
+@register_metric("Segments")
+def _segments(ctx: MetricContext) -> list[dict]:
+    return segment_kpis(ctx.segments())
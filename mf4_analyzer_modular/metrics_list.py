@@ -6,11 +6,13 @@
 # === SIGNAL_LIST Format ===
 # Each entry defines a metric to extract and optionally derive:
 #   - "metric": logical group (e.g. "Power", "SoC") for plot/PDF
-#   - "signal": raw signal or formula (e.g. "A - B" or "X * Y")
+#   - "signal": raw signal or formula (e.g. "A - B", "X * Y", "(A - B) / -2")
+#               with + - * /, parentheses and numeric constants; names with
+#               spaces/hyphens match as-is or can be written as "[Name]"
 #   - "name" (optional): custom label for plot/PDF; defaults to "signal"
 #   - "unit_override" (optional): string to override signal unit for display
 #   - "scaling_factor" (optional): numerical factor applied to signal values
-# Signals can be derived from raw signals or earlier derived names.
+# Signals can be derived from raw signals or other derived names, in any order.
 
 
 SIGNAL_LIST = [
@@ -1,14 +1,27 @@
 import os
 import csv
-from fpdf import FPDF
-from fpdf.enums import XPos, YPos
 from mf4_analyzer_modular.metrics_list import SIGNAL_LIST
 from mf4_analyzer_modular.plotter_exporter import get_plot_filename
+from mf4_analyzer_modular.segmentation import SEGMENT_FIELDS
+from mf4_analyzer_modular.block_index import EVENT_FIELDS
 
 
 # === PDF Export ===
 # Generates analysis report with summary, metrics table, and embedded plots
-def export_pdf(data, summary, fname, metric_map):
+# images (optional): {metric: RGBA array} from render_group_plots(); embedded
+#                    from memory. Without it the PNGs in mf4_exports/ are used.
+# appendix (optional): instrumentation report (Recorder.snapshot()), rendered
+#                      as a last page with stage timings and costly signals.
+# segments (optional): phase segments (segmentation.segment_rows()), listed
+#                      after the metrics table (first SEGMENT_PDF_MAX_ROWS).
+# events (optional): block_index.find_events() hits, listed after the segments
+#                    (first EVENT_PDF_MAX_ROWS).
+def export_pdf(data, summary, fname, metric_map, images=None, appendix=None, segments=None, events=None):
+    # fpdf/PIL are imported here so CSV-only runs never load them
+    from fpdf import FPDF
+    from fpdf.enums import XPos, YPos
+    from PIL import Image
+
     base_name = os.path.splitext(fname)[0]
     pdf = FPDF()
     pdf.set_font("Helvetica", size=11)
@@ -38,10 +51,14 @@ def export_pdf(data, summary, fname, metric_map):
 
     # Table values
     pdf.set_font("Helvetica", size=9)
+    rows = {}
+    for metric, signals in metric_map.items():
+        for d in signals:
+            rows.setdefault((metric, d["name"]), d)
     for entry in SIGNAL_LIST:
         metric = entry["metric"]
         name = entry.get("name", entry["signal"])
-        match = next((d for d in metric_map.get(metric, []) if d["name"] == name), None)
+        match = rows.get((metric, name))
         if match:
             row = [
                 metric,
@@ -54,16 +71,126 @@ def export_pdf(data, summary, fname, metric_map):
                 pdf.cell(TABLE_WIDTHS[i], 6, val, border=1)
             pdf.ln()
 
+    if segments:
+        _add_segment_table(pdf, segments)
+    if events is not None:
+        _add_event_table(pdf, events)
+
     # Plot images
     pdf.ln(4)
     for metric in metric_map:
+        if images is not None:
+            if metric in images:
+                pdf.image(Image.fromarray(images[metric]), x=15, w=180)
+            continue
         img_file = get_plot_filename(metric, base_name)
         if os.path.exists(img_file):
             pdf.image(img_file, x=15, w=180)
 
+    if appendix:
+        _add_instrumentation_page(pdf, appendix)
 
     pdf.output(os.path.join("mf4_exports", f"{base_name}_mf4_analysis_report.pdf"))
 
+# === Segment table ===
+SEGMENT_PDF_MAX_ROWS = 200  # the segments CSV always has every segment
+
+def _add_segment_table(pdf, segments):
+    from fpdf.enums import XPos, YPos
+    headers = ["#", "Phase", "Start (s)", "End (s)", "Dur. (s)", "kWh", "Avg kW", "Peak kW", "dSoC (%)",
+               "Active (s)", "Act. kW", "Chg. (s)"]
+    widths = [9, 18, 17, 17, 15, 14, 14, 14, 15, 16, 14, 16]
+    keys = ["segment", "phase", "start_s", "end_s", "duration_s", "energy_kwh",
+            "power_avg_kw", "power_peak_kw", "soc_delta", "active_s", "active_power_avg_kw", "charging_time_s"]
+
+    pdf.ln(4)
+    pdf.set_font("Helvetica", size=11)
+    pdf.cell(0, 8, f"Phase Segments ({len(segments)})", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.set_font("Helvetica", style="B", size=8)
+    for h, w in zip(headers, widths):
+        pdf.cell(w, 7, h, border=1)
+    pdf.ln()
+    pdf.set_font("Helvetica", size=8)
+    for seg in segments[:SEGMENT_PDF_MAX_ROWS]:
+        for key, w in zip(keys, widths):
+            pdf.cell(w, 5, str(seg[key]), border=1)
+        pdf.ln()
+    if len(segments) > SEGMENT_PDF_MAX_ROWS:
+        pdf.cell(0, 6, f"... {len(segments) - SEGMENT_PDF_MAX_ROWS} more segments in the segments CSV",
+                 new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+
+# === Event table ===
+EVENT_PDF_MAX_ROWS = 100  # the events CSV always has every event
+
+def _add_event_table(pdf, events):
+    from fpdf.enums import XPos, YPos
+    headers = ["#", "Rule", "Signal", "Start (s)", "End (s)", "Dur. (s)", "Peak"]
+    widths = [10, 42, 42, 24, 24, 20, 28]
+
+    pdf.ln(4)
+    pdf.set_font("Helvetica", size=11)
+    pdf.cell(0, 8, f"Events ({len(events)})", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    if not events:
+        pdf.set_font("Helvetica", size=9)
+        pdf.cell(0, 6, "No event rule triggered.", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+        return
+    pdf.set_font("Helvetica", style="B", size=9)
+    for h, w in zip(headers, widths):
+        pdf.cell(w, 7, h, border=1)
+    pdf.ln()
+    pdf.set_font("Helvetica", size=8)
+    for e in events[:EVENT_PDF_MAX_ROWS]:
+        row = [e["event"], e["rule"], e["signal"], e["start_s"], e["end_s"], e["duration_s"],
+               f"{e['peak']:g} {e['unit']}"]
+        for val, w in zip(row, widths):
+            pdf.cell(w, 5, str(val), border=1)
+        pdf.ln()
+    if len(events) > EVENT_PDF_MAX_ROWS:
+        pdf.cell(0, 6, f"... {len(events) - EVENT_PDF_MAX_ROWS} more events in the events CSV",
+                 new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+
+# === Instrumentation appendix ===
+APPENDIX_TOP_SIGNALS = 10
+
+def _add_instrumentation_page(pdf, report):
+    from fpdf.enums import XPos, YPos
+    pdf.add_page()
+    pdf.set_font("Helvetica", size=11)
+    pdf.cell(0, 10, "Appendix: Run Instrumentation", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    peak = report.get("peak_rss_mb")
+    pdf.cell(0, 8, f"Elapsed before PDF: {report['total_s']:.2f} s   Peak RSS: "
+                   f"{f'{peak:.0f} MB' if peak is not None else 'N/A'}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.ln(2)
+
+    def table(headers, widths, rows):
+        pdf.set_font("Helvetica", style="B", size=10)
+        for h, w in zip(headers, widths):
+            pdf.cell(w, 8, h, border=1)
+        pdf.ln()
+        pdf.set_font("Helvetica", size=9)
+        for row in rows:
+            for val, w in zip(row, widths):
+                pdf.cell(w, 6, val, border=1)
+            pdf.ln()
+        pdf.ln(4)
+
+    total = sum(s["wall_s"] for s in report["stages"].values()) or 1.0
+    table(["Stage", "Time (s)", "Share", "Calls", "Peak RSS (MB)"], [50, 30, 25, 20, 35],
+          [[name, f"{s['wall_s']:.3f}", f"{100 * s['wall_s'] / total:.0f} %", str(s["calls"]),
+            f"{s['peak_rss_mb']:.0f}" if s.get("peak_rss_mb") is not None else "N/A"]
+           for name, s in sorted(report["stages"].items(), key=lambda kv: -kv[1]["wall_s"])])
+
+    if report["signals"]:
+        table(["Most expensive signals", "Time (ms)", "Samples"], [90, 30, 40],
+              [[name, f"{1000 * s['wall_s']:.2f}", str(s["samples"])]
+               for name, s in list(report["signals"].items())[:APPENDIX_TOP_SIGNALS]])
+
+    if report["counters"]:
+        table(["Counter", "Value"], [90, 40], [[k, str(v)] for k, v in report["counters"].items()])
+
+
 # === CSV Export ===
 def export_csv(data, base_name):
     """
@@ -95,3 +222,26 @@ def export_csv(data, base_name):
                 "value": d.get("value", ""),
             }
             w.writerow(row)
+
+
+# === Segments CSV ===
+# mf4_exports/<base_name>_segments.csv, one row per phase segment
+def export_segments_csv(segments, base_name):
+    os.makedirs("mf4_exports", exist_ok=True)
+    out_path = os.path.join("mf4_exports", f"{base_name}_segments.csv")
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=["file_key"] + SEGMENT_FIELDS)
+        w.writeheader()
+        for seg in segments:
+            w.writerow({"file_key": base_name, **seg})
+
+
+# mf4_exports/<base_name>_events.csv, one row per event
+def export_events_csv(events, base_name):
+    os.makedirs("mf4_exports", exist_ok=True)
+    out_path = os.path.join("mf4_exports", f"{base_name}_events.csv")
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=["file_key"] + EVENT_FIELDS)
+        w.writeheader()
+        for e in events:
+            w.writerow({"file_key": base_name, **e})
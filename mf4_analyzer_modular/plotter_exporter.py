@@ -1,38 +1,130 @@
 import os
-import matplotlib.pyplot as plt
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# --- Plot decimation (see decimation.py) ---
+PLOT_MAX_POINTS = 4000      # points per trace; 0/None plots every sample
+PLOT_DECIMATION = "minmax"  # "minmax" keeps peaks/spikes, "lttb" keeps shape
+
+# --- Rendering ---
+# Figures are drawn straight on the Agg canvas (no pyplot state machine, no
+# interactive backend import). Each process keeps one figure and clears it
+# between groups. With PLOT_WORKERS > 1 the metric groups are rendered in
+# parallel on a process pool that is kept alive across files.
+# matplotlib and PIL are imported on first render, so runs without plots
+# never load them.
+PLOT_WORKERS = 1
+
+_FIGURE = None
+_POOL = None
+_POOL_WORKERS = 0
 
 # === Generate plot filename for a given metric ===
 # Returns: full path to PNG image based on export dir, base filename, and metric name
 def get_plot_filename(metric: str, base_name: str) -> str:
     return os.path.join("mf4_exports", f"{base_name}_{metric.lower().replace(' ', '_')}.png")
 
-# === Export grouped signal plots by metric ===
-# Each metric group is plotted into a shared figure with labeled curves
-# Saves plots as PNGs named using get_plot_filename()
-def export_group_plots(metric_map: dict, base_name: str):
+
+# === Reusable per-process figure ===
+def _get_figure():
+    global _FIGURE
+    if _FIGURE is None:
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        _FIGURE = Figure(figsize=(10, 3))
+        FigureCanvasAgg(_FIGURE)
+    else:
+        _FIGURE.clear()
+    return _FIGURE
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _POOL, _POOL_WORKERS
+    if _POOL is None or _POOL_WORKERS != workers:
+        if _POOL is not None:
+            _POOL.shutdown()
+        _POOL = ProcessPoolExecutor(max_workers=workers)
+        _POOL_WORKERS = workers
+    return _POOL
+
+
+# === Render one metric group ===
+# traces: [(label, timestamps, samples)], already decimated
+# legend: False for many-trace overlays (the legend would cover the plot)
+# Returns: RGBA pixel array; the PNG file is only compressed and written when
+#          `filename` is given.
+def _render_group(traces: list, y_label: str, filename: str | None = None,
+                  x_label: str = "Time (s)", legend: bool = True) -> np.ndarray:
+    fig = _get_figure()
+    ax1 = fig.add_subplot()
+
+    for label, timestamps, samples in traces:
+        ax1.plot(timestamps, samples, label=label)
+
+    ax1.set_xlabel(x_label)
+    ax1.set_ylabel(y_label)
+    ax1.grid(True)
+
+    # Add legend above plot; the axes and their labels fit in the rest
+    if legend:
+        fig.legend(loc="upper center", bbox_to_anchor=(0.5, 0.945), ncol=min(3, len(traces)), frameon=False)
+    fig.tight_layout(rect=(0, 0, 1, 0.82 if legend else 1))
+
+    image = _canvas_rgba(fig)
+
+    # Save plot to export folder
+    if filename:
+        from PIL import Image
+        Image.fromarray(image).save(filename)
+    return image
+
+
+# Canvas pixels as an (height, width, 4) array, no savefig/PNG encode. The
+# tight layout keeps every label inside the canvas, so nothing is cropped.
+# Copied because the per-process figure redraws into the same buffer.
+def _canvas_rgba(fig) -> np.ndarray:
+    canvas = fig.canvas
+    canvas.draw()
+    width, height = canvas.get_width_height(physical=True)
+    return np.frombuffer(canvas.buffer_rgba(), dtype=np.uint8).reshape(height, width, 4).copy()
+
+
+# === Render grouped signal plots by metric ===
+# Each metric group is plotted into a shared figure with labeled curves.
+# Traces are decimated to `max_points` points before plotting (and before
+# they are sent to a render worker).
+# Returns: {metric: RGBA array} in metric_map order, ready for export_pdf()
+# PNGs (named using get_plot_filename()) are written only if save_png=True.
+def render_group_plots(metric_map: dict, base_name: str, max_points=PLOT_MAX_POINTS,
+                       method=PLOT_DECIMATION, workers=PLOT_WORKERS, save_png=False) -> dict:
+    jobs = {}
     for metric, signals in metric_map.items():
+        signals = [s for s in signals if s.get("signal") is not None]  # streaming rows have no samples
         if not signals:
             continue
 
-        fig, ax1 = plt.subplots(figsize=(10, 3))
-        y_label = signals[0]["unit"]
+        traces = []
+        for row in signals:
+            timestamps, samples = row["signal"].decimated(max_points, method)
+            traces.append((f"{row['name']} ({row['unit']})", timestamps, samples))
+        jobs[metric] = (traces, signals[0]["unit"], get_plot_filename(metric, base_name) if save_png else None)
+
+    return render_jobs(jobs, workers)
 
-        for signal in signals:
-            samples = signal["samples"]
-            timestamps = signal["timestamps"]
-            unit = signal["unit"]
-            label = f"{signal['name']} ({unit})"
-            ax1.plot(timestamps, samples, label=label)
 
-        ax1.set_xlabel("Time (s)")
-        ax1.set_ylabel(y_label)
-        ax1.grid(True)
+# === Render prepared plot jobs ===
+# jobs: {key: _render_group() arguments}, traces already decimated
+# Returns: {key: RGBA array} in jobs order
+def render_jobs(jobs: dict, workers=PLOT_WORKERS) -> dict:
+    if workers and workers > 1 and len(jobs) > 1:
+        pool = _get_pool(workers)
+        futures = {key: pool.submit(_render_group, *job) for key, job in jobs.items()}
+        return {key: fut.result() for key, fut in futures.items()}
+    return {key: _render_group(*job) for key, job in jobs.items()}
 
-        # Add legend above plot
-        fig.legend(loc="upper center", bbox_to_anchor=(0.5, 0.945), ncol=min(3, len(signals)), frameon=False)
-        fig.subplots_adjust(top=0.82)
 
-        # Save plot to export folder
-        filename = get_plot_filename(metric, base_name)
-        plt.savefig(filename, bbox_inches="tight")
-        plt.close()
\ No newline at end of file
+# === Export grouped signal plots by metric ===
+# Saves plots as PNGs named using get_plot_filename()
+def export_group_plots(metric_map: dict, base_name: str, max_points=PLOT_MAX_POINTS,
+                       method=PLOT_DECIMATION, workers=PLOT_WORKERS) -> dict:
+    return render_group_plots(metric_map, base_name, max_points, method, workers, save_png=True)
@@ -0,0 +1,72 @@
+# # mf4_analyzer_modular/resampling.py
+import numpy as np
+from mf4_analyzer_modular.signal_types import Signal
+
+# === Shared Time Base ===
+# Instead of resampling operand pairs inside every derived expression, all raw
+# signals of a file can be put on one common grid once. Derived expressions
+# then run on arrays that are already aligned (no interpolation at all in the
+# expression engine) and every derived channel shares the same raster.
+#
+# Modes:
+#   "native" - keep each signal's own raster (operands are aligned per expression)
+#   "fixed"  - uniform grid at `rate_hz` over the overall time span
+#   "union"  - sorted union of all sample times (exact, but can be large)
+#   "master" - raster of one signal (`master` token, default: most samples)
+#
+# Float signals are interpolated linearly; integer/bool signals (flags,
+# states) are sample-and-hold so they never take fractional values. Values
+# outside a signal's own time range are held at the first/last sample.
+
+TIMEBASE_MODES = ("native", "fixed", "union", "master")
+DEFAULT_RATE_HZ = 10.0
+
+
+# === Grid construction ===
+def build_timebase(signal_data: dict, mode: str, rate_hz: float | None = None,
+                   master: str | None = None) -> np.ndarray:
+    rasters = [s["timestamps"] for s in signal_data.values() if len(s["timestamps"])]
+    if not rasters:
+        return np.array([])
+
+    if mode == "fixed":
+        rate_hz = rate_hz or DEFAULT_RATE_HZ
+        t0 = min(float(ts[0]) for ts in rasters)
+        t1 = max(float(ts[-1]) for ts in rasters)
+        return t0 + np.arange(int(np.floor((t1 - t0) * rate_hz)) + 1) / rate_hz
+    if mode == "union":
+        unique = {id(ts): ts for ts in rasters}  # shared group rasters once
+        return np.unique(np.concatenate(list(unique.values())))
+    if mode == "master":
+        if master:
+            if master not in signal_data:
+                raise ValueError(f"Master signal not loaded: {master}")
+            return np.asarray(signal_data[master]["timestamps"])
+        return np.asarray(max(rasters, key=len))
+    raise ValueError(f"Unsupported timebase mode: {mode}")
+
+
+# === Resampling kernel ===
+def resample(ts, samples, grid):
+    ts = np.asarray(ts)
+    samples = np.asarray(samples)
+    if len(ts) == 0:
+        return np.full(len(grid), np.nan)
+    if samples.dtype.kind in "biu":
+        idx = np.searchsorted(ts, grid, side="right") - 1
+        return samples[np.clip(idx, 0, len(ts) - 1)]
+    return np.interp(grid, ts, samples)
+
+
+# === Put every raw signal on one grid ===
+# Returns: new signal_data dict; all entries share the same timestamps array
+def align_signals(signal_data: dict, grid: np.ndarray) -> dict:
+    aligned = {}
+    for token, sig in signal_data.items():
+        ts = sig["timestamps"]
+        if ts is grid or (len(ts) == len(grid) and np.array_equal(ts, grid)):
+            samples = sig["samples"]
+        else:
+            samples = resample(ts, sig["samples"], grid)
+        aligned[token] = Signal(samples, grid, sig.get("unit", ""))
+    return aligned
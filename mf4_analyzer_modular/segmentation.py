@@ -0,0 +1,415 @@
+# # mf4_analyzer_modular/segmentation.py
+import numpy as np
+from mf4_analyzer_modular.compute_metrics import (
+    CHARGE_ACTIVE_THRESHOLD_KW, DISCHARGE_ACTIVE_THRESHOLD_KW, DERIVATIVE_THRESHOLD
+)
+
+# === Phase Segmentation ===
+# Splits a log into an interval index of Charge / Discharge / Idle phases, so
+# mixed drive-and-charge logs get KPIs per phase instead of one span over the
+# whole file:
+#   1. label every raw Actual Power sample (same thresholds as
+#      compute_metrics.py); phase boundaries stay at the raw threshold
+#      crossings
+#   2. runs shorter than SEGMENT_SMOOTH_S whose label disagrees with a
+#      centered SEGMENT_SMOOTH_S moving average are noise around a threshold
+#      and take the smoothed label. The moving average only decides about
+#      these short runs; it would shift real boundaries by ~half a window
+#   3. run-length encode the labels, aggregating every run in one
+#      np.*.reduceat pass (duration, energy, peaks, charge/discharge-active
+#      time and energy)
+#   4. runs shorter than SEGMENT_MIN_DURATION_S are absorbed by the preceding
+#      phase (noise around a threshold would otherwise create micro segments)
+#   5. SoC confirmation: SoC at the segment boundaries and the SoC-derivative
+#      marks of compute_charging_time() are assigned to the segments. A
+#      Charge segment whose SoC falls (a Discharge segment whose SoC rises)
+#      by more than SEGMENT_SOC_TOLERANCE is not a real phase and takes the
+#      phase of the segment before it (Idle at the log start)
+# Every step is a vectorized pass over the samples or the run aggregates; the
+# cost stays linear in the log length however many segments there are.
+#
+# Steps 1-3 run incrementally in SegmentBuilder and step 5 in SegmentSoc:
+# samples arrive in time-ordered chunks (the whole log at once in memory, one
+# record fragment at a time when streaming) and only run aggregates are kept,
+# so both paths produce the same segments.
+#
+# Time-weighted values use the left-rectangle rule like the discharge KPIs
+# (sample i holds until sample i+1, also across a segment boundary).
+# The whole-log "Charging Time" / "Charging Power Avg" / "DischargeActive *"
+# KPIs are computed over the Charge / Discharge segments (phase_kpis), so a
+# drive before a charge no longer stretches the charging span.
+
+PHASES = ("Idle", "Charge", "Discharge")  # label codes 0, 1, 2
+SEGMENT_SMOOTH_S = 10.0
+SEGMENT_MIN_DURATION_S = 30.0
+SEGMENT_SOC_TOLERANCE = 0.1  # %-pts of SoC change against the power phase
+SEGMENT_FIELDS = ["segment", "phase", "start_s", "end_s", "duration_s", "energy_kwh",
+                  "power_avg_kw", "power_peak_kw", "soc_start", "soc_end", "soc_delta",
+                  "active_s", "active_power_avg_kw", "charging_time_s"]
+
+def classify_power(p: np.ndarray) -> np.ndarray:
+    labels = np.zeros(p.size, dtype=np.int8)
+    labels[p < CHARGE_ACTIVE_THRESHOLD_KW] = 1  # negative power = charging
+    labels[p > DISCHARGE_ACTIVE_THRESHOLD_KW] = 2
+    return labels
+
+
+# Centered moving average over a time window (prefix sums, any sample rate)
+def _moving_average(t: np.ndarray, p: np.ndarray, window_s: float) -> np.ndarray:
+    csum = np.r_[0.0, np.cumsum(p)]
+    lo = np.searchsorted(t, t - window_s / 2)
+    hi = np.searchsorted(t, t + window_s / 2, side="right")
+    return (csum[hi] - csum[lo]) / (hi - lo)
+
+
+# === Run-length encoding ===
+# Returns: (starts, ends) sample index of every run, ends exclusive
+def run_lengths(labels: np.ndarray):
+    change = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+    return np.r_[0, change], np.r_[change, labels.size]
+
+
+def _run_durations(labels: np.ndarray, t: np.ndarray):
+    starts, ends = run_lengths(labels)
+    return starts, ends, t[np.minimum(ends, t.size - 1)] - t[starts]
+
+
+# Run aggregates: one row per run / segment, columns indexed by the _R*
+# constants. Merging rows takes the first row's start values, the last row's
+# end values, and sums / maxima / minima of the rest.
+(_RCODE, _RSTART, _REND, _RDURATION, _RENERGY, _RMAX, _RMIN, _RFIRST,
+ _RCHG_T, _RCHG_E, _RDIS_T, _RDIS_E, _RSOC0, _RSOC1, _RMARK0, _RMARK1, _RMARKS) = range(17)
+_RCOLS = 17
+_MERGE_LAST = [_REND, _RSOC1]
+_MERGE_SUM = [_RDURATION, _RENERGY, _RCHG_T, _RCHG_E, _RDIS_T, _RDIS_E, _RMARKS]
+_MERGE_MAX = [_RMAX, _RMARK1]
+_MERGE_MIN = [_RMIN, _RMARK0]
+
+
+def _run_table(labels: np.ndarray, t: np.ndarray, p: np.ndarray, dt: np.ndarray) -> np.ndarray:
+    starts, ends = run_lengths(labels)
+    table = np.full((starts.size, _RCOLS), np.nan)
+    charging, discharging = p < CHARGE_ACTIVE_THRESHOLD_KW, p > DISCHARGE_ACTIVE_THRESHOLD_KW
+    table[:, _RCODE] = labels[starts]
+    table[:, _RSTART] = t[starts]
+    table[:, _REND] = t[np.minimum(ends, t.size - 1)]
+    table[:, _RDURATION] = np.add.reduceat(dt, starts)
+    table[:, _RENERGY] = np.add.reduceat(p * dt, starts)
+    table[:, _RMAX] = np.maximum.reduceat(p, starts)
+    table[:, _RMIN] = np.minimum.reduceat(p, starts)
+    table[:, _RFIRST] = p[starts]
+    table[:, _RCHG_T] = np.add.reduceat(np.where(charging, dt, 0.0), starts)
+    table[:, _RCHG_E] = np.add.reduceat(np.where(charging, p * dt, 0.0), starts)
+    table[:, _RDIS_T] = np.add.reduceat(np.where(discharging, dt, 0.0), starts)
+    table[:, _RDIS_E] = np.add.reduceat(np.where(discharging, p * dt, 0.0), starts)
+    table[:, _RMARKS] = 0
+    return table
+
+
+# Consecutive rows with the same code become one row
+def _merge_runs(table: np.ndarray) -> np.ndarray:
+    codes = table[:, _RCODE]
+    starts = np.r_[0, np.flatnonzero(codes[1:] != codes[:-1]) + 1]
+    if starts.size == len(table):
+        return table
+    last = np.r_[starts[1:], len(table)] - 1
+    merged = table[starts].copy()
+    merged[:, _MERGE_LAST] = table[last][:, _MERGE_LAST]
+    merged[:, _MERGE_SUM] = np.add.reduceat(table[:, _MERGE_SUM], starts)
+    merged[:, _MERGE_MAX] = np.fmax.reduceat(table[:, _MERGE_MAX], starts)
+    merged[:, _MERGE_MIN] = np.fmin.reduceat(table[:, _MERGE_MIN], starts)
+    return merged
+
+
+# Rows flagged in `replace` take the code of the last unflagged row before
+# them; leading flagged rows take the first unflagged row's code
+# (first=None) or `first`
+def _relabel(table: np.ndarray, replace: np.ndarray, first=None) -> np.ndarray:
+    if not replace.any() or (replace.all() and first is None):
+        return table
+    src = np.maximum.accumulate(np.where(replace, -1, np.arange(len(table))))
+    table = table.copy()
+    if first is None:
+        src[src < 0] = np.argmin(replace)
+        table[:, _RCODE] = table[src, _RCODE]
+    else:
+        table[:, _RCODE] = np.where(src < 0, first, table[np.maximum(src, 0), _RCODE])
+    return _merge_runs(table)
+
+
+def _absorb_short_runs(table: np.ndarray, min_duration: float) -> np.ndarray:
+    short = table[:, _REND] - table[:, _RSTART] < min_duration
+    if short.all():
+        return table
+    return _relabel(table, short)
+
+
+# === Incremental labeling (steps 1-3) ===
+# update() labels every sample whose SEGMENT_SMOOTH_S neighbourhood and raw
+# run length are known and carries the rest (about one smoothing window)
+# into the next chunk. Timestamps must be increasing across chunks.
+class SegmentBuilder:
+    def __init__(self, min_duration: float = SEGMENT_MIN_DURATION_S, smooth_s: float = SEGMENT_SMOOTH_S):
+        self.min_duration = min_duration
+        self.smooth_s = smooth_s
+        self._t = np.array([])
+        self._p = np.array([])
+        self._done = 0        # carried samples before this index are labeled (smoothing context)
+        self._head = None     # start time of the carried raw run, if it began before the carry
+        self._runs = []       # labeled run tables
+        self.count = 0
+
+    def update(self, t, p):
+        t, p = np.asarray(t, float), np.asarray(p, float)
+        m = np.isfinite(t) & np.isfinite(p)
+        if not m.all():
+            t, p = t[m], p[m]
+        self.count += t.size
+        self._t = np.concatenate((self._t, t))
+        self._p = np.concatenate((self._p, p))
+        self._label(final=False)
+
+    def _label(self, final: bool):
+        t, p = self._t, self._p
+        n = t.size
+        if n - self._done < 1:
+            return
+        labels = classify_power(p)
+        end = n
+        if self.smooth_s:
+            w = self.smooth_s
+            starts, ends, durations = _run_durations(labels, t)
+            if self._head is not None:
+                durations[0] = t[min(ends[0], n - 1)] - self._head
+            smoothed = classify_power(_moving_average(t, p, w))
+            noisy = np.repeat(durations < w, ends - starts) & (labels != smoothed)
+            labels = np.where(noisy, smoothed, labels)
+            if not final:
+                # smoothing window not complete yet / last raw run may still be short
+                end = int(np.searchsorted(t, t[-1] - w / 2))
+                if durations[-1] < w:
+                    end = min(end, int(starts[-1]))
+        if not final:
+            end = min(end, n - 1)  # dt of the last sample needs the next one
+        if end <= self._done:
+            return
+
+        # the sample after `end` closes the last run (REND) and its dt
+        stop = min(end + 1, n)
+        dt = np.diff(t[self._done:stop]) if end < n else np.diff(t[self._done:], append=t[-1])
+        self._runs.append(_run_table(labels[self._done:end], t[self._done:stop], p[self._done:end], dt))
+        if final:
+            return
+
+        # carry the smoothing context of sample `end`; when its raw run began
+        # before that, only the run's start time is kept
+        keep = end
+        if self.smooth_s:
+            keep = int(np.searchsorted(t, t[end] - self.smooth_s / 2))
+            run = int(starts[np.searchsorted(starts, end, side="right") - 1])
+            run_start = self._head if run == 0 and self._head is not None else t[run]
+            self._head = run_start if run_start < t[keep] else None
+        self._t, self._p = t[keep:], p[keep:]
+        self._done = end - keep
+
+    # Returns: run aggregates of the whole log (after steps 4-5 merging)
+    def finish(self) -> np.ndarray:
+        self._label(final=True)
+        self._t = self._p = np.array([])
+        if not self._runs:
+            return np.empty((0, _RCOLS))
+        table = _merge_runs(np.concatenate(self._runs))
+        self._runs = []
+        if self.min_duration:
+            table = _absorb_short_runs(table, self.min_duration)
+        return table
+
+
+# === SoC per segment + confirmation (step 5) ===
+# Takes StateOfCharge in time-ordered chunks (sorted, like sanitize_series):
+#   - SoC at every segment start/end, as np.interp over the whole series
+#   - dSoC marks as in compute_charging_time(): np.gradient(soc) >
+#     DERIVATIVE_THRESHOLD, with the last two samples carried so the central
+#     differences across chunk borders are exact; first/last marked time and
+#     count per segment
+class SegmentSoc:
+    def __init__(self, table: np.ndarray, tolerance: float = SEGMENT_SOC_TOLERANCE):
+        self.table = table.copy()
+        self.tolerance = tolerance
+        self._starts = table[:, _RSTART]
+        self._x = np.r_[table[:, _RSTART], table[:, _REND]]
+        self._y = np.full(self._x.size, np.nan)
+        self._tail_t = np.array([])
+        self._tail_s = np.array([])
+        self._first_done = False
+        self.count = 0
+
+    def update(self, ts, soc):
+        ts, soc = np.asarray(ts, float), np.asarray(soc, float)
+        m = np.isfinite(ts) & np.isfinite(soc)
+        if not m.all():
+            ts, soc = ts[m], soc[m]
+        if ts.size == 0:
+            return
+        self.count += ts.size
+
+        # buffer = carried tail + chunk; tail[0] is done, tail[-1] still pending
+        bt, bs = np.r_[self._tail_t, ts], np.r_[self._tail_s, soc]
+        if not self._tail_t.size:
+            self._y[self._x < bt[0]] = bs[0]
+        inside = (self._x >= bt[0]) & (self._x <= bt[-1])
+        self._y[inside] = np.interp(self._x[inside], bt, bs)
+
+        if not self._first_done and bs.size >= 2:
+            self._mark(np.array([bs[1] - bs[0]]), bt[:1])  # forward difference at index 0
+            self._first_done = True
+        if bs.size >= 3:
+            self._mark((bs[2:] - bs[:-2]) / 2, bt[1:-1])
+        self._tail_t, self._tail_s = bt[-2:], bs[-2:]
+
+    def _mark(self, d, t):
+        t = t[d > DERIVATIVE_THRESHOLD]
+        if not len(self.table):
+            return
+        t = t[t <= self.table[-1, _REND]]
+        seg = np.searchsorted(self._starts, t, side="right") - 1
+        t, seg = t[seg >= 0], seg[seg >= 0]
+        if not t.size:
+            return
+        first = np.r_[0, np.flatnonzero(seg[1:] != seg[:-1]) + 1]  # t is sorted
+        last = np.r_[first[1:], seg.size] - 1
+        rows = seg[first]
+        self.table[rows, _RMARK0] = np.fmin(self.table[rows, _RMARK0], t[first])
+        self.table[rows, _RMARK1] = np.fmax(self.table[rows, _RMARK1], t[last])
+        self.table[rows, _RMARKS] += last - first + 1
+
+    # Returns: the confirmed segment table (SoC columns filled)
+    def finish(self) -> np.ndarray:
+        if self._tail_s.size == 2:
+            self._mark(np.array([self._tail_s[1] - self._tail_s[0]]), self._tail_t[1:])  # backward difference
+        if self._tail_t.size:
+            self._y[self._x > self._tail_t[-1]] = self._tail_s[-1]
+        table = self.table
+        table[:, _RSOC0], table[:, _RSOC1] = np.split(self._y, 2)
+        if self.count < 3:  # too little SoC to judge (compute_charging_time needs 3)
+            table[:, _RMARKS] = 0
+            return table
+        delta = table[:, _RSOC1] - table[:, _RSOC0]
+        codes = table[:, _RCODE]
+        against = ((codes == 1) & (delta < -self.tolerance)) | ((codes == 2) & (delta > self.tolerance))
+        return _relabel(table, against, first=0)
+
+
+# === Segment rows ===
+# table: SegmentBuilder.finish() / SegmentSoc.finish() result
+# Returns: one dict per segment (keys = SEGMENT_FIELDS), in time order.
+#          active_s / active_power_avg_kw: time with power beyond the phase's
+#          threshold and its time-weighted mean power (Charge/Discharge);
+#          charging_time_s: SoC-derivative span within a Charge segment
+def segment_rows(table: np.ndarray) -> list[dict]:
+    codes = table[:, _RCODE].astype(int)
+    duration, energy = table[:, _RDURATION], table[:, _RENERGY] / 3600.0
+    p_max, p_min = table[:, _RMAX], table[:, _RMIN]
+    peak = np.where(np.abs(p_min) > np.abs(p_max), p_min, p_max)
+    avg = np.divide(energy * 3600.0, duration, out=table[:, _RFIRST].copy(), where=duration > 0)
+    active_t = np.select([codes == 1, codes == 2], [table[:, _RCHG_T], table[:, _RDIS_T]], 0.0)
+    active_e = np.select([codes == 1, codes == 2], [table[:, _RCHG_E], table[:, _RDIS_E]], 0.0)
+    active_avg = np.divide(active_e, active_t, out=np.zeros(len(table)), where=active_t > 0)
+    charging_time = _charging_times(table)
+
+    def r(x, digits=2):
+        return round(float(x), digits) + 0.0  # no "-0.0" in reports
+
+    columns = zip(codes, table[:, _RSTART], table[:, _REND], duration, energy, avg, peak,
+                  table[:, _RSOC0], table[:, _RSOC1], active_t, active_avg, charging_time)
+    return [
+        {"segment": k + 1, "phase": PHASES[code], "start_s": r(a), "end_s": r(b), "duration_s": r(d),
+         "energy_kwh": r(e, 3), "power_avg_kw": r(pa), "power_peak_kw": r(pk),
+         "soc_start": r(s0), "soc_end": r(s1), "soc_delta": r(s1 - s0),
+         "active_s": r(at), "active_power_avg_kw": r(ap), "charging_time_s": r(ct)}
+        for k, (code, a, b, d, e, pa, pk, s0, s1, at, ap, ct) in enumerate(columns)
+    ]
+
+
+# SoC-derivative span per segment (compute_charging_time() semantics: at
+# least two marked samples), 0 for Idle / Discharge segments
+def _charging_times(table: np.ndarray) -> np.ndarray:
+    ok = (table[:, _RCODE] == 1) & (table[:, _RMARKS] >= 2)
+    return np.where(ok, np.nan_to_num(table[:, _RMARK1] - table[:, _RMARK0]), 0.0)
+
+
+# === Whole-log charge/discharge KPIs over the segments ===
+# Same names, units and rounding as compute_metrics.charging_kpis() /
+# discharge_kpis(), but every sum only runs over the segments of `phase`
+# ("Charge" or "Discharge"). soc_ok: enough SoC for "Charging Time" (>= 3
+# samples). Returns [] when the log has no segment of that phase.
+def phase_kpis(table: np.ndarray, phase: str, soc_ok: bool = True) -> list[dict]:
+    rows = table[table[:, _RCODE] == PHASES.index(phase)]
+    if not len(rows):
+        return []
+    if phase == "Charge":
+        out = []
+        if soc_ok:
+            charge_time = float(np.sum(_charging_times(rows)))
+            out.append({"name": "Charging Time", "value": round(charge_time, 2), "unit": "s"})
+        if np.any(rows[:, _RCHG_T] > 0):
+            avg_pow = float(np.sum(rows[:, _RCHG_E]) / np.sum(rows[:, _RCHG_T]))
+            out.append({"name": "Charging Power Avg", "value": round(avg_pow, 2), "unit": "kW"})
+        return out
+    if not np.any(rows[:, _RDIS_T] > 0):
+        return []
+    active_time = float(np.sum(rows[:, _RDIS_T]))
+    avg_power = float(np.sum(rows[:, _RDIS_E])) / active_time
+    return [
+        {"name": "DischargeActive Duration", "value": round(active_time, 2), "unit": "s"},
+        {"name": "DischargeActive Power Avg", "value": round(avg_power, 2), "unit": "kW"},
+    ]
+
+
+# Returns: (start, end) times of every segment
+def segment_bounds(table: np.ndarray):
+    return table[:, _RSTART], table[:, _REND]
+
+
+# Returns: phase code (see PHASES) of every segment
+def segment_codes(table: np.ndarray) -> np.ndarray:
+    return table[:, _RCODE].astype(int)
+
+
+# === Segment index (whole log in memory) ===
+# t, p:    Actual Power timestamps/samples (kW), sorted and finite
+# ts, soc: StateOfCharge timestamps/samples, sorted and finite (may be empty)
+# Returns: the confirmed segment table (see segment_rows / phase_kpis)
+def build_segment_table(t: np.ndarray, p: np.ndarray, ts=None, soc=None,
+                        min_duration: float = SEGMENT_MIN_DURATION_S,
+                        smooth_s: float = SEGMENT_SMOOTH_S) -> np.ndarray:
+    if p.size < 2:
+        return np.empty((0, _RCOLS))
+    builder = SegmentBuilder(min_duration, smooth_s)
+    builder.update(t, p)
+    table = builder.finish()
+    if ts is None or soc is None or not soc.size:
+        return table
+    confirm = SegmentSoc(table)
+    confirm.update(ts, soc)
+    return confirm.finish()
+
+
+def build_segments(t: np.ndarray, p: np.ndarray, ts=None, soc=None, **kwargs) -> list[dict]:
+    return segment_rows(build_segment_table(t, p, ts, soc, **kwargs))
+
+
+# === Per-phase totals (KPI rows) ===
+def segment_kpis(segments: list[dict]) -> list[dict]:
+    if not segments:
+        return []
+    codes = np.array([PHASES.index(s["phase"]) for s in segments])
+    time = np.bincount(codes, weights=[s["duration_s"] for s in segments], minlength=len(PHASES))
+    energy = np.bincount(codes, weights=[s["energy_kwh"] for s in segments], minlength=len(PHASES))
+
+    out = [{"name": "Segment Count", "value": len(segments), "unit": ""}]
+    for code, phase in enumerate(PHASES):
+        out.append({"name": f"{phase} Phase Time", "value": round(float(time[code]), 2), "unit": "s"})
+        if phase != "Idle":
+            out.append({"name": f"{phase} Phase Energy", "value": round(float(energy[code]), 3), "unit": "kWh"})
+    return out
@@ -0,0 +1,155 @@
+# # mf4_analyzer_modular/signal_cache.py
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+from mf4_analyzer_modular.signal_config import SIGNAL_CONFIG
+from mf4_analyzer_modular.signal_types import Signal
+
+# === Persistent Raw Signal Cache ===
+# Stores the raw signals returned by load_raw_signals() as plain .npy files,
+# one directory per log:
+#     <CACHE_DIR>/<key>/meta.json      units + file names per token
+#     <CACHE_DIR>/<key>/<n>.npy        samples / timestamps arrays
+# Hits are loaded with np.load(mmap_mode="r"), so a re-run on a cached log
+# maps the arrays read-only without decoding the MF4 or copying the data.
+# Timestamps shared between signals of one channel group are stored once.
+#
+# The key combines file size, mtime, content hash (ETag/CRC for remote and
+# archived logs), the channel mapping of the requested tokens and a non-default
+# sample dtype (--float32); changing any of them produces a new entry. Least
+# recently used entries are evicted once the cache exceeds CACHE_MAX_BYTES.
+
+CACHE_DIR = "./mf4_cache"
+CACHE_MAX_BYTES = 5 * 1024**3
+CACHE_FORMAT_VERSION = 1
+HASH_CHUNK_BYTES = 8 * 1024**2
+
+
+# === Content hash of a log file ===
+def file_digest(path: str) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_fingerprint(path: str) -> dict:
+    st = os.stat(path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "content": file_digest(path)}
+
+
+# fingerprint: identity of the log (default: file_fingerprint(path); see
+# input_sources.source_fingerprint for archives and remote objects)
+# dtype: float sample dtype of the entry (None = as decoded from the file)
+def cache_key(path: str, tokens: list[str], fingerprint: dict | None = None, dtype=None) -> str:
+    key = {
+        "version": CACHE_FORMAT_VERSION,
+        **(fingerprint or file_fingerprint(path)),
+        "channels": {token: SIGNAL_CONFIG[token] for token in tokens},
+    }
+    if dtype is not None:
+        key["dtype"] = np.dtype(dtype).str
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+# === Cache lookup ===
+# Returns: signal_data dict (same layout as load_raw_signals) or None on miss
+def load_cached_signals(key: str, cache_dir: str = CACHE_DIR):
+    entry = os.path.join(cache_dir, key)
+    meta_path = os.path.join(entry, "meta.json")
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {}
+        signal_data = {}
+        for token, info in meta["signals"].items():
+            for field in ("samples", "timestamps"):
+                fname = info[field]
+                if fname not in arrays:
+                    arrays[fname] = np.load(os.path.join(entry, fname), mmap_mode="r")
+            signal_data[token] = Signal(arrays[info["samples"]], arrays[info["timestamps"]], info["unit"])
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[WARN] Ignoring unreadable cache entry {key}: {e}")
+        shutil.rmtree(entry, ignore_errors=True)
+        return None
+
+    os.utime(meta_path)  # mark as recently used for LRU eviction
+    return signal_data
+
+
+# === Cache store ===
+# Written to a temporary directory first and renamed into place, so parallel
+# batch workers and interrupted runs never leave a half-written entry behind.
+def store_cached_signals(key: str, signal_data: dict, cache_dir: str = CACHE_DIR,
+                         max_bytes: int = CACHE_MAX_BYTES):
+    if any(np.asarray(s["samples"]).dtype.hasobject for s in signal_data.values()):
+        print("[WARN] Signal cache skipped: object-typed samples cannot be memory-mapped")
+        return
+
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = os.path.join(cache_dir, key)
+    if os.path.isdir(entry):
+        return
+
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=cache_dir)
+    try:
+        stored = {}  # id(array) -> file name, dedupes shared timestamps
+        meta = {"signals": {}}
+
+        def save(arr):
+            if id(arr) not in stored:
+                fname = f"{len(stored)}.npy"
+                data = np.ascontiguousarray(arr)
+                if data.dtype.metadata:  # asammdf dtype metadata: np.save would warn per array
+                    data = data.view(np.dtype(data.dtype.str))
+                np.save(os.path.join(tmp, fname), data, allow_pickle=False)
+                stored[id(arr)] = fname
+            return stored[id(arr)]
+
+        for token, sig in signal_data.items():
+            meta["signals"][token] = {
+                "samples": save(sig["samples"]),
+                "timestamps": save(sig["timestamps"]),
+                "unit": sig.get("unit", "")
+            }
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.rename(tmp, entry)
+    except OSError:
+        # Another worker stored the same key first (or the disk is full)
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    evict_cache(cache_dir, max_bytes)
+
+
+# === LRU eviction ===
+def _dir_size(path: str) -> int:
+    return sum(e.stat().st_size for e in os.scandir(path) if e.is_file())
+
+def evict_cache(cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+    entries = []
+    for e in os.scandir(cache_dir):
+        if not e.is_dir() or e.name.startswith("."):
+            continue
+        try:
+            last_used = os.stat(os.path.join(e.path, "meta.json")).st_mtime
+            entries.append((last_used, _dir_size(e.path), e.path))
+        except FileNotFoundError:
+            continue
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
@@ -1,40 +1,25 @@
 ## mf4_analyzer_modular/signal_extractor.py
+from itertools import groupby
 import numpy as np
-from scipy.interpolate import interp1d
 from mf4_analyzer_modular.signal_config import SIGNAL_CONFIG
 from mf4_analyzer_modular.metrics_list import SIGNAL_LIST
+from mf4_analyzer_modular.expression_engine import ExpressionGraph
+from mf4_analyzer_modular.signal_types import Signal
+from mf4_analyzer_modular.resampling import build_timebase, align_signals
+from mf4_analyzer_modular import instrumentation
 
 
-# === Safe Operation Helper ===
-def safe_op(a, b, ts_a, ts_b, op='/'):
-    try:
-        if len(a) > len(b):
-            interp = interp1d(ts_b, b, bounds_error=False, fill_value="extrapolate")
-            b_resampled = interp(ts_a)
-            a_resampled = a
-            t_common = ts_a
-        else:
-            interp = interp1d(ts_a, a, bounds_error=False, fill_value="extrapolate")
-            a_resampled = interp(ts_b)
-            b_resampled = b
-            t_common = ts_b
-
-        if op == '+':
-            result = a_resampled + b_resampled
-        elif op == '-':
-            result = a_resampled - b_resampled
-        elif op == '*':
-            result = a_resampled * b_resampled
-        elif op == '/':
-            result = a_resampled / np.clip(b_resampled, 1e-6, None)
-        else:
-            raise ValueError(f"Unsupported operation: {op}")
-
-        return result, t_common
-    except Exception as e:
-        print(f"[SAFE_OP ERROR] op={op}: {e}")
-        return np.array([]), np.array([])
+# === Compiled SIGNAL_LIST ===
+# Parsed once per process into an expression DAG (see expression_engine.py)
+_SIGNAL_GRAPH = None
 
+def get_signal_graph() -> ExpressionGraph:
+    global _SIGNAL_GRAPH
+    if _SIGNAL_GRAPH is None:
+        _SIGNAL_GRAPH = ExpressionGraph(SIGNAL_LIST, SIGNAL_CONFIG)
+        for name, err in _SIGNAL_GRAPH.errors.items():
+            print(f"[ERROR] Invalid SIGNAL_LIST entry {name}: {err}")
+    return _SIGNAL_GRAPH
 
 
 # === Detect user mode ===
@@ -52,28 +37,153 @@ def detect_mode(soc: np.ndarray) -> str:
     return "Idle"
 
 
+# === Channel Requirements ===
+# Raw SIGNAL_CONFIG tokens referenced by SIGNAL_LIST expressions
+def required_signals() -> list[str]:
+    return get_signal_graph().leaves()
+
+# MDF channel names to pass to load_mdf(..., channels=...)
+def required_channels() -> list[str]:
+    return [SIGNAL_CONFIG[token] for token in required_signals()]
+
+
+# === Bounded chunk reads ===
+# MDF.select()/get() with record_offset/record_count still load the whole
+# channel group before slicing. iter_get() walks the group's data blocks in
+# fragments of READ_FRAGMENT_BYTES (set through mdf.configure), so only one
+# fragment per channel is decoded at a time.
+# Note: changes the read fragment size of `mdf` for later reads as well.
+READ_FRAGMENT_BYTES = 1024**2
+
+
+def iter_channel(mdf, group: int, index: int, samples_only: bool = False,
+                 fragment_bytes: int = READ_FRAGMENT_BYTES):
+    mdf.configure(read_fragment_size=fragment_bytes)
+    return mdf.iter_get(group=group, index=index, samples_only=samples_only)
+
+
+# Channels of one group in lockstep: every step has the same records for all
+# of them (one data block per channel in flight).
+# Yields: (timestamps, [samples per channel index]) per fragment
+def iter_group_chunks(mdf, group: int, indexes: list[int], fragment_bytes: int = READ_FRAGMENT_BYTES):
+    first = iter_channel(mdf, group, indexes[0], fragment_bytes=fragment_bytes)
+    rest = [iter_channel(mdf, group, i, True, fragment_bytes) for i in indexes[1:]]
+    for sig, *others in zip(first, *rest):
+        yield sig.timestamps, [sig.samples] + [samples for samples, _ in others]
+
+
+# Unit from the channel's first record (samples_only chunks carry none)
+def channel_unit(mdf, group: int, index: int) -> str:
+    return getattr(mdf.get(group=group, index=index, record_count=1), "unit", "") or ""
+
+
+def _locate(mdf, tokens):
+    located = []
+    for token in tokens:
+        channel = SIGNAL_CONFIG[token]
+        try:
+            occurrences = mdf.whereis(channel)
+        except Exception as e:
+            print(f"[WARN] Failed to load: {token} -> {e}")
+            continue
+        if not occurrences:
+            print(f"[WARN] Failed to load: {token} -> channel '{channel}' not found")
+            continue
+        group, index = occurrences[0]
+        located.append((group, index, token, channel))
+    return sorted(located)
+
+
+# === Bulk Raw Signal Loading ===
+# Resolves every required channel to its (group, index) first and fetches all
+# of them with a single MDF.select() call, sorted by channel group, so each
+# data block is read and decompressed once instead of once per mdf.get().
+# Signals from the same group share one timestamps array (copy_master=False).
+# dtype (e.g. np.float32): float samples are cast fragment by fragment while
+# reading (see _load_cast), so the file's float64 arrays are never held in full.
+def load_raw_signals(mdf, tokens=None, dtype=None) -> dict:
+    tokens = tokens if tokens is not None else required_signals()
+    located = _locate(mdf, tokens)
+    if dtype is not None:
+        return _load_cast(mdf, located, dtype)
+
+    signal_data = {}
+    try:
+        sigs = mdf.select([(channel, group, index) for group, index, _, channel in located],
+                          copy_master=False)
+    except Exception as e:
+        # Fall back to per-channel reads so one bad channel does not drop all
+        print(f"[WARN] Bulk select failed, reading channels one by one: {e}")
+        sigs = []
+        for group, index, token, channel in located:
+            try:
+                sigs.append(mdf.get(channel, group, index))
+            except Exception as e:
+                print(f"[WARN] Failed to load: {token} -> {e}")
+                sigs.append(None)
+
+    for (_, _, token, _), sig in zip(located, sigs):
+        if sig is None:
+            continue
+        signal_data[token] = Signal(sig.samples, sig.timestamps, getattr(sig, 'unit', ''))
+    return signal_data
+
+
+# Chunked group reads, float samples cast to `dtype` per fragment (integer
+# and bool samples keep their type, timestamps stay float64). Peak memory is
+# the cast arrays plus one data block, instead of the full float64 decode.
+def _load_cast(mdf, located, dtype) -> dict:
+    signal_data = {}
+    for group, members in groupby(located, key=lambda x: x[0]):
+        members = list(members)
+        try:
+            signal_data.update(_read_cast(mdf, group, members, dtype))
+        except Exception as e:
+            # Fall back to per-channel reads so one bad channel does not drop all
+            print(f"[WARN] Group read failed, reading channels one by one: {e}")
+            for member in members:
+                try:
+                    signal_data.update(_read_cast(mdf, group, [member], dtype))
+                except Exception as e:
+                    print(f"[WARN] Failed to load: {member[2]} -> {e}")
+    return signal_data
+
+
+# One channel after the other, so only one data block is in flight; the
+# group's timestamps are read with the first channel
+def _read_cast(mdf, group: int, members: list, dtype) -> dict:
+    out = {}
+    timestamps = None
+    for _, index, token, _ in members:
+        ts_chunks, chunks = [], []
+        for chunk in iter_channel(mdf, group, index, samples_only=timestamps is not None):
+            if timestamps is None:
+                ts_chunks.append(np.array(chunk.timestamps, dtype=float))
+                samples = chunk.samples
+            else:
+                samples = chunk[0]
+            chunks.append(np.array(samples, dtype=dtype if samples.dtype.kind == "f" else samples.dtype))
+        if timestamps is None:
+            timestamps = np.concatenate(ts_chunks) if ts_chunks else np.array([])
+            del ts_chunks
+        samples = np.concatenate(chunks) if chunks else np.array([], dtype=dtype)
+        del chunks
+        out[token] = Signal(samples, timestamps, channel_unit(mdf, group, index))
+    return out
+
+
 # === Signal Extraction and Evaluation ===
 def extract_signals(mdf):
-    signal_data = {}
+    return evaluate_signals(load_raw_signals(mdf))
+
+
+# timebase: "native" (per-expression alignment) or a shared-grid mode from
+# resampling.TIMEBASE_MODES, in which case every raw signal is resampled once
+def evaluate_signals(signal_data: dict, timebase: str = "native", rate_hz=None, master=None):
     derived = {}
     results = []
     metric_map = {}
 
-    # Load raw signals
-    for entry in SIGNAL_LIST:
-        sig_expr = entry["signal"]
-        for token in sig_expr.replace("*", " ").replace("-", " ").replace("/", " ").split():
-            if token in SIGNAL_CONFIG and token not in signal_data:
-                try:
-                    sig = mdf.get(SIGNAL_CONFIG[token])
-                    signal_data[token] = {
-                        "samples": sig.samples,
-                        "timestamps": sig.timestamps,
-                        "unit": getattr(sig, 'unit', '')
-                    }
-                except Exception as e:
-                    print(f"[WARN] Failed to load: {token} -> {e}")
-
     # === Detect operating mode ===
     soc_signal = signal_data.get("StateOfCharge")
     if soc_signal:
@@ -81,80 +191,49 @@ def extract_signals(mdf):
     else:
         mode = "Unknown"
 
-    # Evaluate entries
+    # === Shared time base ===
+    if timebase != "native":
+        grid = build_timebase(signal_data, timebase, rate_hz=rate_hz, master=master)
+        signal_data = align_signals(signal_data, grid)
+        print(f"[i] Time base: {timebase} ({len(grid)} samples)")
+
+    # Evaluate all entries in one topologically ordered pass
+    names = [entry.get("name", entry["signal"]) for entry in SIGNAL_LIST]
+    names = [n for n in names
+             # === Conditional metric exclusion ===
+             if not (n in ["ChargeCurrentLimit", "ChargePowerLimit"] and mode != "Charging")]
+    timings = {} if instrumentation.active() else None
+    values, errors = get_signal_graph().evaluate(signal_data, names, timings=timings)
+    for name, seconds in (timings or {}).items():
+        instrumentation.record_signal(name, seconds, len(values.get(name, {}).get("samples", ())))
+    instrumentation.count("signals_evaluated", len(values))
+    instrumentation.count("signal_errors", len(errors))
+
     for entry in SIGNAL_LIST:
         name = entry.get("name", entry["signal"])
-        expr = entry["signal"]
-        metric = entry["metric"]
-
-
-        # === Conditional metric exclusion ===
-        if name in ["ChargeCurrentLimit", "ChargePowerLimit"] and mode != "Charging":
-            continue # Skip charge limits if not charging
-        
+        if name in errors:
+            print(f"[ERROR] Failed to evaluate {name}: {errors[name]}")
+        if name not in values:
+            continue
 
+        signal = values[name]
         try:
-            if '-' in expr:
-                a, b = [x.strip() for x in expr.split('-')]
-                a_data = derived.get(a) or signal_data.get(a)
-                b_data = derived.get(b) or signal_data.get(b)
-                if not a_data or not b_data:
-                    raise ValueError(f"Missing signal in expression '{expr}': {a if not a_data else b}")
-                samples, timestamps = safe_op(a_data["samples"], b_data["samples"],
-                                              a_data["timestamps"], b_data["timestamps"], op='-')
-                unit = a_data.get("unit", "")
-
-            elif '*' in expr:
-                l, r = [x.strip() for x in expr.split('*')]
-                l_data = derived.get(l) or signal_data.get(l)
-                r_data = derived.get(r) or signal_data.get(r)
-                if not l_data or not r_data:
-                    raise ValueError(f"Missing signal in expression '{expr}': {l if not l_data else r}")
-                samples, timestamps = safe_op(l_data["samples"], r_data["samples"],
-                                              l_data["timestamps"], r_data["timestamps"], op='*')
-                unit = entry.get("unit_override", l_data.get("unit", ""))
-
-            elif '/' in expr:
-                n, d = [x.strip() for x in expr.split('/')]
-                n_data = derived.get(n) or signal_data.get(n)
-                d_data = derived.get(d) or signal_data.get(d)
-                if not n_data or not d_data:
-                    raise ValueError(f"Missing signal in expression '{expr}': {n if not n_data else d}")
-                samples, timestamps = safe_op(n_data["samples"], d_data["samples"],
-                                              n_data["timestamps"], d_data["timestamps"], op='/')
-                unit = entry.get("unit_override", "") or n_data.get("unit", "")
-
-            else:
-                src = derived.get(expr) or signal_data.get(expr)
-                if not src:
-                    raise ValueError(f"Missing signal: {expr}")
-                samples = src["samples"]
-                timestamps = src["timestamps"]
-                unit = src.get("unit", "")
-
-            samples = samples * entry.get("scaling_factor", 1)
-            unit = entry.get("unit_override", unit)
-
+            lo, hi = signal.min_max()
             stat = {
-                "metric": metric,
+                "metric": entry["metric"],
                 "name": name,
-                "unit": unit,
-                "samples": samples,
-                "timestamps": timestamps,
-                "min": round(float(np.min(samples)), 2),
-                "max": round(float(np.max(samples)), 2),
-                "delta": round(float(np.max(samples) - np.min(samples)), 2)
-            }
-
-            results.append(stat)
-            derived[name] = {
-                "samples": samples,
-                "timestamps": timestamps,
-                "unit": unit
+                "unit": signal.unit,
+                "signal": signal,  # samples/timestamps live on the Signal (shared, not copied)
+                "min": round(lo, 2),
+                "max": round(hi, 2),
+                "delta": round(hi - lo, 2)
             }
-            metric_map.setdefault(metric, []).append(stat)
-
         except Exception as e:
             print(f"[ERROR] Failed to evaluate {name}: {e}")
+            continue
+
+        results.append(stat)
+        derived[name] = values[name]
+        metric_map.setdefault(entry["metric"], []).append(stat)
 
     return results, metric_map, derived
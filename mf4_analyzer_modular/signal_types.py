@@ -0,0 +1,77 @@
+# # mf4_analyzer_modular/signal_types.py
+import numpy as np
+from mf4_analyzer_modular.decimation import decimate
+
+# === Signal Container ===
+# One raw or derived signal. Replaces the {"samples", "timestamps", "unit"}
+# dicts that used to travel through signal_data / derived / metric_map:
+#   - __slots__, no per-instance dict
+#   - `timestamps` is the raster array, shared (same object) by every signal
+#     of one channel group / expression raster; never copied per signal
+#   - `scale` is applied lazily: an entry like "ChargePowerLimit * -1" keeps
+#     the raw samples and only computes samples*scale when `.samples` is
+#     read. The scaled copy is not kept on the signal (it would double its
+#     memory); min/max, block stats and plot decimation work on the raw
+#     samples
+#   - still readable like the old dicts (sig["samples"], sig.get("unit"),
+#     "samples" in sig), so code that expects those keeps working
+
+_FIELDS = ("samples", "timestamps", "unit")
+
+
+class Signal:
+    __slots__ = ("timestamps", "unit", "scale", "_raw")
+
+    def __init__(self, samples, timestamps, unit: str = "", scale: float = 1.0):
+        self._raw = samples
+        self.timestamps = timestamps
+        self.unit = unit or ""
+        self.scale = float(scale)
+
+    @property
+    def raw(self):
+        return self._raw
+
+    @property
+    def samples(self):
+        if self.scale == 1.0:
+            return self._raw
+        return np.multiply(self._raw, self.scale, dtype=np.float32 if self._raw.dtype == np.float32 else np.float64)
+
+    def __len__(self):
+        return len(self._raw)
+
+    def __repr__(self):
+        return f"Signal({len(self._raw)} x {self._raw.dtype}, unit={self.unit!r}, scale={self.scale:g})"
+
+    # (min, max) of the scaled samples without materializing them
+    def min_max(self):
+        lo, hi = float(np.min(self._raw)), float(np.max(self._raw))
+        if self.scale == 1.0:
+            return lo, hi
+        lo, hi = lo * self.scale, hi * self.scale
+        return (lo, hi) if self.scale >= 0 else (hi, lo)
+
+    # Plot trace: decimated on the raw samples (minmax/LTTB pick the same
+    # indices for any non-zero scale), scaled afterwards
+    def decimated(self, max_points: int, method: str = "minmax"):
+        timestamps, samples = decimate(self.timestamps, self._raw, max_points, method)
+        if self.scale != 1.0:
+            samples = np.multiply(samples, self.scale)
+        return timestamps, samples
+
+    # --- read-only dict compatibility ---
+    def __getitem__(self, key):
+        if key not in _FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in _FIELDS else default
+
+    def __contains__(self, key):
+        return key in _FIELDS
+
+    def keys(self):
+        return _FIELDS
+
@@ -0,0 +1,181 @@
+# # mf4_analyzer_modular/staged_pipeline.py
+import time
+import queue
+import threading
+from collections import deque
+from contextlib import nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor
+from mf4_analyzer_modular.file_pipeline import analyze_file, export_results, _options
+from mf4_analyzer_modular.input_sources import source_name
+from mf4_analyzer_modular.instrumentation import recording, write_json_log, INSTRUMENT_LOG_PATH
+
+# === Staged Pipeline ===
+# Runs a list of logs as two overlapping stages instead of one file at a time:
+#
+#     extract thread:   load/decode -> evaluate -> KPIs     (analyze_file)
+#                           |  bounded queue (STAGE_QUEUE_DEPTH results)
+#     export processes: CSV -> KPI store -> block index -> plots -> PDF
+#
+# While file N is being exported, file N+1 is already being decoded. Export
+# (plot rendering, fpdf) is mostly pure Python and holds the GIL, so it runs
+# in a small process pool (STAGE_EXPORT_WORKERS processes) and never slows
+# the extract thread down; the analyzed result is pickled over once (the
+# Signal containers share their arrays, so each array is sent once).
+#
+# Back-pressure: the extract thread blocks once `depth` analyzed results
+# wait for export, and the main thread hands a result to the pool only when
+# one of its `export_workers` processes is free, so at most
+# depth + export_workers + 1 logs are held in memory. Input is any iterable
+# of (index, path), e.g. a queue shared by several worker processes
+# (staged_worker, see batch_runner), so a slow file never holds back files
+# another worker could take. Each finished file is handed to `on_row` as
+# (index, manifest row like batch_runner.process_and_report()), in input
+# order.
+#
+# Instrumentation: the recorder is per process and only the extract thread
+# uses it in this process, so --instrument / --pdf-appendix work staged. The
+# extract thread records analyze_file, the export process continues the same
+# report and writes the one JSON line per file. Profilers attach to a single
+# thread/process and stay unstaged (batch_runner).
+
+STAGE_QUEUE_DEPTH = 2
+STAGE_EXPORT_WORKERS = 1
+_DONE = object()
+
+
+def _manifest_row(path: str, mode: str = "", elapsed_s: float = 0.0, error: Exception | None = None) -> dict:
+    return {"file": source_name(path), "status": "failed" if error else "ok", "mode": mode,
+            "elapsed_s": round(elapsed_s, 2), "error": f"{type(error).__name__}: {error}" if error else ""}
+
+
+def print_row(row: dict):
+    mark = "✓" if row["status"] == "ok" else "ERROR"
+    print(f"[{mark}] {row['file']} ({row['elapsed_s']} s) {row['error']}".rstrip())
+
+
+# === Extract stage (producer thread) ===
+# Puts (index, path, result or exception, seconds, instrumentation report)
+# per file, then _DONE. `stop` is set by the consumer when it gives up
+# (e.g. Ctrl+C).
+def _extract(items, options: dict, out: queue.Queue, stop: threading.Event):
+    def put(item):
+        while not stop.is_set():
+            try:
+                out.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    for index, path in items:
+        start = time.perf_counter()
+        recorder = None
+        try:
+            with _recording(path, options, log_path=None) as recorder:
+                result = analyze_file(path, options)
+            item = (index, path, result, time.perf_counter() - start, recorder and recorder.report)
+            del result
+        except Exception as e:
+            if recorder:
+                write_json_log(recorder.report)  # no export follows
+            item = (index, path, e, time.perf_counter() - start, None)
+        if not put(item):
+            return
+        del item
+    put(_DONE)
+
+
+def _recording(path: str, options: dict, log_path: str | None = INSTRUMENT_LOG_PATH):
+    if options["instrument"] or options["pdf_appendix"]:
+        return recording(source_name(path), log_path=log_path)
+    return nullcontext()
+
+
+# === Export stage (runs in an export process) ===
+# report: the extract thread's instrumentation, continued and written here
+# Returns: manifest row
+def _export(path: str, result: dict, options: dict, extract_s: float, report: dict | None) -> dict:
+    start = time.perf_counter()
+    try:
+        with _recording(path, options) as recorder:
+            if recorder and report:
+                recorder.merge(report)
+            export_results(result, options)
+        return _manifest_row(path, result["mode"], extract_s + time.perf_counter() - start)
+    except Exception as e:
+        return _manifest_row(path, result["mode"], extract_s + time.perf_counter() - start, e)
+
+
+# === Extract + export stages over (index, path) items ===
+def run_stages(items, on_row, options: dict | None = None, depth: int = STAGE_QUEUE_DEPTH,
+               export_workers: int = STAGE_EXPORT_WORKERS):
+    options = _options(options)
+    export_workers = max(1, export_workers)
+    results = queue.Queue(maxsize=max(1, depth))
+    stop = threading.Event()
+    producer = threading.Thread(target=_extract, args=(items, options, results, stop),
+                                name="mf4-extract", daemon=True)
+    producer.start()
+
+    pending = deque()  # (index, path, mode, extract_s, future), input order
+
+    def report_oldest():
+        index, path, mode, extract_s, fut = pending.popleft()
+        try:
+            row = fut.result()
+        except Exception as e:  # export process crashed (e.g. killed by OOM)
+            row = _manifest_row(path, mode, extract_s, e)
+        on_row(index, row)
+
+    try:
+        with ProcessPoolExecutor(max_workers=export_workers) as exporter:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+                index, path, result, extract_s, report = item
+                del item
+                if isinstance(result, Exception):
+                    fut = Future()
+                    fut.set_result(_manifest_row(path, elapsed_s=extract_s, error=result))
+                    pending.append((index, path, "", extract_s, fut))
+                else:
+                    while len(pending) >= export_workers:
+                        report_oldest()
+                    try:
+                        fut = exporter.submit(_export, path, result, options, extract_s, report)
+                    except Exception as e:  # pool broken by an earlier crash
+                        fut = Future()
+                        fut.set_exception(e)
+                    pending.append((index, path, result["mode"], extract_s, fut))
+                    del result  # the export process has its own copy
+                while pending and pending[0][4].done():
+                    report_oldest()
+            while pending:
+                report_oldest()
+    finally:
+        stop.set()
+        producer.join()
+
+
+# === Run logs through the staged pipeline (this process) ===
+# Returns: manifest rows (one per file, in `paths` order)
+def run_staged(paths: list[str], options: dict | None = None, depth: int = STAGE_QUEUE_DEPTH,
+               report: bool = True, export_workers: int = STAGE_EXPORT_WORKERS) -> list[dict]:
+    rows = []
+
+    def on_row(_, row):
+        rows.append(row)  # run_stages reports in input order
+        if report:
+            print_row(row)
+
+    run_stages(enumerate(paths), on_row, options, depth, export_workers)
+    return rows
+
+
+# === Worker process entry point (batch --staged) ===
+# todo: shared queue of (index, path), one None per worker as end marker
+# done: receives (index, manifest row) per finished file
+def staged_worker(todo, done, options: dict | None = None, depth: int = STAGE_QUEUE_DEPTH,
+                  export_workers: int = STAGE_EXPORT_WORKERS):
+    run_stages(iter(todo.get, None), lambda index, row: done.put((index, row)), options, depth, export_workers)
@@ -0,0 +1,379 @@
+# # mf4_analyzer_modular/streaming_metrics.py
+import numpy as np
+from mf4_analyzer_modular.signal_config import SIGNAL_CONFIG
+from mf4_analyzer_modular.metrics_list import SIGNAL_LIST
+from mf4_analyzer_modular.signal_extractor import (
+    get_signal_graph, detect_mode, iter_group_chunks, channel_unit, READ_FRAGMENT_BYTES
+)
+from mf4_analyzer_modular.compute_metrics import DERIVATIVE_THRESHOLD
+from mf4_analyzer_modular.segmentation import SegmentBuilder, SegmentSoc, segment_rows, segment_kpis, phase_kpis
+from mf4_analyzer_modular.block_index import BLOCK_WINDOW_S, window_stats
+from mf4_analyzer_modular.summary_generator import format_summary
+
+# === Streaming KPI Computation ===
+# Bounded-memory alternative to evaluate_signals() + compute_*_metrics() for
+# logs larger than RAM. Channels are read through fragment iterators
+# (signal_extractor.iter_group_chunks: mdf.iter_get with the read fragment
+# size capped at STREAM_FRAGMENT_BYTES; select()/get() with record_offset
+# would load the whole group first) and every SIGNAL_LIST entry and KPI is
+# reduced into running accumulators. Memory depends on the fragment size and
+# the channels per group (one data block in flight per channel), not on the
+# log length. No sample arrays are kept, so there is nothing to plot.
+#
+# Results match the in-memory path, including
+#   - phase segments: Actual Power chunks feed segmentation.SegmentBuilder;
+#     the SoC confirmation (segmentation.SegmentSoc) needs the segment
+#     boundaries, so it reads the StateOfCharge entry in a second pass
+#   - charge/discharge KPIs: summed over the Charge/Discharge segments
+#     (segmentation.phase_kpis), as in metric_registry
+#   - block stats and events: per-window stats of every chunk, windows cut
+#     by a chunk border are combined at the end
+#
+# Each entry is evaluated on the raster of its operand with the most records
+# (as in the in-memory path). Entries sharing that raster are evaluated in one
+# pass over its channel group; operands from other groups are read through a
+# forward-only window and interpolated onto each chunk.
+
+STREAM_FRAGMENT_BYTES = READ_FRAGMENT_BYTES
+
+
+# === Running accumulators ===
+class RunningStats:
+    def __init__(self):
+        self.min = None
+        self.max = None
+
+    def update(self, x):
+        if len(x) == 0:
+            return
+        lo, hi = float(np.min(x)), float(np.max(x))
+        self.min = lo if self.min is None or lo < self.min or np.isnan(lo) else self.min
+        self.max = hi if self.max is None or hi > self.max or np.isnan(hi) else self.max
+
+
+class SquareMean:
+    # RMS / peak-abs over all samples (no sanitizing, as compute_rms_power)
+    def __init__(self):
+        self.sumsq = 0.0
+        self.count = 0
+        self.peak = None
+
+    def update(self, x):
+        if len(x) == 0:
+            return
+        x = np.asarray(x, float)
+        self.sumsq += float(np.sum(np.square(x)))
+        self.count += len(x)
+        i = int(np.argmax(np.abs(x)))
+        if self.peak is None or abs(x[i]) > abs(self.peak):
+            self.peak = float(x[i])
+
+    @property
+    def rms(self):
+        return float(np.sqrt(self.sumsq / self.count)) if self.count else None
+
+
+class DerivativeSpan:
+    # Streaming np.gradient(soc) > DERIVATIVE_THRESHOLD: the last two samples
+    # are carried so central differences across chunk borders are exact.
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.count = 0
+        self.first_t = None
+        self.last_t = None
+        self.n_active = 0
+        self._first_done = False
+        self._tail_t = np.array([])
+        self._tail_s = np.array([])
+
+    def _mark(self, d, t):
+        idx = np.flatnonzero(d > self.threshold)
+        if len(idx):
+            if self.first_t is None:
+                self.first_t = float(t[idx[0]])
+            self.last_t = float(t[idx[-1]])
+            self.n_active += len(idx)
+
+    def update(self, t, s):
+        t, s = np.asarray(t, float), np.asarray(s, float)
+        m = np.isfinite(t) & np.isfinite(s)
+        t, s = t[m], s[m]
+        if len(t) == 0:
+            return
+        self.count += len(t)
+        # buffer = carried tail + chunk; tail[0] is done, tail[-1] still pending
+        bt = np.concatenate((self._tail_t, t))
+        bs = np.concatenate((self._tail_s, s))
+        if not self._first_done and len(bs) >= 2:
+            self._mark(np.array([bs[1] - bs[0]]), bt[:1])  # forward difference at index 0
+            self._first_done = True
+        if len(bs) >= 3:
+            self._mark((bs[2:] - bs[:-2]) / 2, bt[1:-1])
+        self._tail_t, self._tail_s = bt[-2:], bs[-2:]
+
+    def finish(self):
+        if len(self._tail_s) == 2:
+            self._mark(np.array([self._tail_s[1] - self._tail_s[0]]), self._tail_t[1:])  # backward difference
+        self._tail_t = self._tail_s = np.array([])
+
+    @property
+    def charging_time(self):
+        if self.count < 3 or self.n_active < 2:
+            return 0.0
+        return self.last_t - self.first_t
+
+
+class WindowStats:
+    # Per-window min/max/mean/count (block_index.window_stats) of one signal;
+    # a window cut by a chunk border is combined in result()
+    def __init__(self, t0, window_s=BLOCK_WINDOW_S):
+        self.t0 = t0
+        self.window_s = window_s
+        self._parts = []
+
+    def update(self, t, x):
+        ids, lo, hi, mean, n = window_stats(t, x, self.t0, self.window_s)
+        if ids.size:
+            self._parts.append((ids, lo, hi, mean * n, n))
+
+    def result(self):
+        if not self._parts:
+            return None
+        ids, lo, hi, total, n = (np.concatenate(c) for c in zip(*self._parts))
+        if np.any(ids[1:] < ids[:-1]):
+            order = np.argsort(ids, kind="stable")
+            ids, lo, hi, total, n = ids[order], lo[order], hi[order], total[order], n[order]
+        starts = np.r_[0, np.flatnonzero(ids[1:] != ids[:-1]) + 1]
+        samples = np.add.reduceat(n, starts)
+        return {"block": ids[starts], "min": np.minimum.reduceat(lo, starts),
+                "max": np.maximum.reduceat(hi, starts),
+                "mean": np.add.reduceat(total, starts) / samples, "samples": samples}
+
+
+# === Chunked channel group reader ===
+class _GroupReader:
+    def __init__(self, mdf, group, channels, fragment_bytes):
+        self.channels = channels  # [(token, index)]
+        self.units = {token: channel_unit(mdf, group, index) for token, index in channels}
+        self._chunks = iter_group_chunks(mdf, group, [index for _, index in channels], fragment_bytes)
+
+    # Returns: (timestamps, {token: samples}) or None when exhausted
+    def read(self):
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return None
+        ts, samples = chunk
+        return ts, {token: s for (token, _), s in zip(self.channels, samples)}
+
+
+# === Forward-only window over a foreign group ===
+# Keeps just enough samples to interpolate onto the current reference chunk;
+# beyond the channel's own time range it extrapolates linearly like interp1d.
+class _GroupWindow:
+    def __init__(self, reader):
+        self.reader = reader
+        self.ts = np.array([])
+        self.samples = {token: np.array([]) for token, _ in reader.channels}
+        self.done = False
+
+    def _fill_until(self, t_end):
+        while not self.done and (len(self.ts) == 0 or self.ts[-1] < t_end):
+            chunk = self.reader.read()
+            if chunk is None:
+                self.done = True
+                break
+            ts, values = chunk
+            self.ts = np.concatenate((self.ts, ts))
+            for token in self.samples:
+                self.samples[token] = np.concatenate((self.samples[token], np.asarray(values[token], float)))
+
+    def _trim_before(self, t_start):
+        keep = max(0, min(np.searchsorted(self.ts, t_start, side="right") - 1, len(self.ts) - 2))
+        self.ts = self.ts[keep:]
+        for token in self.samples:
+            self.samples[token] = self.samples[token][keep:]
+
+    def at(self, ts):
+        self._fill_until(ts[-1])
+        out = {}
+        for token, fp in self.samples.items():
+            out[token] = _interp_extrapolate(ts, self.ts, fp)
+        self._trim_before(ts[-1])
+        return out
+
+
+def _interp_extrapolate(x, xp, fp):
+    if len(xp) == 0:
+        return np.full(len(x), np.nan)
+    if len(xp) == 1:
+        return np.full(len(x), fp[0])
+    y = np.interp(x, xp, fp)
+    lo, hi = x < xp[0], x > xp[-1]
+    if np.any(lo):
+        y[lo] = fp[0] + (x[lo] - xp[0]) * (fp[1] - fp[0]) / (xp[1] - xp[0])
+    if np.any(hi):
+        y[hi] = fp[-1] + (x[hi] - xp[-1]) * (fp[-1] - fp[-2]) / (xp[-1] - xp[-2])
+    return y
+
+
+# === Mode from first/last SoC record (no full read) ===
+# get() with record_offset/record_count=1 reads just the block holding it
+def _stream_mode(mdf, located):
+    if "StateOfCharge" not in located:
+        return "Unknown"
+    group, index = located["StateOfCharge"]
+    total = mdf.groups[group].channel_group.cycles_nr
+    if total == 0:
+        return "Unknown"
+    first = mdf.get(group=group, index=index, record_offset=0, record_count=1).samples
+    last = mdf.get(group=group, index=index, record_offset=total - 1, record_count=1).samples
+    return detect_mode(np.concatenate((first, last)))
+
+
+# === Evaluate entries chunk by chunk ===
+# names: SIGNAL_LIST entries evaluated on the raster of channel group `group`
+# Yields: (timestamps, {name: evaluated signal}) per chunk
+def _evaluate_chunks(mdf, graph, located, group, names, fragment_bytes):
+    channels = {}
+    for token in graph.leaves(names):
+        g, idx = located[token]
+        channels.setdefault(g, []).append((token, idx))
+    reader = _GroupReader(mdf, group, channels.pop(group), fragment_bytes)
+    windows = [_GroupWindow(_GroupReader(mdf, g, chs, fragment_bytes)) for g, chs in channels.items()]
+
+    while (chunk := reader.read()) is not None:
+        ts, own = chunk
+        if len(ts) == 0:
+            continue
+        chunk_data = {token: {"samples": s, "timestamps": ts, "unit": reader.units[token]}
+                      for token, s in own.items()}
+        for window in windows:
+            for token, s in window.at(ts).items():
+                chunk_data[token] = {"samples": s, "timestamps": ts, "unit": window.reader.units[token]}
+        values, _ = graph.evaluate(chunk_data, names)
+        yield ts, values
+
+
+# === Streaming extraction + KPIs ===
+# Returns: {"data", "summary", "mode", "segments", "blocks"} in the same
+#          format as the in-memory path (signal rows carry min/max/delta,
+#          no samples; blocks as block_index.build_blocks)
+def compute_streaming_kpis(mdf, fragment_bytes: int = STREAM_FRAGMENT_BYTES,
+                           window_s: float = BLOCK_WINDOW_S) -> dict:
+    graph = get_signal_graph()
+
+    located = {}
+    for token in graph.leaves():
+        occurrences = mdf.whereis(SIGNAL_CONFIG[token])
+        if occurrences:
+            located[token] = occurrences[0]
+        else:
+            print(f"[WARN] Failed to load: {token} -> channel '{SIGNAL_CONFIG[token]}' not found")
+
+    mode = _stream_mode(mdf, located)
+    print(f"[i] Mode: {mode}")
+
+    names = [entry.get("name", entry["signal"]) for entry in SIGNAL_LIST]
+    names = [n for n in names
+             if not (n in ["ChargeCurrentLimit", "ChargePowerLimit"] and mode != "Charging")]
+
+    # Assign every entry to the channel group of its longest operand
+    by_group = {}
+    for name in names:
+        leaves = graph.leaves([name])
+        missing = [t for t in leaves if t not in located]
+        if not leaves or missing:
+            print(f"[ERROR] Failed to evaluate {name}: Missing signal: {missing[0] if missing else name}")
+            continue
+        ref = max(leaves, key=lambda t: mdf.groups[located[t][0]].channel_group.cycles_nr)
+        by_group.setdefault(located[ref][0], []).append(name)
+
+    # Block windows are aligned to the log start (first record of any raster)
+    t0 = min((float(mdf.get_master(g, record_count=1)[0]) for g in by_group
+              if mdf.groups[g].channel_group.cycles_nr), default=0.0)
+
+    stats = {name: RunningStats() for group_names in by_group.values() for name in group_names}
+    windows = {name: WindowStats(t0, window_s) for name in stats}
+    units = {}
+    power_sq, current_sq = SquareMean(), SquareMean()
+    soc_span = DerivativeSpan(DERIVATIVE_THRESHOLD)
+    segmenter = SegmentBuilder()
+    soc_ends = {}
+
+    for group, group_names in by_group.items():
+        for ts, values in _evaluate_chunks(mdf, graph, located, group, group_names, fragment_bytes):
+            for name in group_names:
+                if name not in values:
+                    continue
+                samples = values[name]["samples"]
+                units.setdefault(name, values[name]["unit"])
+                stats[name].update(samples)
+                windows[name].update(ts, samples)
+
+                # KPI inputs (same derived names the compute_* functions use)
+                if name == "Actual Power":
+                    power_sq.update(samples)
+                    segmenter.update(ts, samples)
+                elif name == "PackCurrent":
+                    current_sq.update(samples)
+                elif name == "StateOfCharge":
+                    soc_span.update(ts, samples)
+                    soc_ends.setdefault("first", (float(ts[0]), float(samples[0])))
+                    soc_ends["last"] = (float(ts[-1]), float(samples[-1]))
+        if "StateOfCharge" in group_names:
+            soc_span.finish()
+
+    # --- phase segments; the SoC confirmation needs a second pass ---
+    table = None
+    if segmenter.count >= 2:
+        table = segmenter.finish()
+        soc_group = next((g for g, group_names in by_group.items() if "StateOfCharge" in group_names), None)
+        if soc_group is not None and soc_span.count:
+            confirm = SegmentSoc(table)
+            for ts, values in _evaluate_chunks(mdf, graph, located, soc_group, ["StateOfCharge"], fragment_bytes):
+                if "StateOfCharge" in values:
+                    confirm.update(ts, values["StateOfCharge"]["samples"])
+            table = confirm.finish()
+    segments = segment_rows(table) if table is not None else []
+
+    # --- signal rows and block stats in SIGNAL_LIST order ---
+    data = []
+    blocks = {"t0": t0, "window_s": window_s, "signals": {}}
+    for entry in SIGNAL_LIST:
+        name = entry.get("name", entry["signal"])
+        st = stats.get(name)
+        if st is None or st.min is None:
+            continue
+        data.append({
+            "metric": entry["metric"],
+            "name": name,
+            "unit": units.get(name, ""),
+            "min": round(st.min, 2),
+            "max": round(st.max, 2),
+            "delta": round(st.max - st.min, 2)
+        })
+        window = windows[name].result()
+        if window is not None and name not in blocks["signals"]:
+            blocks["signals"][name] = {"unit": units.get(name, ""), **window}
+
+    # --- computed KPIs (same order and gating as metric_registry) ---
+    kpis = []
+    if power_sq.count:
+        kpis.append({"name": "Power RMS", "value": round(power_sq.rms, 2), "unit": "kW"})
+    if table is not None and len(table):
+        kpis.extend(phase_kpis(table, "Charge", soc_span.count >= 3))
+        kpis.extend(phase_kpis(table, "Discharge"))
+    elif mode == "Charging" and soc_span.count >= 3:
+        kpis.append({"name": "Charging Time", "value": round(float(soc_span.charging_time), 2), "unit": "s"})
+    kpis.extend(segment_kpis(segments))
+    data.extend(kpis)
+
+    facts = {
+        "log_duration": soc_ends["last"][0] - soc_ends["first"][0] if soc_ends else None,
+        "soc_first": soc_ends["first"][1] if soc_ends else None,
+        "soc_last": soc_ends["last"][1] if soc_ends else None,
+        "peak_power": power_sq.peak,
+        "current_rms": current_sq.rms,
+    }
+    return {"data": data, "summary": format_summary(data, facts, kpis), "mode": mode,
+            "segments": segments, "blocks": blocks}
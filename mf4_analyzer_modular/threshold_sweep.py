@@ -0,0 +1,276 @@
+# # mf4_analyzer_modular/threshold_sweep.py
+import os
+import csv
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from mf4_analyzer_modular.compute_metrics import (
+    CHARGE_ACTIVE_THRESHOLD_KW, DISCHARGE_ACTIVE_THRESHOLD_KW, DERIVATIVE_THRESHOLD, sanitize_series
+)
+from mf4_analyzer_modular.file_pipeline import load_signals, PIPELINE_DEFAULTS
+from mf4_analyzer_modular.input_sources import source_name
+from mf4_analyzer_modular.signal_extractor import evaluate_signals, detect_mode
+from mf4_analyzer_modular.segmentation import PHASES, build_segment_table, segment_bounds, segment_codes
+
+# === Threshold Sweep (what-if KPIs) ===
+# Evaluates the charge/discharge KPIs of compute_metrics.py over a grid of
+# thresholds instead of the hard-coded constants, without re-running the
+# pipeline per value:
+#   - signals come from load_signals() (signal cache), evaluated once per log
+#   - power thresholds: the samples are sorted once and the time/energy
+#     weights accumulated (prefix sums); every threshold is then one
+#     searchsorted into the sorted values, O((n + m) log n) for n samples
+#     and m thresholds instead of an n x m mask
+#   - SoC-derivative threshold: first/last active sample from running
+#     prefix/suffix maxima of dSoC, active count from the sorted dSoC
+#   - phases: the KPIs only sum over the Charge / Discharge segments of the
+#     log (segmentation.phase_kpis), so each log is segmented once at the
+#     default power thresholds and every sweep runs over the samples inside
+#     those segments; Charging Time is summed per Charge segment
+# Same semantics as the single-file KPIs (segment gates, left-rectangle time
+# weighting, Charging Time from the first to the last active sample), so the
+# column at the default threshold equals the report value.
+
+SWEEP_CHARGE_KW = np.linspace(-50.0, 0.0, 21)      # "Charging Power Avg" etc.: p < threshold
+SWEEP_DISCHARGE_KW = np.linspace(0.0, 50.0, 21)    # "DischargeActive ...": p > threshold
+SWEEP_DSOC = np.array([1e-5, 3e-5, 1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, 1e-1])  # dSoC per sample
+
+SWEEP_GRIDS = {"charge_kw": SWEEP_CHARGE_KW, "discharge_kw": SWEEP_DISCHARGE_KW, "dsoc": SWEEP_DSOC}
+SWEEP_DEFAULTS = {"charge_kw": CHARGE_ACTIVE_THRESHOLD_KW, "discharge_kw": DISCHARGE_ACTIVE_THRESHOLD_KW,
+                  "dsoc": DERIVATIVE_THRESHOLD}
+GRID_LABELS = {"charge_kw": "Charge threshold (kW)", "discharge_kw": "Discharge threshold (kW)",
+               "dsoc": "dSoC threshold (%/sample)"}
+
+# KPI -> (grid, unit); logs with Charge segments get the first three, logs
+# with Discharge segments the rest
+SWEEP_KPIS = {
+    "Charging Time": ("dsoc", "s"),
+    "Charging Active Time": ("charge_kw", "s"),
+    "Charging Power Avg": ("charge_kw", "kW"),
+    "DischargeActive Duration": ("discharge_kw", "s"),
+    "DischargeActive Power Avg": ("discharge_kw", "kW"),
+}
+
+
+# Grid spec: "start:stop:num" (inclusive linspace) or "v1,v2,..."
+# Returns: sorted unique thresholds
+def parse_grid(spec: str) -> np.ndarray:
+    if ":" in spec:
+        start, stop, num = spec.split(":")
+        return np.unique(np.linspace(float(start), float(stop), int(num)))
+    return np.unique([float(v) for v in spec.split(",")])
+
+
+# === Vectorized kernels ===
+# Sums of each row of `weights` over the samples with x < threshold
+# (below=True) or x > threshold, for every threshold.
+# Returns: array (len(weights), len(thresholds))
+def threshold_sums(x: np.ndarray, weights: np.ndarray, thresholds: np.ndarray, below: bool) -> np.ndarray:
+    order = np.argsort(x, kind="stable")
+    csum = np.zeros((weights.shape[0], x.size + 1))
+    np.cumsum(weights[:, order], axis=1, out=csum[:, 1:])
+    if below:
+        return csum[:, np.searchsorted(x[order], thresholds, side="left")]
+    return csum[:, -1:] - csum[:, np.searchsorted(x[order], thresholds, side="right")]
+
+
+# Active = p[:-1] beyond the threshold, weighted by the time to the next sample.
+# NaN samples are never active (like the scalar `p > thr`); sorted, they
+# would land above every threshold, so they and their dt are dropped first.
+# within (optional): mask over p[:-1], only these samples can be active
+# Returns: (active samples, active time, mean power over active time) per threshold
+def _power_sweep(t: np.ndarray, p: np.ndarray, thresholds: np.ndarray, below: bool, within=None):
+    dt = np.diff(t)
+    p = p[:-1]
+    keep = ~np.isnan(p) if within is None else ~np.isnan(p) & within
+    if not keep.all():
+        p, dt = p[keep], dt[keep]
+    n, time, energy = threshold_sums(p, np.vstack([np.ones_like(dt), dt, p * dt]), thresholds, below)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return n, time, energy / time
+
+
+# Charging Time as in compute_charging_time(), for every dSoC threshold
+def charging_time_sweep(ts: np.ndarray, soc: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    return _span_sweep(ts, np.gradient(soc), thresholds)
+
+
+# First-to-last span of the samples with dsoc > threshold (0 under two samples)
+def _span_sweep(ts: np.ndarray, dsoc: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    if not dsoc.size:
+        return np.zeros(thresholds.size)
+    n_active = dsoc.size - np.searchsorted(np.sort(dsoc), thresholds, side="right")
+    first = np.searchsorted(np.maximum.accumulate(dsoc), thresholds, side="right")
+    suffix_max = np.maximum.accumulate(dsoc[::-1])[::-1]  # non-increasing
+    last = np.searchsorted(-suffix_max, -thresholds, side="left") - 1
+    ok = n_active >= 2
+    out = np.zeros(thresholds.size)
+    out[ok] = ts[last[ok]] - ts[first[ok]]
+    return out
+
+
+# === One log ===
+# Returns: {kpi: values over its grid (nan = KPI not emitted)}
+def sweep_kpis(derived: dict, mode: str, grids: dict) -> dict:
+    def series(name):
+        sig = derived.get(name, {})
+        return sanitize_series(np.asarray(sig.get("timestamps", []), float),
+                               np.asarray(sig.get("samples", []), float))
+
+    ts, soc = series("StateOfCharge")
+    tp, p = series("Actual Power")
+    table = build_segment_table(tp, p, ts, soc)
+    out = {}
+    if not len(table):
+        # no power: SoC-only Charging Time of charging logs (metric_registry fallback)
+        if mode == "Charging" and ts.size >= 3:
+            out["Charging Time"] = charging_time_sweep(ts, soc, grids["dsoc"])
+        return out
+
+    # Segment of every sample: [start_k, start_k+1), the last one up to its end
+    starts, ends = segment_bounds(table)
+    codes = segment_codes(table)
+    sample_seg = np.searchsorted(starts, tp[:-1], side="right") - 1
+    for phase, kpis, grid, below in (
+            ("Charge", ("Charging Active Time", "Charging Power Avg"), "charge_kw", True),
+            ("Discharge", ("DischargeActive Duration", "DischargeActive Power Avg"), "discharge_kw", False)):
+        code = PHASES.index(phase)
+        if not np.any(codes == code):
+            continue
+        if phase == "Charge" and ts.size >= 3:
+            out["Charging Time"] = _charging_time_in(ts, soc, starts, ends, codes == code, grids["dsoc"])
+        n, time, avg = _power_sweep(tp, p, grids[grid], below, within=codes[sample_seg] == code)
+        out[kpis[0]] = np.where(n > 0, time, np.nan)
+        out[kpis[1]] = np.where(n > 0, avg, np.nan)
+    return out
+
+
+# Charging Time summed over the selected segments: whole-log dSoC, each
+# segment's span taken from its own samples (segmentation.phase_kpis)
+def _charging_time_in(ts, soc, starts, ends, selected, thresholds):
+    dsoc = np.gradient(soc)
+    lo = np.searchsorted(ts, starts, side="left")
+    hi = np.r_[lo[1:], np.searchsorted(ts, ends[-1], side="right")]
+    out = np.zeros(thresholds.size)
+    for k in np.flatnonzero(selected):
+        out += _span_sweep(ts[lo[k]:hi[k]], dsoc[lo[k]:hi[k]], thresholds)
+    return out
+
+
+# === Worker: extract once, sweep every grid ===
+def _sweep_one(path: str, grids: dict, options: dict) -> dict:
+    fname = source_name(path)
+    signal_data = load_signals(path, options)
+    _, _, derived = evaluate_signals(signal_data, options["timebase"],
+                                     rate_hz=options["rate_hz"], master=options["master"])
+    mode_raw = detect_mode(derived.get("StateOfCharge", {}).get("samples", np.array([])))
+    mode = {"Charge": "Charging", "Discharge": "Discharging"}.get(mode_raw, mode_raw)
+    return {"base_name": os.path.splitext(fname)[0], "mode": mode, "kpis": sweep_kpis(derived, mode, grids)}
+
+
+# === Fleet sweep ===
+# Returns: per-log entries (in `paths` order; failed logs are skipped)
+def sweep_logs(paths: list[str], grids: dict | None = None, workers: int | None = None,
+               options: dict | None = None) -> list[dict]:
+    grids = {**SWEEP_GRIDS, **(grids or {})}
+    options = {**PIPELINE_DEFAULTS, **(options or {})}
+    workers = workers or os.cpu_count() or 1
+    print(f"[i] Threshold sweep: {len(paths)} file(s) on {workers} worker(s)")
+
+    logs = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_sweep_one, p, grids, options) for p in paths]
+        for path, fut in zip(paths, futures):
+            try:
+                logs.append(fut.result())
+            except Exception as e:
+                print(f"[WARN] Skipping {source_name(path)}: {type(e).__name__}: {e}")
+    return logs
+
+
+# === Fleet distribution per KPI and threshold ===
+def fleet_table(logs: list[dict], grids: dict | None = None) -> list[dict]:
+    grids = {**SWEEP_GRIDS, **(grids or {})}
+    rows = []
+    for kpi, (grid, unit) in SWEEP_KPIS.items():
+        values = np.array([log["kpis"][kpi] for log in logs if kpi in log["kpis"]])
+        if not values.size:
+            continue
+        for j, threshold in enumerate(grids[grid]):
+            col = values[:, j][np.isfinite(values[:, j])]
+            rows.append({"kpi": kpi, "unit": unit, "threshold": round(float(threshold), 6), "logs": int(col.size),
+                         "mean": round(float(col.mean()), 2) if col.size else "",
+                         "median": round(float(np.median(col)), 2) if col.size else "",
+                         "min": round(float(col.min()), 2) if col.size else "",
+                         "max": round(float(col.max()), 2) if col.size else ""})
+    return rows
+
+
+def print_fleet_table(rows: list[dict]):
+    kpi = None
+    for r in rows:
+        if r["kpi"] != kpi:
+            kpi = r["kpi"]
+            print(f"\n{kpi} ({r['unit']})")
+            print(f"  {'threshold':>12} {'logs':>5} {'median':>10} {'mean':>10} {'min':>10} {'max':>10}")
+        print(f"  {r['threshold']:>12g} {r['logs']:>5} {r['median']:>10} {r['mean']:>10} {r['min']:>10} {r['max']:>10}")
+
+
+# === CSV exports ===
+# <name>_logs.csv: one row per log, KPI and threshold; <name>_fleet.csv: fleet_table()
+def export_sweep_csv(logs: list[dict], grids: dict | None = None, name: str = "sweep"):
+    grids = {**SWEEP_GRIDS, **(grids or {})}
+    os.makedirs("mf4_exports", exist_ok=True)
+    sweep_path = os.path.join("mf4_exports", f"{name}_logs.csv")
+    with open(sweep_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["file_key", "mode", "kpi", "unit", "threshold", "value"])
+        for log in logs:
+            for kpi, values in log["kpis"].items():
+                grid, unit = SWEEP_KPIS[kpi]
+                for threshold, value in zip(grids[grid], values):
+                    w.writerow([log["base_name"], log["mode"], kpi, unit, round(float(threshold), 6),
+                                round(float(value), 2) if np.isfinite(value) else ""])
+
+    fleet_path = os.path.join("mf4_exports", f"{name}_fleet.csv")
+    fields = ["kpi", "unit", "threshold", "logs", "median", "mean", "min", "max"]
+    with open(fleet_path, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=fields)
+        w.writeheader()
+        w.writerows(fleet_table(logs, grids))
+    return sweep_path, fleet_path
+
+
+# === Heatmaps (log x threshold, one PNG per KPI) ===
+# The dashed line marks the threshold currently used by compute_metrics.py.
+def render_heatmaps(logs: list[dict], grids: dict | None = None, name: str = "sweep") -> list[str]:
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    grids = {**SWEEP_GRIDS, **(grids or {})}
+    os.makedirs("mf4_exports", exist_ok=True)
+    paths = []
+    for kpi, (grid, unit) in SWEEP_KPIS.items():
+        rows = [log for log in logs if kpi in log["kpis"]]
+        if not rows:
+            continue
+        values = np.ma.masked_invalid(np.array([log["kpis"][kpi] for log in rows]))
+        x = np.arange(grids[grid].size)
+
+        fig = Figure(figsize=(10, 2 + 0.25 * min(len(rows), 60)))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        im = ax.imshow(values, aspect="auto", interpolation="nearest", cmap="viridis")
+        fig.colorbar(im, ax=ax, label=f"{kpi} ({unit})")
+        step = max(1, x.size // 12)
+        ax.set_xticks(x[::step], [f"{v:g}" for v in grids[grid][::step]], rotation=45)
+        if len(rows) <= 60:
+            ax.set_yticks(np.arange(len(rows)), [log["base_name"] for log in rows], fontsize=7)
+        if grids[grid][0] <= SWEEP_DEFAULTS[grid] <= grids[grid][-1]:
+            ax.axvline(np.interp(SWEEP_DEFAULTS[grid], grids[grid], x), color="white", linestyle="--", linewidth=1)
+        ax.set_xlabel(GRID_LABELS[grid])
+        ax.set_title(kpi)
+
+        path = os.path.join("mf4_exports", f"{name}_{kpi.lower().replace(' ', '_')}_heatmap.png")
+        fig.savefig(path, bbox_inches="tight")
+        paths.append(path)
+    return paths
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from mf4_analyzer_modular.benchmark import generate_synthetic_mf4
+from mf4_analyzer_modular.signal_config import SIGNAL_CONFIG
+
+
+# Synthetic logs (benchmark generator), written once per test session
+@pytest.fixture(scope="session")
+def synthetic_log(tmp_path_factory):
+    logs = {}
+
+    def make(size_mb: float = 2, layout: str = "split", charging: bool = True) -> str:
+        key = (size_mb, layout, charging)
+        if key not in logs:
+            name = f"{layout}_{'charge' if charging else 'discharge'}_{size_mb}mb.mf4"
+            logs[key] = generate_synthetic_mf4(str(tmp_path_factory.mktemp("logs") / name), size_mb,
+                                               layout=layout, charging=charging)
+        return logs[key]
+
+    return make
+
+
+# Drive (600 s) -> park (300 s) -> charge (1100 s) at 10 Hz, with a 2 s
+# current blip while driving; cell channels in a second group at 5 Hz
+@pytest.fixture(scope="session")
+def mixed_log(tmp_path_factory):
+    from asammdf import MDF, Signal
+
+    rng = np.random.default_rng(1)
+    n = 20000
+    t = np.arange(n) * 0.1
+    current = np.where(t < 600, 100.0, np.where(t < 900, 0.0, -150.0)) + rng.normal(0, 5, n)
+    current[(t > 300) & (t < 302)] = 0.0
+    soc = 50 - np.cumsum(current) * 0.1 / 3600 * 0.5
+    fast = {"PackCurrent": current, "PackVoltage": 400 + rng.normal(0, 1, n), "StateOfCharge": soc,
+            "CellSocMin": soc - 1, "CellSocMax": soc + 1, "ChargeCurrentLimit": np.full(n, 200.0),
+            "ChargePowerLimit": np.full(n, 100.0), "DischargePowerLimit": np.full(n, 150.0),
+            "SystemFaultIndicator": (t > 1500) & (t < 1510)}
+    m = n // 2
+    t_slow = np.arange(m) * 0.2 + 0.05
+    slow = {"CellTempMax": 30, "CellTempMin": 25, "CoolantInletTemp": 20, "CellVoltageMax": 3.9, "CellVoltageMin": 3.85}
+
+    mdf = MDF(version="4.10")
+    mdf.append([Signal(np.asarray(v, float), t, name=SIGNAL_CONFIG[k]) for k, v in fast.items()])
+    mdf.append([Signal(v + rng.normal(0, 0.1, m), t_slow, name=SIGNAL_CONFIG[k]) for k, v in slow.items()])
+    path = str(tmp_path_factory.mktemp("logs") / "mixed.mf4")
+    mdf.save(path, overwrite=True)
+    mdf.close()
+    return path
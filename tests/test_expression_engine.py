@@ -0,0 +1,96 @@
+import numpy as np
+from mf4_analyzer_modular.expression_engine import ExpressionGraph
+
+
+def _signal(samples, unit=""):
+    samples = np.asarray(samples, float)
+    return {"samples": samples, "timestamps": np.arange(len(samples), dtype=float), "unit": unit}
+
+
+def test_shared_constant_is_inlined():
+    entries = [{"signal": "A * 2", "name": "A2"}, {"signal": "C * 2", "name": "C2"},
+               {"signal": "A + (2 * 3)", "name": "A6"}, {"signal": "C - (2 * 3)", "name": "C6"}]
+    graph = ExpressionGraph(entries, ["A", "C"])
+    out, errors = graph.evaluate({"A": _signal([1, 2, 3]), "C": _signal([4, 5, 6])})
+
+    assert errors == {}
+    np.testing.assert_allclose(out["A2"].samples, [2, 4, 6])
+    np.testing.assert_allclose(out["C2"].samples, [8, 10, 12])
+    np.testing.assert_allclose(out["A6"].samples, [7, 8, 9])
+    np.testing.assert_allclose(out["C6"].samples, [-2, -1, 0])
+
+
+def test_negative_constants():
+    entries = [{"signal": "A * -2", "name": "A1"}, {"signal": "A - -2", "name": "A2"},
+               {"signal": "-A + 1", "name": "A3"}, {"signal": "-(A - 1) * -0.5", "name": "A4"},
+               {"signal": "A * -1.5e-1", "name": "A5"}]
+    graph = ExpressionGraph(entries, ["A"])
+    out, errors = graph.evaluate({"A": _signal([1, 2, 3])})
+
+    assert errors == {}
+    np.testing.assert_allclose(out["A1"].samples, [-2, -4, -6])
+    np.testing.assert_allclose(out["A2"].samples, [3, 4, 5])
+    np.testing.assert_allclose(out["A3"].samples, [0, -1, -2])
+    np.testing.assert_allclose(out["A4"].samples, [0, 0.5, 1])
+    np.testing.assert_allclose(out["A5"].samples, [-0.15, -0.3, -0.45])
+
+
+def test_hyphenated_and_spaced_names():
+    entries = [{"signal": "Cell-Temp - Coolant", "name": "Cell-Coolant DeltaT"},
+               {"signal": "Cell-Coolant DeltaT * 2", "name": "Double"},
+               {"signal": "[Cell-Coolant DeltaT]-1", "name": "Bracketed"}]
+    graph = ExpressionGraph(entries, ["Cell-Temp", "Coolant"])
+    out, errors = graph.evaluate({"Cell-Temp": _signal([30, 31]), "Coolant": _signal([20, 25])})
+
+    assert errors == {}
+    np.testing.assert_allclose(out["Cell-Coolant DeltaT"].samples, [10, 6])
+    np.testing.assert_allclose(out["Double"].samples, [20, 12])
+    np.testing.assert_allclose(out["Bracketed"].samples, [9, 5])
+    assert graph.leaves(["Double"]) == ["Cell-Temp", "Coolant"]
+
+
+def test_dependencies_in_any_order():
+    entries = [{"signal": "Power * 2", "name": "Double"},     # before its dependency
+               {"signal": "Current * Voltage / 1000", "name": "Power"},
+               {"signal": "Double - Power", "name": "Again"}]
+    graph = ExpressionGraph(entries, ["Current", "Voltage"])
+    out, errors = graph.evaluate({"Current": _signal([10, 20]), "Voltage": _signal([400, 500])})
+
+    assert errors == {}
+    np.testing.assert_allclose(out["Power"].samples, [4, 10])
+    np.testing.assert_allclose(out["Double"].samples, [8, 20])
+    np.testing.assert_allclose(out["Again"].samples, [4, 10])
+
+
+def test_circular_reference_is_an_error():
+    entries = [{"signal": "B + 1", "name": "A1"}, {"signal": "A1 * 2", "name": "B"}]
+    graph = ExpressionGraph(entries, ["C"])
+    _, errors = graph.evaluate({"C": _signal([1])})
+
+    assert "Circular reference" in errors["A1"]
+    assert "Circular reference" in errors["B"]
+
+
+def test_operator_precedence():
+    entries = [{"signal": "A + B * C", "name": "E1"}, {"signal": "A - B - C", "name": "E2"},
+               {"signal": "A / B / C", "name": "E3"}, {"signal": "A - B * C / 2 + 1", "name": "E4"},
+               {"signal": "(A + B) * C", "name": "E5"}, {"signal": "A * B - C * 2", "name": "E6"}]
+    graph = ExpressionGraph(entries, ["A", "B", "C"])
+    a, b, c = np.array([8.0, 12.0]), np.array([2.0, 3.0]), np.array([4.0, 2.0])
+    out, errors = graph.evaluate({"A": _signal(a), "B": _signal(b), "C": _signal(c)})
+
+    assert errors == {}
+    np.testing.assert_allclose(out["E1"].samples, a + b * c)
+    np.testing.assert_allclose(out["E2"].samples, (a - b) - c)
+    np.testing.assert_allclose(out["E3"].samples, (a / b) / c)
+    np.testing.assert_allclose(out["E4"].samples, a - b * c / 2 + 1)
+    np.testing.assert_allclose(out["E5"].samples, (a + b) * c)
+    np.testing.assert_allclose(out["E6"].samples, a * b - c * 2)
+
+
+def test_division_floor():
+    graph = ExpressionGraph([{"signal": "A / B", "name": "Q"}], ["A", "B"])
+    out, errors = graph.evaluate({"A": _signal([1, 1, 1, 1]), "B": _signal([2, 0, -1, 1e-9])})
+
+    assert errors == {}
+    np.testing.assert_allclose(out["Q"].samples, [0.5, 1e6, 1e6, 1e6])  # clipped to DIVISION_FLOOR
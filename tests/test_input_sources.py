@@ -0,0 +1,54 @@
+import os
+import gzip
+import zipfile
+from mf4_analyzer_modular import input_sources
+from mf4_analyzer_modular.input_sources import open_source, source_name, source_key, list_sources
+
+
+def _gz(path, data: bytes):
+    with gzip.open(path, "wb") as f:
+        f.write(data)
+    return str(path)
+
+
+def test_source_name_strips_member_and_compression(tmp_path):
+    assert source_name(str(tmp_path / "run1.mf4.gz")) == "run1.mf4"
+    assert source_name(str(tmp_path / "bundle.zip") + "#logs/run1.mf4") == "run1.mf4"
+    assert source_name("s3://bucket/fleet/run1.mf4.zst") == "run1.mf4"
+    assert source_key("s3://bucket/fleet/run1.mf4") == "s3://bucket/fleet/run1.mf4"
+    assert source_key("run1.mf4") == os.path.abspath("run1.mf4")
+
+
+def test_list_sources_expands_zip_members(tmp_path):
+    (tmp_path / "a.mf4").write_bytes(b"x")
+    (tmp_path / "notes.txt").write_bytes(b"x")
+    _gz(tmp_path / "b.mf4.gz", b"x")
+    with zipfile.ZipFile(tmp_path / "bundle.zip", "w") as zf:
+        zf.writestr("c.mf4", b"x")
+        zf.writestr("readme.md", b"x")
+
+    names = sorted(source_name(s) for s in list_sources(str(tmp_path)))
+    assert names == ["a.mf4", "b.mf4", "c.mf4"]
+
+
+def test_spill_survives_eviction_by_another_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(input_sources, "SPILL_DIR", str(tmp_path / "spill"))
+    src = _gz(tmp_path / "run1.mf4.gz", b"MDF 4.10" * 1000)
+
+    with open_source(src) as f:  # miss: decompressed into the spill cache
+        assert f.read(8) == b"MDF 4.10"
+    with open_source(src) as f:  # hit, then evicted before the caller reads it
+        for e in os.scandir(tmp_path / "spill"):
+            os.remove(e.path)
+        assert f.read() == b"MDF 4.10" * 1000
+    with open_source(src) as f:  # evicted: spilled again
+        assert f.read(8) == b"MDF 4.10"
+
+
+def test_evict_spill_keeps_file_in_use(tmp_path):
+    for i, name in enumerate(["old.mf4", "mid.mf4", "new.mf4"]):
+        p = tmp_path / name
+        p.write_bytes(b"x" * 100)
+        os.utime(p, (i, i))
+    input_sources.evict_spill(str(tmp_path), max_bytes=250, keep=str(tmp_path / "old.mf4"))
+    assert sorted(os.listdir(tmp_path)) == ["new.mf4", "old.mf4"]
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+from mf4_analyzer_modular.file_pipeline import analyze_file
+from mf4_analyzer_modular.metric_registry import MetricContext
+from mf4_analyzer_modular.segmentation import (
+    SegmentBuilder, SegmentSoc, build_segment_table, build_segments, segment_rows
+)
+
+
+def _log(phases, rate_hz=10.0, seed=0):
+    # phases: [(duration_s, power_kw, soc_rate_per_s)]; SoC integrates soc_rate
+    rng = np.random.default_rng(seed)
+    t, p, dsoc = [], [], []
+    t0 = 0.0
+    for duration, power, rate in phases:
+        n = int(duration * rate_hz)
+        t.append(t0 + np.arange(n) / rate_hz)
+        p.append(power + rng.normal(0, 0.5, n))
+        dsoc.append(np.full(n, rate / rate_hz))
+        t0 += n / rate_hz
+    t, p = np.concatenate(t), np.concatenate(p)
+    soc = 50 + np.cumsum(np.concatenate(dsoc))
+    return t, p, soc
+
+
+def _kpis(t, p, soc, mode):
+    derived = {"Actual Power": {"timestamps": t, "samples": p},
+               "StateOfCharge": {"timestamps": t, "samples": soc}}
+    return {k["name"]: k["value"] for k in MetricContext([], derived, mode).kpis()}
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 1000])
+def test_chunked_matches_whole_log(chunk):
+    t, p, soc = _log([(300, 40, -0.01), (120, 0, 0), (5, -30, 0), (400, -60, 0.02), (200, 20, -0.005)])
+    builder = SegmentBuilder()
+    for i in range(0, t.size, chunk):
+        builder.update(t[i:i + chunk], p[i:i + chunk])
+    confirm = SegmentSoc(builder.finish())
+    for i in range(0, t.size, chunk):
+        confirm.update(t[i:i + chunk], soc[i:i + chunk])
+
+    assert segment_rows(confirm.finish()) == build_segments(t, p, t, soc)
+
+
+def test_charge_kpis_only_cover_charge_segments():
+    # charge -> drive -> charge: the whole-log SoC span would include the drive
+    t, p, soc = _log([(500, -60, 0.02), (500, 40, -0.01), (500, -60, 0.02)])
+    segments = build_segments(t, p, t, soc)
+    kpis = _kpis(t, p, soc, "Charging")
+
+    assert [s["phase"] for s in segments] == ["Charge", "Discharge", "Charge"]
+    assert kpis["Charging Time"] == pytest.approx(1000, abs=1)
+    assert kpis["Charging Time"] == pytest.approx(sum(s["charging_time_s"] for s in segments))
+    assert kpis["Charging Power Avg"] == pytest.approx(-60, abs=0.1)
+    assert kpis["DischargeActive Duration"] == pytest.approx(500, abs=1)  # no mode gate
+    assert kpis["DischargeActive Power Avg"] == pytest.approx(40, abs=0.1)
+
+
+def test_mixed_log_phases(mixed_log):
+    result = analyze_file(mixed_log, {"use_cache": False})
+    kpis = {k["name"]: k["value"] for k in result["kpis"]}
+
+    assert [s["phase"] for s in result["segments"]] == ["Discharge", "Idle", "Charge"]
+    assert kpis["Charging Time"] == pytest.approx(1100, abs=1)
+    assert kpis["Charging Power Avg"] == pytest.approx(-60, abs=0.5)
+    assert kpis["DischargeActive Duration"] == pytest.approx(598, abs=1)  # minus the 2 s blip
+    assert kpis["Charge Phase Time"] + kpis["Discharge Phase Time"] + kpis["Idle Phase Time"] \
+        == pytest.approx(result["segments"][-1]["end_s"], abs=0.1)
+
+
+def test_soc_trend_overrules_power_phase():
+    # "charging" power while SoC keeps falling (e.g. a sign flip) is not a charge
+    t, p, soc = _log([(300, 40, -0.01), (300, -30, -0.01), (300, 0, 0)])
+    assert [s["phase"] for s in build_segments(t, p)] == ["Discharge", "Charge", "Idle"]
+
+    segments = build_segments(t, p, t, soc)
+    assert [s["phase"] for s in segments] == ["Discharge", "Idle"]
+    assert segments[0]["duration_s"] == pytest.approx(600, abs=0.2)
+    assert segments[0]["soc_delta"] == pytest.approx(-6, abs=0.01)
+    assert "Charging Time" not in _kpis(t, p, soc, "Discharging")
+
+
+def test_soc_within_tolerance_keeps_phase():
+    t, p, soc = _log([(300, -30, 0.02), (300, 40, 0.0001)])
+    assert [s["phase"] for s in build_segments(t, p, t, soc)] == ["Charge", "Discharge"]
+
+
+def test_many_segments():
+    # 60 s phases at 10 Hz over 40 h: 2400 segments
+    phases = [(60, (-60, 0, 40)[k % 3], (0.02, 0, -0.01)[k % 3]) for k in range(2400)]
+    t, p, soc = _log(phases)
+    table = build_segment_table(t, p, t, soc)
+    segments = segment_rows(table)
+
+    assert len(segments) == 2400
+    assert [s["phase"] for s in segments[:3]] == ["Charge", "Idle", "Discharge"]
+    assert sum(s["duration_s"] for s in segments) == pytest.approx(t[-1] - t[0], abs=1)
+    assert all(s["charging_time_s"] == pytest.approx(60, abs=0.5) for s in segments if s["phase"] == "Charge")
@@ -0,0 +1,84 @@
+import os
+import numpy as np
+import pytest
+from mf4_analyzer_modular import signal_cache
+from mf4_analyzer_modular.file_pipeline import load_signals
+from mf4_analyzer_modular.signal_cache import cache_key, evict_cache, load_cached_signals, store_cached_signals
+from mf4_analyzer_modular.signal_extractor import required_signals
+from mf4_analyzer_modular.signal_types import Signal
+
+
+def _signals():
+    t = np.arange(100) * 0.1
+    return {"PackCurrent": Signal(np.linspace(-5, 5, 100), t, "A"),
+            "PackVoltage": Signal(np.full(100, 400.0), t, "V"),
+            "StateOfCharge": Signal(np.linspace(50, 60, 10), np.arange(10.0), "%")}
+
+
+def test_store_and_load_round_trip(tmp_path):
+    signals = _signals()
+    store_cached_signals("k", signals, str(tmp_path))
+    loaded = load_cached_signals("k", str(tmp_path))
+
+    assert loaded.keys() == signals.keys()
+    for token, sig in signals.items():
+        np.testing.assert_array_equal(loaded[token].samples, sig.samples)
+        np.testing.assert_array_equal(loaded[token].timestamps, sig.timestamps)
+        assert loaded[token].unit == sig.unit
+        assert isinstance(loaded[token].raw, np.memmap)
+    assert loaded["PackCurrent"].timestamps is loaded["PackVoltage"].timestamps
+    assert len([f for f in os.listdir(tmp_path / "k") if f.endswith(".npy")]) == 5  # shared timestamps once
+
+
+def test_miss_and_unreadable_entry(tmp_path):
+    assert load_cached_signals("missing", str(tmp_path)) is None
+
+    store_cached_signals("k", _signals(), str(tmp_path))
+    (tmp_path / "k" / "0.npy").write_bytes(b"garbage")
+    assert load_cached_signals("k", str(tmp_path)) is None
+    assert not (tmp_path / "k").exists()  # dropped, re-decoded next time
+
+
+def test_key_covers_identity_mapping_and_dtype(tmp_path):
+    path = tmp_path / "log.mf4"
+    path.write_bytes(b"a" * 100)
+    tokens = ["PackCurrent", "PackVoltage"]
+    key = cache_key(str(path), tokens)
+
+    assert cache_key(str(path), tokens) == key
+    assert cache_key(str(path), tokens[:1]) != key
+    assert cache_key(str(path), tokens, dtype=np.float32) != key
+    path.write_bytes(b"b" * 100)
+    os.utime(path, ns=(0, 0))
+    assert cache_key(str(path), tokens) != key
+
+
+def test_lru_eviction(tmp_path):
+    for i, key in enumerate(["old", "mid", "new"]):
+        store_cached_signals(key, _signals(), str(tmp_path))
+        os.utime(tmp_path / key / "meta.json", (1000 + i, 1000 + i))
+    load_cached_signals("old", str(tmp_path))  # a hit makes it the most recently used
+    (tmp_path / ".tmp-partial").mkdir()  # a store in progress is never evicted
+
+    size = signal_cache._dir_size(str(tmp_path / "new"))
+    evict_cache(str(tmp_path), max_bytes=2 * size)
+    assert sorted(os.listdir(tmp_path)) == [".tmp-partial", "new", "old"]
+
+
+@pytest.mark.parametrize("float32", [False, True])
+def test_load_signals_hit_matches_decode(synthetic_log, tmp_path, monkeypatch, float32):
+    monkeypatch.chdir(tmp_path)  # CACHE_DIR is ./mf4_cache
+    path = synthetic_log(1, "split")
+    options = {"float32": float32}
+
+    decoded = load_signals(path, {**options, "use_cache": False})
+    miss = load_signals(path, options)
+    hit = load_signals(path, options)
+
+    assert len(os.listdir(signal_cache.CACHE_DIR)) == 1
+    assert hit.keys() == decoded.keys() == miss.keys()
+    assert set(hit) <= set(required_signals())
+    for token, sig in decoded.items():
+        assert hit[token].raw.dtype == sig.raw.dtype
+        np.testing.assert_array_equal(hit[token].samples, sig.samples)
+        np.testing.assert_array_equal(hit[token].timestamps, sig.timestamps)
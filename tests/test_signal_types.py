@@ -0,0 +1,60 @@
+import tracemalloc
+import numpy as np
+import pytest
+from mf4_analyzer_modular.signal_types import Signal
+from mf4_analyzer_modular.signal_extractor import required_signals
+from mf4_analyzer_modular.file_pipeline import _decode
+
+
+def test_scaled_samples_are_not_kept():
+    raw = np.array([1.0, -2.0, 3.0])
+    sig = Signal(raw, np.arange(3.0), "kW", scale=-1)
+
+    assert sig.samples is not sig.samples  # computed per read, never stored
+    np.testing.assert_array_equal(sig.samples, [-1.0, 2.0, -3.0])
+    assert sig.raw is raw
+    assert sig.min_max() == (-3.0, 2.0)
+    assert sig["unit"] == "kW" and "samples" in sig
+
+
+def test_scaled_float32_stays_float32():
+    sig = Signal(np.ones(4, np.float32), np.arange(4.0), scale=-1)
+    assert sig.samples.dtype == np.float32
+
+
+@pytest.mark.parametrize("layout", ["split", "single", "per_channel"])
+def test_float32_decode_matches_float64(synthetic_log, layout):
+    path = synthetic_log(2, layout)
+    full = _decode(path, required_signals())
+    cast = _decode(path, required_signals(), np.float32)
+
+    assert cast.keys() == full.keys()
+    for token, sig in full.items():
+        assert cast[token].unit == sig.unit
+        np.testing.assert_array_equal(cast[token].timestamps, sig.timestamps)
+        expected = sig.samples.astype(np.float32) if sig.samples.dtype.kind == "f" else sig.samples
+        assert cast[token].samples.dtype == expected.dtype
+        np.testing.assert_array_equal(cast[token].samples, expected)
+    # one raster per channel group, as with the float64 decode
+    assert len({id(s.timestamps) for s in cast.values()}) == len({id(s.timestamps) for s in full.values()})
+
+
+def _traced(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        held, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, held, peak
+
+
+@pytest.mark.parametrize("layout", ["split", "single"])
+def test_float32_decode_never_holds_float64(synthetic_log, layout):
+    path = synthetic_log(32, layout)
+    tokens = required_signals()
+    full, held64, _ = _traced(lambda: _decode(path, tokens))
+    del full
+    _, _, peak32 = _traced(lambda: _decode(path, tokens, np.float32))
+
+    assert peak32 < held64  # cast per data block, not after a full float64 decode
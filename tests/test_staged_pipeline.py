@@ -0,0 +1,61 @@
+import json
+import os
+import pytest
+from mf4_analyzer_modular.batch_runner import process_and_report
+from mf4_analyzer_modular.staged_pipeline import run_staged
+
+OPTIONS = {"use_cache": False, "plots": False, "pdf": False, "kpi_store": False, "block_index": False}
+
+
+@pytest.fixture
+def logs(synthetic_log, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # exports go to ./mf4_exports
+    missing = str(tmp_path / "missing.mf4")
+    return [synthetic_log(8, "split"), missing, synthetic_log(1, "single", charging=False),
+            synthetic_log(2, "split", charging=False), missing, synthetic_log(1, "per_channel")]
+
+
+def _strip(row):
+    return {k: v for k, v in row.items() if k != "elapsed_s"}
+
+
+@pytest.mark.parametrize("export_workers", [1, 2])
+@pytest.mark.parametrize("depth", [1, 3])
+def test_staged_rows_in_input_order(logs, depth, export_workers):
+    rows = run_staged(logs, OPTIONS, depth, report=False, export_workers=export_workers)
+    expected = [process_and_report(path, OPTIONS) for path in logs]
+
+    assert [_strip(r) for r in rows] == [_strip(r) for r in expected]
+    assert [r["status"] for r in rows] == ["ok", "failed", "ok", "ok", "failed", "ok"]
+    for path in logs:
+        if os.path.exists(path):
+            assert os.path.exists(os.path.join("mf4_exports", f"{os.path.basename(path)[:-4]}.csv"))
+
+
+def _record_pid(result, options):
+    with open("export_pid.txt", "w", encoding="utf-8") as f:
+        f.write(str(os.getpid()))
+
+
+def test_staged_export_runs_in_another_process(logs, monkeypatch):
+    import mf4_analyzer_modular.staged_pipeline as staged
+
+    monkeypatch.setattr(staged, "export_results", _record_pid)  # inherited by the forked export process
+    rows = run_staged(logs[:1], OPTIONS, report=False)
+
+    assert rows[0]["status"] == "ok"
+    with open("export_pid.txt", encoding="utf-8") as f:
+        assert int(f.read()) != os.getpid()
+
+
+def test_staged_instrumentation_one_line_per_file(logs):
+    run_staged(logs[:3], {**OPTIONS, "instrument": True}, report=False)
+
+    with open(os.path.join("mf4_exports", "instrumentation.jsonl"), encoding="utf-8") as f:
+        reports = [json.loads(line) for line in f]
+    assert [r["file"] for r in reports if "error" not in r] == [os.path.basename(logs[0]), os.path.basename(logs[2])]
+    assert [r["file"] for r in reports if "error" in r] == ["missing.mf4"]
+    for r in reports:
+        if "error" not in r:
+            assert {"decode", "evaluate", "compute_metrics", "csv"} <= r["stages"].keys()
+            assert r["total_s"] >= r["stages"]["decode"]["wall_s"] + r["stages"]["csv"]["wall_s"]
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from mf4_analyzer_modular.file_pipeline import analyze_file, PIPELINE_DEFAULTS
+from mf4_analyzer_modular.threshold_sweep import (
+    SWEEP_DEFAULTS, SWEEP_KPIS, _power_sweep, _sweep_one, charging_time_sweep, parse_grid
+)
+
+OPTIONS = {**PIPELINE_DEFAULTS, "use_cache": False}
+
+
+def test_parse_grid():
+    np.testing.assert_allclose(parse_grid("0:10:6"), [0, 2, 4, 6, 8, 10])
+    np.testing.assert_allclose(parse_grid("5,-1,5,0.5"), [-1, 0.5, 5])
+
+
+@pytest.mark.parametrize("below", [True, False])
+def test_power_sweep_matches_masks(below):
+    rng = np.random.default_rng(3)
+    t = np.cumsum(rng.uniform(0.05, 0.2, 5000))
+    p = rng.normal(0, 30, t.size)
+    p[rng.integers(0, t.size, 50)] = np.nan
+    p[:100] = 5.0  # ties at a grid value
+    thresholds = np.array([-40, -5, 0, 5, 5.0001, 40])
+
+    n, time, avg = _power_sweep(t, p, thresholds, below)
+    dt = np.diff(t)
+    for j, thr in enumerate(thresholds):
+        mask = p[:-1] < thr if below else p[:-1] > thr  # NaN never active
+        assert n[j] == np.count_nonzero(mask)
+        assert time[j] == pytest.approx(np.sum(dt[mask]))
+        assert avg[j] == pytest.approx(np.sum(p[:-1][mask] * dt[mask]) / np.sum(dt[mask]))
+
+
+def test_charging_time_sweep_matches_scalar():
+    rng = np.random.default_rng(4)
+    ts = np.arange(3000) * 0.5
+    soc = 40 + np.cumsum(np.where((ts > 200) & (ts < 1200), 0.004, 0.0) + rng.normal(0, 0.001, ts.size))
+    thresholds = np.array([1e-4, 1e-3, 3e-3, 1e-2, 1.0])
+
+    swept = charging_time_sweep(ts, soc, thresholds)
+    dsoc = np.gradient(soc)
+    for j, thr in enumerate(thresholds):
+        active = np.flatnonzero(dsoc > thr)
+        expected = ts[active[-1]] - ts[active[0]] if active.size >= 2 else 0.0
+        assert swept[j] == pytest.approx(expected)
+
+
+def test_default_thresholds_match_report(mixed_log):
+    report = {k["name"]: k["value"] for k in analyze_file(mixed_log, {"use_cache": False})["kpis"]}
+    grids = {grid: np.array([value]) for grid, value in SWEEP_DEFAULTS.items()}
+    swept = _sweep_one(mixed_log, grids, OPTIONS)["kpis"]
+
+    # mixed log: both phases, KPIs only over their segments
+    assert set(swept) == set(SWEEP_KPIS)
+    for kpi, values in swept.items():
+        if kpi in report:
+            assert round(float(values[0]), 2) == report[kpi], kpi
+    assert swept["Charging Active Time"][0] == pytest.approx(1100, abs=1)